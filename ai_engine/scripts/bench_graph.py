@@ -0,0 +1,130 @@
+"""
+Throughput/latency benchmark of the LangGraph agent itself (no HTTP, no DB).
+
+Runs offline with the fake providers:
+
+    EMBEDDING_PROVIDER=fake python ai_engine/scripts/build_index.py     # once
+    LLM_PROVIDER=fake EMBEDDING_PROVIDER=fake \\
+        python -m ai_engine.scripts.bench_graph --requests 200 --concurrency 32
+
+Questions are taken from eval/testset.jsonl; every request is a new thread.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from langchain_core.messages import HumanMessage
+
+from ai_engine.tax_engine.agent_graph import build_graph
+from ai_engine.tax_engine.config import settings
+from ai_engine.tax_engine.metrics import GRAPH_NODE_SECONDS
+
+
+def load_questions(path: Path) -> list[str]:
+    with path.open("r", encoding="utf-8") as f:
+        return [json.loads(line)["message"] for line in f if line.strip()]
+
+
+def pct(samples: list[float], p: float) -> float:
+    s = sorted(samples)
+    return s[min(len(s) - 1, int(len(s) * p))] if s else 0.0
+
+
+def _input(q: str):
+    return {"messages": [HumanMessage(content=q)]}, {"configurable": {"thread_id": f"bench-{uuid.uuid4().hex}"}}
+
+
+async def run_async(app, questions, n, concurrency, stream):
+    sem = asyncio.Semaphore(concurrency)
+    latencies, ttft = [], []
+
+    async def one(i):
+        state, cfg = _input(questions[i % len(questions)])
+        async with sem:
+            t0 = time.perf_counter()
+            if stream:
+                first = None
+                async for _ in app.astream(state, config=cfg, stream_mode="messages"):
+                    if first is None:
+                        first = time.perf_counter() - t0
+                ttft.append(first or 0.0)
+            else:
+                await app.ainvoke(state, config=cfg)
+            latencies.append(time.perf_counter() - t0)
+
+    await asyncio.gather(*(one(i) for i in range(n)))
+    return latencies, ttft
+
+
+def run_sync(app, questions, n, concurrency):
+    latencies = []
+
+    def one(i):
+        state, cfg = _input(questions[i % len(questions)])
+        t0 = time.perf_counter()
+        app.invoke(state, config=cfg)
+        latencies.append(time.perf_counter() - t0)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(n)))
+    return latencies, []
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=200)
+    ap.add_argument("--concurrency", type=int, default=32)
+    ap.add_argument("--mode", choices=["async", "sync"], default="async")
+    ap.add_argument("--stream", action="store_true", help="astream with stream_mode=messages (async only)")
+    ap.add_argument("--testset", default=str(PROJECT_ROOT / "eval" / "testset.jsonl"))
+    args = ap.parse_args()
+
+    print(f"providers: llm={settings.llm_provider} embeddings={settings.embedding_provider}")
+    if settings.llm_provider == "fake":
+        print(
+            f"fake llm: {settings.fake_llm_latency_ms:.0f}ms to first token, "
+            f"{settings.fake_llm_tokens_per_sec:.0f} tok/s, {settings.fake_llm_answer_tokens} answer tokens"
+        )
+
+    app = build_graph()
+    questions = load_questions(Path(args.testset))
+
+    # warm-up: open Chroma, load chunks, fill fixed-query memo
+    asyncio.run(app.ainvoke(*_input("What is the VAT rate?")))
+
+    t0 = time.perf_counter()
+    if args.mode == "async":
+        latencies, ttft = asyncio.run(run_async(app, questions, args.requests, args.concurrency, args.stream))
+    else:
+        latencies, ttft = run_sync(app, questions, args.requests, args.concurrency)
+    wall = time.perf_counter() - t0
+
+    print(f"\n{args.mode}{' stream' if args.stream else ''}: {args.requests} requests, concurrency {args.concurrency}")
+    print(f"  wall {wall:.2f}s  throughput {args.requests / wall:.1f} req/s")
+    print(f"  latency p50 {pct(latencies, 0.5) * 1000:.0f}ms  p95 {pct(latencies, 0.95) * 1000:.0f}ms  p99 {pct(latencies, 0.99) * 1000:.0f}ms")
+    if ttft:
+        print(f"  first token p50 {pct(ttft, 0.5) * 1000:.0f}ms  p95 {pct(ttft, 0.95) * 1000:.0f}ms")
+
+    print("  node time (mean):")
+    for line in GRAPH_NODE_SECONDS.render():
+        if line.startswith("tax_graph_node_seconds_sum"):
+            node = line.split('node="')[1].split('"')[0]
+            total = float(line.rsplit(" ", 1)[1])
+            count_line = next(l for l in GRAPH_NODE_SECONDS.render() if l.startswith(f'tax_graph_node_seconds_count{{node="{node}"}}'))
+            count = int(count_line.rsplit(" ", 1)[1])
+            print(f"    {node:<10} {total / max(count, 1) * 1000:7.1f}ms  x{count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Soak test for the graph checkpointer.
+
+Runs many chat sessions (several turns each) through a graph with the same
+state shape as the tax graph (messages + route + retrieved docs) and prints
+process RSS as it goes. No OpenAI calls are made.
+
+    python -m ai_engine.scripts.soak_checkpointer --sessions 10000 --turns 4
+    python -m ai_engine.scripts.soak_checkpointer --saver memory   # old behaviour
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import subprocess
+import sys
+import time
+import uuid
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from langchain_core.documents import Document
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.graph import END, START, MessagesState, StateGraph
+
+from ai_engine.tax_engine.checkpoint import BoundedMemorySaver, trim_messages_update
+from ai_engine.tax_engine.config import settings
+
+
+class SoakState(MessagesState):
+    route: str
+    retrieved: list
+
+
+def rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        pages = int(f.read().split()[1])
+    return pages * 4096 / (1024 * 1024)
+
+
+def build_soak_graph(checkpointer, window: int):
+    filler = "Section 14 of the Nigeria Tax Act provides that ... " * 20
+
+    def route(state: SoakState):
+        update = {"route": "qa"}
+        update.update(trim_messages_update(state["messages"], window))
+        return update
+
+    def retrieve(state: SoakState):
+        docs = [Document(page_content=filler, metadata={"source": "nta.pdf", "page": i}) for i in range(4)]
+        return {"retrieved": docs}
+
+    def answer(state: SoakState):
+        payload = {"answer": filler, "citations": [{"source": "nta.pdf", "quote": filler[:300]}] * 3}
+        return {"messages": [AIMessage(content=json.dumps(payload))]}
+
+    g = StateGraph(SoakState)
+    g.add_node("route", route)
+    g.add_node("retrieve", retrieve)
+    g.add_node("answer", answer)
+    g.add_edge(START, "route")
+    g.add_edge("route", "retrieve")
+    g.add_edge("retrieve", "answer")
+    g.add_edge("answer", END)
+    return g.compile(checkpointer=checkpointer)
+
+
+def run(saver_name: str, sessions: int, turns: int, max_threads: int, window: int) -> None:
+    if saver_name == "memory":
+        saver, window = MemorySaver(), 0
+    else:
+        saver = BoundedMemorySaver(
+            max_threads=max_threads,
+            ttl_seconds=settings.checkpoint_ttl,
+            keep_checkpoints=settings.checkpoint_keep,
+        )
+    app = build_soak_graph(saver, window)
+
+    start_rss = rss_mb()
+    t0 = time.perf_counter()
+    step = max(1, sessions // 10)
+    print(f"[{saver_name}] sessions={sessions} turns={turns} start RSS={start_rss:.1f} MB")
+
+    for i in range(1, sessions + 1):
+        cfg = {"configurable": {"thread_id": uuid.uuid4().hex}}
+        for t in range(turns):
+            app.invoke({"messages": [HumanMessage(content=f"Question {t} about VAT and PAYE?")]}, config=cfg)
+        if i % step == 0:
+            extra = f" {saver.stats()}" if isinstance(saver, BoundedMemorySaver) else ""
+            print(f"  {i:>6} sessions  RSS={rss_mb():7.1f} MB{extra}")
+
+    elapsed = time.perf_counter() - t0
+    print(f"[{saver_name}] done in {elapsed:.1f}s, RSS {start_rss:.1f} -> {rss_mb():.1f} MB\n")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--saver", choices=["bounded", "memory", "both"], default="both")
+    ap.add_argument("--sessions", type=int, default=10000)
+    ap.add_argument("--turns", type=int, default=4)
+    ap.add_argument("--max-threads", type=int, default=1000)
+    ap.add_argument("--window", type=int, default=settings.checkpoint_message_window)
+    args = ap.parse_args()
+
+    if args.saver != "both":
+        run(args.saver, args.sessions, args.turns, args.max_threads, args.window)
+        return
+
+    # separate processes so one saver's heap does not skew the other's RSS
+    for name in ("memory", "bounded"):
+        subprocess.run(
+            [sys.executable, "-m", "ai_engine.scripts.soak_checkpointer", "--saver", name,
+             "--sessions", str(args.sessions), "--turns", str(args.turns),
+             "--max-threads", str(args.max_threads), "--window", str(args.window)],
+            cwd=PROJECT_ROOT,
+            check=True,
+        )
+
+
+if __name__ == "__main__":
+    main()
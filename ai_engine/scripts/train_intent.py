@@ -0,0 +1,107 @@
+"""
+Train the local intent classifier used by route_node before the LLM router.
+
+Data: eval/testset.jsonl + ai_engine/data/intent_seed.jsonl + any route logs
+(ROUTE_LOG=... makes the backend append regex/LLM routing decisions there).
+
+    python -m ai_engine.scripts.train_intent
+    python -m ai_engine.scripts.train_intent --logs logs/routes.jsonl --threshold 0.8
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from ai_engine.tax_engine.config import settings
+from ai_engine.tax_engine.intent_classifier import IntentClassifier, load_examples
+
+
+def cross_validate(texts, labels, folds: int, threshold: float, seed: int = 7):
+    """k-fold accuracy overall and above the confidence threshold (what actually skips the LLM)"""
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(len(texts))
+    correct = confident = confident_correct = 0
+    for k in range(folds):
+        test_idx = set(order[k::folds].tolist())
+        train = [(texts[i], labels[i]) for i in range(len(texts)) if i not in test_idx]
+        model = IntentClassifier().fit([t for t, _ in train], [l for _, l in train])
+        for i in test_idx:
+            route, conf = model.predict(texts[i])
+            correct += route == labels[i]
+            if conf >= threshold:
+                confident += 1
+                confident_correct += route == labels[i]
+    n = len(texts)
+    return {
+        "accuracy": correct / n,
+        "coverage": confident / n,
+        "accuracy_above_threshold": confident_correct / max(1, confident),
+    }
+
+
+def latency_us(model: IntentClassifier, texts, repeat: int = 20):
+    samples = []
+    for _ in range(repeat):
+        for t in texts:
+            t0 = time.perf_counter()
+            model.predict(t)
+            samples.append((time.perf_counter() - t0) * 1e6)
+    samples.sort()
+    return samples[len(samples) // 2], samples[int(len(samples) * 0.99)]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--testset", default=str(PROJECT_ROOT / "eval" / "testset.jsonl"))
+    ap.add_argument("--seed-set", default=str(PROJECT_ROOT / "ai_engine" / "data" / "intent_seed.jsonl"))
+    ap.add_argument("--logs", nargs="*", default=[settings.route_log_path] if settings.route_log_path else [])
+    ap.add_argument("--out", default=str(settings.intent_model_path))
+    ap.add_argument("--threshold", type=float, default=settings.intent_threshold)
+    ap.add_argument("--folds", type=int, default=5)
+    args = ap.parse_args()
+
+    sources = [Path(args.testset), Path(args.seed_set)] + [Path(p) for p in args.logs]
+    examples = list(dict(load_examples(sources)).items())  # last label wins for repeated messages
+    texts = [t for t, _ in examples]
+    labels = [l for _, l in examples]
+
+    print("\n=============================")
+    print(" Intent classifier training")
+    print("=============================\n")
+    for p in sources:
+        print(f"  source: {p} {'(missing)' if not p.exists() else ''}")
+    print(f"  examples: {len(texts)}  {dict(Counter(labels))}\n")
+
+    if len(set(labels)) < 2:
+        print("❌ Not enough labelled data.")
+        return
+
+    cv = cross_validate(texts, labels, args.folds, args.threshold)
+    print(f"[{args.folds}-fold CV] accuracy={cv['accuracy']:.3f}")
+    print(
+        f"[{args.folds}-fold CV] threshold={args.threshold}: coverage={cv['coverage']:.3f} "
+        f"accuracy_above_threshold={cv['accuracy_above_threshold']:.3f}\n"
+    )
+
+    t0 = time.perf_counter()
+    model = IntentClassifier().fit(texts, labels)
+    print(f"Trained on all examples in {time.perf_counter() - t0:.2f}s")
+
+    p50, p99 = latency_us(model, texts)
+    print(f"Predict latency: p50={p50:.0f}µs p99={p99:.0f}µs")
+
+    model.save(args.out)
+    print(f"\n✅ Saved: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
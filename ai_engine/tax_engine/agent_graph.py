@@ -1,14 +1,20 @@
 from __future__ import annotations
 
+import asyncio
+import functools
 import json
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Literal, Any, Dict
 
 from langgraph.graph import START, END, StateGraph, MessagesState
-from langgraph.checkpoint.memory import MemorySaver
+from langgraph.config import get_stream_writer
 
-from langchain_openai import ChatOpenAI
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models.chat_models import BaseChatModel
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
+from langchain_core.runnables import RunnableLambda
 
 from .config import settings
 from .prompts import (
@@ -19,21 +25,81 @@ from .prompts import (
     CLAIM_CHECK_PROMPT,
     COMPARE_PROMPT,
 )
-from .retriever import retrieve
+from .retriever import (
+    retrieve, aretrieve, retrieve_batch, aretrieve_batch, retrieve_fixed, aretrieve_fixed, preload_chunks,
+)
+from .vectorstore import load_chroma
 from .cite import build_citations
+from .providers import chat_model, chat_model_name
+from .metrics import REGISTRY, GRAPH_NODE_ERRORS, GRAPH_NODE_SECONDS, LLM_ERRORS, LLM_SECONDS, LLM_TOKENS
+from .intent_classifier import classify_route, log_route
+from .answer_cache import FOLLOWUP_RE
+from .checkpoint import BoundedMemorySaver, SQLiteCheckpointSaver, trim_messages_update
 
 
 class TaxState(MessagesState, total=False):
     route: str
     need_retrieval: bool
     retrieved: list
+    retrieved_for: str  # query text `retrieved` was fetched for (speculative or batch retrieval)
+
+
+class LLMMetricsCallback(BaseCallbackHandler):
+    """Latency, token usage and errors of every call made through one of the LLMs below"""
+
+    run_inline = True  # cheap bookkeeping; no need to hop to a thread in async runs
+
+    def __init__(self, llm_name: str, model: str):
+        self.llm_name = llm_name
+        self.model = model
+        self._starts: Dict[Any, float] = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._starts[run_id] = time.perf_counter()
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._starts[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        start = self._starts.pop(run_id, None)
+        if start is not None:
+            LLM_SECONDS.observe(time.perf_counter() - start, llm=self.llm_name, model=self.model)
+
+        prompt_tokens, completion_tokens = _token_usage(response)
+        if prompt_tokens:
+            LLM_TOKENS.inc(prompt_tokens, llm=self.llm_name, model=self.model, kind="prompt")
+        if completion_tokens:
+            LLM_TOKENS.inc(completion_tokens, llm=self.llm_name, model=self.model, kind="completion")
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._starts.pop(run_id, None)
+        LLM_ERRORS.inc(llm=self.llm_name, model=self.model)
+
+
+def _token_usage(response) -> tuple[int, int]:
+    """(prompt, completion) tokens from an LLMResult; streamed calls report on the message"""
+    for gens in response.generations or []:
+        for gen in gens:
+            usage = getattr(getattr(gen, "message", None), "usage_metadata", None)
+            if usage:
+                return int(usage.get("input_tokens", 0)), int(usage.get("output_tokens", 0))
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    return int(usage.get("prompt_tokens", 0) or 0), int(usage.get("completion_tokens", 0) or 0)
+
+
+def _chat_llm(name: str, temperature: float) -> BaseChatModel:
+    return chat_model(name, temperature, callbacks=[LLMMetricsCallback(name, chat_model_name())])
 
 
 # LLMs
-ROUTER_LLM = ChatOpenAI(model=settings.openai_chat_model, temperature=0)
-SMALLTALK_LLM = ChatOpenAI(model=settings.openai_chat_model, temperature=0.6)
-CLARIFY_LLM = ChatOpenAI(model=settings.openai_chat_model, temperature=0.4)
-WRITE_LLM = ChatOpenAI(model=settings.openai_chat_model, temperature=0)
+ROUTER_LLM = _chat_llm("router", 0)
+SMALLTALK_LLM = _chat_llm("smalltalk", 0.6)
+CLARIFY_LLM = _chat_llm("clarify", 0.4)
+WRITE_LLM = _chat_llm("write", 0)
+
+# Speculative retrieval runs here while the router LLM decides (separate from the
+# retriever's own search pool, which retrieve() fans out into)
+_SPECULATIVE_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix="speculate")
 
 # Patterns
 PERCENT_RE = re.compile(r"\b\d+(\.\d+)?\s*%|\b\d+(\.\d+)?\s*percent\b", re.IGNORECASE)
@@ -73,7 +139,7 @@ BILL_REF_RE = re.compile(
 )
 
 
-def _json_call(llm: ChatOpenAI, system: str, user: str) -> Dict[str, Any]:
+def _json_call(llm: BaseChatModel, system: str, user: str) -> Dict[str, Any]:
     resp = llm.invoke([SystemMessage(content=system), HumanMessage(content=user)])
     txt = resp.content
     try:
@@ -85,6 +151,31 @@ def _json_call(llm: ChatOpenAI, system: str, user: str) -> Dict[str, Any]:
         raise
 
 
+def _emit_citations(route: str, citations: list) -> None:
+    """
+    Push route + citations to `stream_mode="custom"` consumers before the answer
+    is written, so streaming clients can render sources while tokens arrive.
+    No-op when the graph is not being streamed.
+    """
+    try:
+        writer = get_stream_writer()
+    except Exception:
+        return
+    writer({"event": "citations", "route": route, "citations": citations})
+
+
+async def _ajson_call(llm: BaseChatModel, system: str, user: str) -> Dict[str, Any]:
+    resp = await llm.ainvoke([SystemMessage(content=system), HumanMessage(content=user)])
+    txt = resp.content
+    try:
+        return json.loads(txt)
+    except Exception:
+        s, e = txt.find("{"), txt.rfind("}")
+        if s != -1 and e != -1 and e > s:
+            return json.loads(txt[s : e + 1])
+        raise
+
+
 def _last_user_text(state: TaxState) -> str:
     """Get the last user message (for backward compatibility)"""
     msgs = state.get("messages", [])
@@ -200,6 +291,69 @@ def _deterministic_route(user_text: str) -> str | None:
     return None
 
 
+def _route_update(route: str, payload: Dict[str, Any] | None = None) -> TaxState:
+    need_default = route in ("qa", "claim_check", "compare")
+    # retrieved_for is reset every turn; only this turn's speculative retrieval may set it
+    if payload is None:
+        return {"route": route, "need_retrieval": need_default, "retrieved_for": ""}
+    return {"route": route, "need_retrieval": bool(payload.get("need_retrieval", need_default)), "retrieved_for": ""}
+
+
+def _with_window(state: TaxState, update: TaxState) -> TaxState:
+    """Cap the checkpointed conversation at CHECKPOINT_MESSAGE_WINDOW messages"""
+    update.update(trim_messages_update(state.get("messages", []), settings.checkpoint_message_window))
+    return update
+
+
+def _local_route(state: TaxState, current_user_text: str) -> str | None:
+    """
+    Routes that need no LLM call: the regex router first, then the trained
+    intent classifier when it is confident. Follow-ups that lean on earlier
+    turns ("what about it for PAYE?") are left to the context-aware LLM router.
+    """
+    d = _deterministic_route(current_user_text)
+    if d is not None:
+        log_route(current_user_text, d, "regex")
+        return d
+
+    if len(state.get("messages", [])) > 1 and FOLLOWUP_RE.search(current_user_text):
+        return None
+
+    predicted = classify_route(current_user_text)
+    if predicted is not None:
+        route, conf = predicted
+        print(f"🧭 Intent classifier: {route} ({conf:.2f})")
+        log_route(current_user_text, route, "classifier")
+        return route
+    return None
+
+
+def _prefetched(state: TaxState, query: str) -> TaxState:
+    """
+    Retrieval supplied with the input for this exact query (batch API). The
+    answer node clears `retrieved`, so a chat thread never matches here.
+    """
+    if state.get("retrieved") and state.get("retrieved_for") == query:
+        return {"retrieved_for": query}
+    return {}
+
+
+def _route_retrieves(route: str) -> bool:
+    return route not in ("smalltalk", "clarify")
+
+
+def _speculative_update(route: str, query: str, future) -> TaxState:
+    """Keep the speculative retrieval if the route needs it, drop it otherwise"""
+    if not _route_retrieves(route):
+        future.cancel()
+        return {}
+    try:
+        return {"retrieved": future.result(), "retrieved_for": query}
+    except Exception as e:
+        print(f"⚠️ Speculative retrieval failed, retrieving normally: {e}")
+        return {}
+
+
 def route_node(state: TaxState) -> TaxState:
     """Route node with conversation context awareness"""
     # Use context for routing decisions
@@ -208,19 +362,79 @@ def route_node(state: TaxState) -> TaxState:
     current_user_text = _last_user_text(state)
     
    
-    d = _deterministic_route(current_user_text)
+    prefetched = _prefetched(state, user_text_with_context)
+
+    d = _local_route(state, current_user_text)
     if d is not None:
-        route = d
-        need = route in ("qa", "claim_check", "compare")
-        return {"route": route, "need_retrieval": need}
+        return _with_window(state, {**_route_update(d), **prefetched})
+
+    # Most ambiguous messages end up retrieving, so start that while the router decides
+    speculative = None
+    if settings.speculative_retrieval and not prefetched:
+        speculative = _SPECULATIVE_POOL.submit(retrieve, user_text_with_context)
 
     # fallback to LLM router - but now with context
     router_prompt = ROUTER.replace("{user_message}", user_text_with_context)
-    payload = _json_call(ROUTER_LLM, router_prompt, user_text_with_context)
+    try:
+        payload = _json_call(ROUTER_LLM, router_prompt, user_text_with_context)
+    except Exception:
+        if speculative is not None:
+            speculative.cancel()
+        raise
+    log_route(current_user_text, payload.get("route", "qa"), "llm")
+
+    update = {**_route_update(payload.get("route", "qa"), payload), **prefetched}
+    if speculative is not None:
+        update.update(_speculative_update(update["route"], user_text_with_context, speculative))
+    return _with_window(state, update)
 
-    route = payload.get("route", "qa")
-    need = bool(payload.get("need_retrieval", route in ("qa", "claim_check", "compare")))
-    return {"route": route, "need_retrieval": need}
+
+async def aroute_node(state: TaxState) -> TaxState:
+    """Async route node (same logic as route_node, non-blocking LLM call)"""
+    user_text_with_context = _get_user_message_with_context(state, include_context=True)
+    current_user_text = _last_user_text(state)
+
+    prefetched = _prefetched(state, user_text_with_context)
+
+    d = _local_route(state, current_user_text)
+    if d is not None:
+        return _with_window(state, {**_route_update(d), **prefetched})
+
+    speculative = None
+    if settings.speculative_retrieval and not prefetched:
+        speculative = asyncio.create_task(aretrieve(user_text_with_context))
+
+    router_prompt = ROUTER.replace("{user_message}", user_text_with_context)
+    try:
+        payload = await _ajson_call(ROUTER_LLM, router_prompt, user_text_with_context)
+    except BaseException:
+        if speculative is not None:
+            speculative.cancel()
+        raise
+    log_route(current_user_text, payload.get("route", "qa"), "llm")
+
+    update = {**_route_update(payload.get("route", "qa"), payload), **prefetched}
+    if speculative is not None:
+        if _route_retrieves(update["route"]):
+            try:
+                update.update({"retrieved": await speculative, "retrieved_for": user_text_with_context})
+            except Exception as e:
+                print(f"⚠️ Speculative retrieval failed, retrieving normally: {e}")
+        else:
+            speculative.cancel()
+    return _with_window(state, update)
+
+
+def _chat_messages(prompt: str, user_text_with_context: str) -> list:
+    return [
+        SystemMessage(content="You are a helpful assistant."),
+        HumanMessage(content=prompt.format(user_message=user_text_with_context)),
+    ]
+
+
+def _plain_answer_update(ans: str, route: str) -> TaxState:
+    payload = {"answer": ans, "refusal": False, "route": route, "citations": []}
+    return {"messages": [AIMessage(content=json.dumps(payload, ensure_ascii=False))]}
 
 
 def smalltalk_node(state: TaxState) -> TaxState:
@@ -228,15 +442,16 @@ def smalltalk_node(state: TaxState) -> TaxState:
     user_text_with_context = _get_user_message_with_context(state, include_context=True)
     route = state.get("route", "smalltalk")
 
-    ans = SMALLTALK_LLM.invoke(
-        [
-            SystemMessage(content="You are a helpful assistant."),
-            HumanMessage(content=SMALLTALK_PROMPT.format(user_message=user_text_with_context)),
-        ]
-    ).content.strip()
+    ans = SMALLTALK_LLM.invoke(_chat_messages(SMALLTALK_PROMPT, user_text_with_context)).content.strip()
+    return _plain_answer_update(ans, route)
 
-    payload = {"answer": ans, "refusal": False, "route": route, "citations": []}
-    return {"messages": [AIMessage(content=json.dumps(payload, ensure_ascii=False))]}
+
+async def asmalltalk_node(state: TaxState) -> TaxState:
+    user_text_with_context = _get_user_message_with_context(state, include_context=True)
+    route = state.get("route", "smalltalk")
+
+    resp = await SMALLTALK_LLM.ainvoke(_chat_messages(SMALLTALK_PROMPT, user_text_with_context))
+    return _plain_answer_update(resp.content.strip(), route)
 
 
 def clarify_node(state: TaxState) -> TaxState:
@@ -244,206 +459,282 @@ def clarify_node(state: TaxState) -> TaxState:
     user_text_with_context = _get_user_message_with_context(state, include_context=True)
     route = state.get("route", "clarify")
 
-    ans = CLARIFY_LLM.invoke(
-        [
-            SystemMessage(content="You are a helpful assistant."),
-            HumanMessage(content=CLARIFY_PROMPT.format(user_message=user_text_with_context)),
-        ]
-    ).content.strip()
+    ans = CLARIFY_LLM.invoke(_chat_messages(CLARIFY_PROMPT, user_text_with_context)).content.strip()
+    return _plain_answer_update(ans, route)
 
-    payload = {"answer": ans, "refusal": False, "route": route, "citations": []}
-    return {"messages": [AIMessage(content=json.dumps(payload, ensure_ascii=False))]}
+
+async def aclarify_node(state: TaxState) -> TaxState:
+    user_text_with_context = _get_user_message_with_context(state, include_context=True)
+    route = state.get("route", "clarify")
+
+    resp = await CLARIFY_LLM.ainvoke(_chat_messages(CLARIFY_PROMPT, user_text_with_context))
+    return _plain_answer_update(resp.content.strip(), route)
 
 
 def retrieve_node(state: TaxState) -> TaxState:
     """Retrieve with conversation context for better search"""
     user_text_with_context = _get_user_message_with_context(state, include_context=True)
+    if state.get("retrieved_for") == user_text_with_context:
+        return {}  # already fetched speculatively by the route node
     docs = retrieve(user_text_with_context)
     return {"retrieved": docs}
 
 
-def answer_node(state: TaxState) -> TaxState:
-    """Answer with conversation context"""
+async def aretrieve_node(state: TaxState) -> TaxState:
     user_text_with_context = _get_user_message_with_context(state, include_context=True)
-    current_user_text = _last_user_text(state)  
-    retrieved = state.get("retrieved", []) or []
-    route = state.get("route", "qa")
-
-    citations = build_citations(current_user_text, retrieved, max_cites=3)
+    if state.get("retrieved_for") == user_text_with_context:
+        return {}
+    docs = await aretrieve(user_text_with_context)
+    return {"retrieved": docs}
 
-    if route == "claim_check":
-        claim_num = _extract_claim_number(current_user_text)
-        ql = (current_user_text or "").lower()
 
-        # Detect claim type
-        is_vat_claim = ("vat" in ql) or ("value added tax" in ql)
-        is_distribution_claim = any(
-            k in ql for k in ["derivation", "distribution", "allocation", "proceeds", "vat sharing"]
+# Fixed lookups used to find the actual VAT rate clause for VAT-rate rumours
+VAT_RATE_QUERIES = [
+    "VAT rate",
+    "Value Added Tax rate",
+    "rate of Value Added Tax",
+    "Charge of VAT",
+    "VAT is imposed",
+    "chapter six Value Added Tax",
+]
+
+
+def _looks_like_vat_quote(q: str) -> bool:
+    t = (q or "").lower()
+    return ("vat" in t) or ("value added tax" in t)
+
+
+def _looks_like_distribution_quote(q: str) -> bool:
+    t = (q or "").lower()
+    return (
+        (
+            "distributed" in t
+            or "distribution" in t
+            or "allocation" in t
+            or "credit of states" in t
+            or "local government" in t
+            or "states" in t
+            or "f.c.t" in t
+            or "derivation" in t
         )
-        is_rate_claim = (claim_num is not None) or ("rate" in ql) or ("%" in ql) or ("percent" in ql)
-
-        def _looks_like_vat_quote(q: str) -> bool:
-            t = (q or "").lower()
-            return ("vat" in t) or ("value added tax" in t)
-
-        def _looks_like_distribution_quote(q: str) -> bool:
-            t = (q or "").lower()
-            return (
-                (
-                    "distributed" in t
-                    or "distribution" in t
-                    or "allocation" in t
-                    or "credit of states" in t
-                    or "local government" in t
-                    or "states" in t
-                    or "f.c.t" in t
-                    or "derivation" in t
-                )
-                and ("rate" not in t)
-            )
-
-        def _looks_like_penalty_quote(q: str) -> bool:
-            t = (q or "").lower()
-            return ("penalty" in t) or ("administrative penalty" in t)
-
-        def _looks_like_vat_rate_quote(q: str) -> bool:
-            """
-            A "VAT rate" quote must:
-            - mention VAT (or Value Added Tax)
-            - AND contain either an explicit percent OR the word rate/rates
-            """
-            if not _looks_like_vat_quote(q):
-                return False
-            return bool(PERCENT_RE.search(q or "")) or bool(RATE_WORD_RE.search(q or ""))
-
-        # 1) Filter obvious mismatches (penalties, distribution-share % when user means "tax rate")
-        filtered = []
-        for c in citations:
-            q = (c.get("quote") or "")
-
-            if _looks_like_penalty_quote(q) and ("penalty" not in ql):
-                continue
+        and ("rate" not in t)
+    )
 
-            # If user is asking about a "rate" claim (e.g., "50% tax") but not distribution,
-            # do not use distribution-share percentages as evidence.
-            if is_rate_claim and (not is_distribution_claim):
-                if _looks_like_distribution_quote(q):
-                    continue
 
-            filtered.append(c)
+def _looks_like_penalty_quote(q: str) -> bool:
+    t = (q or "").lower()
+    return ("penalty" in t) or ("administrative penalty" in t)
 
-        if filtered:
-            citations = filtered
 
-   
-        if is_vat_claim and is_rate_claim and (not is_distribution_claim):
-          
-            extra_docs = []
-            for qq in [
-                "VAT rate",
-                "Value Added Tax rate",
-                "rate of Value Added Tax",
-                "Charge of VAT",
-                "VAT is imposed",
-                "chapter six Value Added Tax",
-            ]:
-                extra_docs.extend(retrieve(qq))
-
-            extra_cites = build_citations("VAT rate", extra_docs, max_cites=8)
-            extra_cites = [c for c in extra_cites if _looks_like_vat_rate_quote(c.get("quote", ""))]
-
-            if extra_cites:
-                citations = extra_cites[:3]
-            else:
-                citations = [c for c in citations if _looks_like_vat_quote(c.get("quote", ""))]
-
-        quotes = [c.get("quote", "") for c in citations]
+def _looks_like_vat_rate_quote(q: str) -> bool:
+    """
+    A "VAT rate" quote must:
+    - mention VAT (or Value Added Tax)
+    - AND contain either an explicit percent OR the word rate/rates
+    """
+    if not _looks_like_vat_quote(q):
+        return False
+    return bool(PERCENT_RE.search(q or "")) or bool(RATE_WORD_RE.search(q or ""))
 
-        evidence_quotes = "\n".join(
-            f'- ({c["source"]} {c["pages"]}) "{c["quote"]}"'
-            for c in citations
-        )
 
-        
-        verdict = "Unclear"
-        if claim_num:
-            if any(_has_exact_percent(q, claim_num) for q in quotes):
-                verdict = "Confirmed"
-            elif any(_has_any_percent(q) for q in quotes):
-                verdict = "Not confirmed"
-            else:
-                verdict = "Unclear"
+def _claim_kind(current_user_text: str) -> Dict[str, bool]:
+    claim_num = _extract_claim_number(current_user_text)
+    ql = (current_user_text or "").lower()
+
+    # Detect claim type
+    is_vat_claim = ("vat" in ql) or ("value added tax" in ql)
+    is_distribution_claim = any(
+        k in ql for k in ["derivation", "distribution", "allocation", "proceeds", "vat sharing"]
+    )
+    is_rate_claim = (claim_num is not None) or ("rate" in ql) or ("%" in ql) or ("percent" in ql)
+    return {"vat": is_vat_claim, "distribution": is_distribution_claim, "rate": is_rate_claim}
+
+
+def _needs_vat_rate_evidence(state: TaxState) -> bool:
+    """True when answer_node must look up the VAT rate clause (VAT-rate rumours)"""
+    if state.get("route", "qa") != "claim_check":
+        return False
+    kind = _claim_kind(_last_user_text(state))
+    return kind["vat"] and kind["rate"] and (not kind["distribution"])
+
+
+def _claim_check_citations(current_user_text: str, citations: list, vat_rate_docs: list | None) -> list:
+    kind = _claim_kind(current_user_text)
+    ql = (current_user_text or "").lower()
+
+    # 1) Filter obvious mismatches (penalties, distribution-share % when user means "tax rate")
+    filtered = []
+    for c in citations:
+        q = (c.get("quote") or "")
+
+        if _looks_like_penalty_quote(q) and ("penalty" not in ql):
+            continue
+
+        # If user is asking about a "rate" claim (e.g., "50% tax") but not distribution,
+        # do not use distribution-share percentages as evidence.
+        if kind["rate"] and (not kind["distribution"]):
+            if _looks_like_distribution_quote(q):
+                continue
+
+        filtered.append(c)
+
+    if filtered:
+        citations = filtered
+
+    if vat_rate_docs is not None:
+        extra_cites = build_citations("VAT rate", vat_rate_docs, max_cites=8)
+        extra_cites = [c for c in extra_cites if _looks_like_vat_rate_quote(c.get("quote", ""))]
+
+        if extra_cites:
+            citations = extra_cites[:3]
         else:
-            verdict = "Not confirmed"
+            citations = [c for c in citations if _looks_like_vat_quote(c.get("quote", ""))]
 
-        prompt = CLAIM_CHECK_PROMPT.format(
-            user_message=user_text_with_context,  
-            verdict=verdict,
-            evidence_quotes=evidence_quotes,
-        )
+    return citations
 
-        answer = WRITE_LLM.invoke([HumanMessage(content=prompt)]).content.strip()
 
-        payload = {
-            "answer": answer,
-            "citations": citations,
-            "refusal": False,
-            "route": route,
-        }
-        return {"messages": [AIMessage(content=json.dumps(payload, ensure_ascii=False))], "retrieved": []}
+def _claim_verdict(current_user_text: str, citations: list) -> str:
+    claim_num = _extract_claim_number(current_user_text)
+    quotes = [c.get("quote", "") for c in citations]
 
-    if not citations:
-        
-        refusal_answer = f"""I want to be careful here — I couldn’t find a clear clause in my memory that answers that exactly.
+    if claim_num:
+        if any(_has_exact_percent(q, claim_num) for q in quotes):
+            return "Confirmed"
+        if any(_has_any_percent(q) for q in quotes):
+            return "Not confirmed"
+        return "Unclear"
+    return "Not confirmed"
+
+
+REFUSAL_ANSWER = """I want to be careful here — I couldn’t find a clear clause in my memory that answers that exactly.
 
 Quick ways to help me locate it:
 • Mention the bill: HB-1759 / HB-1756 / HB-1757 / HB-1758
 • Add keywords you expect to appear (e.g., “VAT derivation”, “distribution of proceeds”, “tax rate”, “exemption”)
 • Or paste one sentence you saw online and I’ll verify it against the bills."""
 
-        payload = {
-            "answer": refusal_answer,
-            "citations": [],
-            "refusal": True,
-            "route": route,
-        }
-        return {"messages": [AIMessage(content=json.dumps(payload, ensure_ascii=False))], "retrieved": []}
-
-    if route == "compare":
-        quotes_block = "\n".join([f'- ({c["source"]} {c["pages"]}) "{c["quote"]}"' for c in citations])
-
-        
-        prompt = COMPARE_PROMPT.format(
-            user_message=user_text_with_context,  
-            user_question=current_user_text,
-            evidence_quotes=quotes_block,
+
+def _plan_answer(state: TaxState, vat_rate_docs: list | None = None) -> Dict[str, Any]:
+    """
+    Everything answer_node does except the WRITE_LLM call.
+
+    Returns {"route", "citations", "prompt"}; prompt is None when no LLM call is
+    needed (refusal), in which case "answer"/"refusal" are already filled in.
+    """
+    user_text_with_context = _get_user_message_with_context(state, include_context=True)
+    current_user_text = _last_user_text(state)  
+    retrieved = state.get("retrieved", []) or []
+    route = state.get("route", "qa")
+
+    citations = build_citations(current_user_text, retrieved, max_cites=3)
+
+    if route == "claim_check":
+        citations = _claim_check_citations(current_user_text, citations, vat_rate_docs)
+
+        evidence_quotes = "\n".join(
+            f'- ({c["source"]} {c["pages"]}) "{c["quote"]}"'
+            for c in citations
         )
 
-        answer = WRITE_LLM.invoke([HumanMessage(content=prompt)]).content.strip()
-        payload = {"answer": answer, "citations": citations, "refusal": False, "route": route}
-        return {"messages": [AIMessage(content=json.dumps(payload, ensure_ascii=False))], "retrieved": []}
+        prompt = CLAIM_CHECK_PROMPT.format(
+            claim=user_text_with_context,
+            verdict=_claim_verdict(current_user_text, citations),
+            evidence_quotes=evidence_quotes,
+        )
+        return {"route": route, "citations": citations, "prompt": prompt}
+
+    if not citations:
+        return {"route": route, "citations": [], "prompt": None, "answer": REFUSAL_ANSWER, "refusal": True}
 
     quotes_block = "\n".join([f'- ({c["source"]} {c["pages"]}) "{c["quote"]}"' for c in citations])
 
-    prompt = QA_PROMPT.format(
+    template = COMPARE_PROMPT if route == "compare" else QA_PROMPT
+    prompt = template.format(
         user_message=user_text_with_context,  
         user_question=current_user_text,
         evidence_quotes=quotes_block,
     )
+    return {"route": route, "citations": citations, "prompt": prompt}
+
 
-    answer = WRITE_LLM.invoke([HumanMessage(content=prompt)]).content.strip()
-    payload = {"answer": answer, "citations": citations, "refusal": False, "route": route}
+def _answer_update(plan: Dict[str, Any], answer: str | None = None) -> TaxState:
+    payload = {
+        "answer": plan.get("answer", answer),
+        "citations": plan["citations"],
+        "refusal": plan.get("refusal", False),
+        "route": plan["route"],
+    }
     return {"messages": [AIMessage(content=json.dumps(payload, ensure_ascii=False))], "retrieved": []}
 
 
-def build_graph():
+def answer_node(state: TaxState) -> TaxState:
+    """Answer with conversation context"""
+    vat_rate_docs = None
+    if _needs_vat_rate_evidence(state):
+        vat_rate_docs = retrieve_fixed(VAT_RATE_QUERIES)
+
+    plan = _plan_answer(state, vat_rate_docs)
+    if plan["prompt"] is None:
+        return _answer_update(plan)
+
+    _emit_citations(plan["route"], plan["citations"])
+    answer = WRITE_LLM.invoke([HumanMessage(content=plan["prompt"])]).content.strip()
+    return _answer_update(plan, answer)
+
+
+async def aanswer_node(state: TaxState) -> TaxState:
+    """Async answer node (same logic as answer_node, non-blocking I/O)"""
+    vat_rate_docs = None
+    if _needs_vat_rate_evidence(state):
+        vat_rate_docs = await aretrieve_fixed(VAT_RATE_QUERIES)
+
+    # citation building scans chunk text; keep it off the event loop
+    plan = await asyncio.to_thread(_plan_answer, state, vat_rate_docs)
+    if plan["prompt"] is None:
+        return _answer_update(plan)
+
+    _emit_citations(plan["route"], plan["citations"])
+    resp = await WRITE_LLM.ainvoke([HumanMessage(content=plan["prompt"])])
+    return _answer_update(plan, resp.content.strip())
+
+
+def _node(func, afunc, name: str) -> RunnableLambda:
+    """Graph node with both sync (invoke/stream) and async (ainvoke/astream) implementations, timed"""
+
+    @functools.wraps(func)
+    def timed(state: TaxState) -> TaxState:
+        t0 = time.perf_counter()
+        try:
+            return func(state)
+        except Exception:
+            GRAPH_NODE_ERRORS.inc(node=name)
+            raise
+        finally:
+            GRAPH_NODE_SECONDS.observe(time.perf_counter() - t0, node=name)
+
+    @functools.wraps(afunc)
+    async def atimed(state: TaxState) -> TaxState:
+        t0 = time.perf_counter()
+        try:
+            return await afunc(state)
+        except Exception:
+            GRAPH_NODE_ERRORS.inc(node=name)
+            raise
+        finally:
+            GRAPH_NODE_SECONDS.observe(time.perf_counter() - t0, node=name)
+
+    return RunnableLambda(timed, afunc=atimed, name=name)
+
+
+def build_graph(checkpoint: bool = True):
+    """checkpoint=False builds a stateless graph for one-off questions (no thread_id needed)"""
     g = StateGraph(TaxState)
 
-    g.add_node("route", route_node)
-    g.add_node("smalltalk", smalltalk_node)
-    g.add_node("clarify", clarify_node)
-    g.add_node("retrieve", retrieve_node)
-    g.add_node("answer", answer_node)
+    g.add_node("route", _node(route_node, aroute_node, "route"))
+    g.add_node("smalltalk", _node(smalltalk_node, asmalltalk_node, "smalltalk"))
+    g.add_node("clarify", _node(clarify_node, aclarify_node, "clarify"))
+    g.add_node("retrieve", _node(retrieve_node, aretrieve_node, "retrieve"))
+    g.add_node("answer", _node(answer_node, aanswer_node, "answer"))
 
     g.add_edge(START, "route")
 
@@ -466,4 +757,83 @@ def build_graph():
     g.add_edge("retrieve", "answer")
     g.add_edge("answer", END)
 
-    return g.compile(checkpointer=MemorySaver())
\ No newline at end of file
+    return g.compile(checkpointer=build_checkpointer() if checkpoint else None)
+
+
+def warm_up() -> Dict[str, float]:
+    """
+    Pay the first-request costs up front: open the vector store, load the chunk
+    cache, prime the embeddings client (connection + first call), fill the fixed
+    VAT-rate lookups and load the intent model. Returns seconds per step.
+    """
+    timings: Dict[str, float] = {}
+
+    def step(name: str, fn) -> None:
+        t0 = time.perf_counter()
+        fn()
+        timings[name] = round(time.perf_counter() - t0, 3)
+
+    step("vectorstore", load_chroma)
+    step("chunk_cache", preload_chunks)
+    step("embeddings", lambda: load_chroma().embeddings.embed_query("warm-up"))
+    step("fixed_retrievals", lambda: retrieve_fixed(VAT_RATE_QUERIES))
+    step("intent_model", lambda: classify_route("warm-up"))
+    return timings
+
+
+# -----------------------------
+# Batches of independent questions
+# -----------------------------
+def _batch_plan(questions: list[str]) -> tuple[list[TaxState], list[int], list[str]]:
+    """Fresh single-turn states, plus which of them to prefetch retrieval for and their queries"""
+    states: list[TaxState] = [{"messages": [HumanMessage(content=q)]} for q in questions]
+    # the regex router is free to ask; anything it cannot place usually retrieves
+    todo = [i for i, q in enumerate(questions) if _deterministic_route(q) not in ("smalltalk", "clarify")]
+    queries = [_get_user_message_with_context(states[i], include_context=True) for i in todo]
+    return states, todo, queries
+
+
+def batch_inputs(questions: list[str]) -> list[TaxState]:
+    """
+    Graph inputs for independent questions with retrieval already done, using
+    one embeddings call for the whole batch (see retrieve_batch).
+    """
+    states, todo, queries = _batch_plan(questions)
+    for i, q, docs in zip(todo, queries, retrieve_batch(queries)):
+        states[i].update({"retrieved": docs, "retrieved_for": q})
+    return states
+
+
+async def abatch_inputs(questions: list[str]) -> list[TaxState]:
+    states, todo, queries = _batch_plan(questions)
+    for i, q, docs in zip(todo, queries, await aretrieve_batch(queries)):
+        states[i].update({"retrieved": docs, "retrieved_for": q})
+    return states
+
+
+_checkpointers: list = []
+
+
+def build_checkpointer():
+    """CHECKPOINTER=sqlite shares thread state between uvicorn workers and survives restarts"""
+    if settings.checkpointer == "sqlite":
+        print(f"💾 Using SQLite checkpointer: {settings.checkpoint_db}")
+        saver = SQLiteCheckpointSaver(
+            settings.checkpoint_db,
+            keep_checkpoints=settings.checkpoint_keep,
+            ttl_seconds=settings.checkpoint_ttl,
+        )
+    else:
+        saver = BoundedMemorySaver(
+            max_threads=settings.checkpoint_max_threads,
+            ttl_seconds=settings.checkpoint_ttl,
+            keep_checkpoints=settings.checkpoint_keep,
+        )
+    _checkpointers[:] = [saver]  # the graph the app serves is the last one built
+    return saver
+
+
+REGISTRY.gauge(
+    "tax_checkpointer_state", "Checkpointer contents (threads, checkpoints, ...)", ["field"],
+    callback=lambda: {(k,): v for saver in _checkpointers for k, v in saver.stats().items()},
+)
\ No newline at end of file
@@ -0,0 +1,286 @@
+from __future__ import annotations
+
+import asyncio
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .config import settings
+from .metrics import REGISTRY
+from .vectorstore import index_generation
+
+
+# Follow-ups that only make sense with the previous turns ("what about it?")
+FOLLOWUP_RE = re.compile(
+    r"\b(it|its|that|this|those|these|they|them|their|above|previous|earlier|again|same|else)\b"
+    r"|^\s*(and|but|so|also|then|what\s+about|how\s+about|why\s+is\s+that)\b",
+    re.IGNORECASE,
+)
+
+CacheKey = Tuple[str, str, str]  # (index generation, route, normalized question)
+
+
+def normalize_question(text: str) -> str:
+    """Lowercase, drop punctuation (keeping % and decimals), collapse whitespace."""
+    t = (text or "").lower()
+    t = re.sub(r"[^\w%.\s]|(?<!\d)\.|\.(?!\d)", " ", t)
+    return re.sub(r"\s+", " ", t).strip()
+
+
+def question_key(question: str, route: str) -> CacheKey:
+    """Identity of an answer: same index, same route, same question after normalization"""
+    return (index_generation(), route, normalize_question(question))
+
+
+def is_context_free(question: str, history: Optional[List[Dict]] = None) -> bool:
+    """
+    True when the answer cannot depend on earlier turns: either there are no
+    earlier turns, or the question does not refer back to them.
+    """
+    earlier = list(history or [])
+    # the current message is usually already saved and included in history
+    if earlier and earlier[-1].get("role") == "user" and str(earlier[-1].get("content", "")).strip() == (question or "").strip():
+        earlier = earlier[:-1]
+    if not earlier:
+        return True
+    return not FOLLOWUP_RE.search(question or "")
+
+
+def route_hint(question: str) -> str:
+    """Cheap route for cache keys: the deterministic router, or "auto" when it would ask the LLM."""
+    from .agent_graph import _deterministic_route
+
+    return _deterministic_route(question) or "auto"
+
+
+@dataclass
+class _Entry:
+    value: Dict[str, Any]
+    created: float
+    vector: Any = None
+
+
+class AnswerCache:
+    """
+    Bounded LRU + TTL cache of final answers (answer, citations, route, refusal).
+
+    Keys are (index generation, route, normalized question), so a re-index
+    invalidates everything. With a similarity threshold > 0, a miss falls back
+    to cosine similarity over question embeddings within the same
+    generation/route, which catches rephrasings of the same FAQ.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1000,
+        ttl_seconds: float = 86400,
+        similarity_threshold: float = 0.0,
+        embed_fn: Optional[Callable[[str], List[float]]] = None,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self._embed_fn = embed_fn
+        self._aembed_fn: Optional[Callable[[str], Awaitable[List[float]]]] = None
+        self._entries: "OrderedDict[CacheKey, _Entry]" = OrderedDict()
+        self._vectors: "OrderedDict[str, Any]" = OrderedDict()  # normalized question -> unit vector
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "semantic_hits": 0, "misses": 0, "bypassed": 0, "evictions": 0, "expired": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def key(self, question: str, route: str) -> CacheKey:
+        return question_key(question, route)
+
+    # -----------------------------
+    # Lookup / store
+    # -----------------------------
+    def get(self, question: str, route: str) -> Optional[Dict[str, Any]]:
+        if not self.enabled:
+            return None
+        key = self.key(question, route)
+        now = time.time()
+        hit = self._exact_get(key, now)
+        if hit is None and self.similarity_threshold > 0:
+            candidates = self._candidates(key, now)
+            if candidates:
+                try:
+                    hit = self._best_match(candidates, self._vector(key[2]))
+                except Exception as e:
+                    print(f"⚠️ Answer cache embedding failed: {e}")
+        return self._counted(hit)
+
+    async def aget(self, question: str, route: str) -> Optional[Dict[str, Any]]:
+        """get() for the event loop: the question embedding (semantic lookup) is awaited, not blocked on"""
+        if not self.enabled:
+            return None
+        key = self.key(question, route)
+        now = time.time()
+        hit = self._exact_get(key, now)
+        if hit is None and self.similarity_threshold > 0:
+            candidates = self._candidates(key, now)
+            if candidates:
+                try:
+                    hit = self._best_match(candidates, await self._avector(key[2]))
+                except Exception as e:
+                    print(f"⚠️ Answer cache embedding failed: {e}")
+        return self._counted(hit)
+
+    def put(self, question: str, route: str, value: Dict[str, Any]) -> None:
+        if not self.enabled:
+            return
+        key = self.key(question, route)
+        self._store(key, value, self._vector(key[2]) if self.similarity_threshold > 0 else None)
+
+    async def aput(self, question: str, route: str, value: Dict[str, Any]) -> None:
+        """put() for the event loop (see aget)"""
+        if not self.enabled:
+            return
+        key = self.key(question, route)
+        self._store(key, value, await self._avector(key[2]) if self.similarity_threshold > 0 else None)
+
+    def bypass(self) -> None:
+        """Record a request that skipped the cache (context-dependent follow-up)."""
+        with self._lock:
+            self._stats["bypassed"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._vectors.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            s = dict(self._stats)
+            s["size"] = len(self._entries)
+        lookups = s["hits"] + s["semantic_hits"] + s["misses"]
+        s["hit_rate"] = round((s["hits"] + s["semantic_hits"]) / lookups, 4) if lookups else 0.0
+        return s
+
+    # -----------------------------
+    # Internals
+    # -----------------------------
+    def _expired(self, entry: _Entry, now: float) -> bool:
+        return self.ttl_seconds > 0 and (now - entry.created) > self.ttl_seconds
+
+    def _exact_get(self, key: CacheKey, now: float) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry, now):
+                del self._entries[key]
+                self._stats["expired"] += 1
+                entry = None
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return dict(entry.value)
+
+    def _counted(self, hit: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        if hit is None:
+            with self._lock:
+                self._stats["misses"] += 1
+        return hit
+
+    def _store(self, key: CacheKey, value: Dict[str, Any], vector: Any) -> None:
+        with self._lock:
+            self._entries[key] = _Entry(value=dict(value), created=time.time(), vector=vector)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def _embedders(self):
+        """(embed, aembed) for questions; a sync embed_fn given to the constructor runs in a thread"""
+        if self._embed_fn is None:
+            from .vectorstore import get_embeddings
+
+            embeddings = get_embeddings()
+            self._embed_fn, self._aembed_fn = embeddings.embed_query, embeddings.aembed_query
+        elif self._aembed_fn is None:
+            embed_fn = self._embed_fn
+            self._aembed_fn = lambda text: asyncio.to_thread(embed_fn, text)
+        return self._embed_fn, self._aembed_fn
+
+    def _cached_vector(self, normalized: str):
+        with self._lock:
+            return self._vectors.get(normalized)
+
+    def _unit_vector(self, normalized: str, raw: List[float]):
+        import numpy as np
+
+        v = np.asarray(raw, dtype=np.float32)
+        n = float(np.linalg.norm(v))
+        v = v / n if n else v
+
+        with self._lock:
+            self._vectors[normalized] = v
+            self._vectors.move_to_end(normalized)
+            while len(self._vectors) > max(self.max_entries, 1):
+                self._vectors.popitem(last=False)
+        return v
+
+    def _vector(self, normalized: str):
+        v = self._cached_vector(normalized)
+        if v is not None:
+            return v
+        embed, _ = self._embedders()
+        return self._unit_vector(normalized, embed(normalized))
+
+    async def _avector(self, normalized: str):
+        v = self._cached_vector(normalized)
+        if v is not None:
+            return v
+        _, aembed = self._embedders()
+        return self._unit_vector(normalized, await aembed(normalized))
+
+    def _candidates(self, key: CacheKey, now: float) -> List[Tuple[CacheKey, _Entry]]:
+        """Unexpired entries with a vector for the same generation and route"""
+        with self._lock:
+            return [
+                (k, e) for k, e in self._entries.items()
+                if k[0] == key[0] and k[1] == key[1] and e.vector is not None and not self._expired(e, now)
+            ]
+
+    def _best_match(self, candidates: List[Tuple[CacheKey, _Entry]], q) -> Optional[Dict[str, Any]]:
+        import numpy as np
+
+        sims = np.stack([e.vector for _, e in candidates]) @ q
+        best = int(np.argmax(sims))
+        if float(sims[best]) < self.similarity_threshold:
+            return None
+
+        best_key, best_entry = candidates[best]
+        with self._lock:
+            if best_key in self._entries:
+                self._entries.move_to_end(best_key)
+            self._stats["semantic_hits"] += 1
+        return dict(best_entry.value)
+
+answer_cache = AnswerCache(
+    max_entries=settings.answer_cache_size,
+    ttl_seconds=settings.answer_cache_ttl,
+    similarity_threshold=settings.answer_cache_similarity,
+)
+
+
+REGISTRY.counter(
+    "tax_answer_cache_lookups_total", "Answer cache lookups by result", ["result"],
+    callback=lambda: {
+        (result,): answer_cache.stats()[key]
+        for result, key in (("hit", "hits"), ("semantic_hit", "semantic_hits"), ("miss", "misses"), ("bypass", "bypassed"))
+    },
+)
+REGISTRY.counter(
+    "tax_answer_cache_removals_total", "Answer cache entries removed", ["reason"],
+    callback=lambda: {("lru",): answer_cache.stats()["evictions"], ("ttl",): answer_cache.stats()["expired"]},
+)
+REGISTRY.gauge(
+    "tax_answer_cache_entries", "Answers currently cached",
+    callback=lambda: {(): answer_cache.stats()["size"]},
+)
@@ -0,0 +1,471 @@
+from __future__ import annotations
+
+import asyncio
+import random
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict, defaultdict
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Set, Tuple
+
+from langchain_core.messages import RemoveMessage
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+from langgraph.checkpoint.memory import MemorySaver
+
+
+def trim_messages_update(messages: List[Any], window: int) -> Dict[str, Any]:
+    """
+    State update that drops everything but the last `window` messages
+    (MessagesState reducer understands RemoveMessage). Empty dict if nothing to drop.
+    """
+    if window <= 0 or len(messages) <= window:
+        return {}
+    return {"messages": [RemoveMessage(id=m.id) for m in messages[:-window] if getattr(m, "id", None)]}
+
+
+class BoundedMemorySaver(MemorySaver):
+    """
+    MemorySaver that cannot grow without bound:
+
+    - only the latest `keep_checkpoints` checkpoints of a thread are retained
+      (plus the channel blobs they reference), instead of every step ever run
+    - threads idle for longer than `ttl_seconds` are dropped
+    - at most `max_threads` threads are kept; the least recently used go first
+
+    The conversation itself lives in MySQL, so an evicted thread is simply
+    re-seeded from the DB history on its next message.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_threads: int = 5000,
+        ttl_seconds: float = 6 * 3600,
+        keep_checkpoints: int = 1,
+        serde=None,
+    ):
+        super().__init__(serde=serde)
+        self.max_threads = max_threads
+        self.ttl_seconds = ttl_seconds
+        self.keep_checkpoints = max(1, keep_checkpoints)
+
+        self._last_used: "OrderedDict[str, float]" = OrderedDict()
+        # per-thread indexes so pruning/eviction never scans the global dicts
+        self._blob_keys: Dict[str, Set[Tuple]] = defaultdict(set)
+        self._write_keys: Dict[str, Set[Tuple]] = defaultdict(set)
+        self._lock = threading.RLock()
+        self.evicted = 0
+
+    # -----------------------------
+    # Saver API
+    # -----------------------------
+    def get_tuple(self, config):
+        thread_id = config["configurable"]["thread_id"]
+        with self._lock:
+            last = self._last_used.get(thread_id)
+            if last is not None and self._is_stale(last, time.time()):
+                self._drop(thread_id)
+            tup = super().get_tuple(config)
+            if tup is None:
+                # MemorySaver's defaultdict lookups leave empty entries behind
+                self._discard_empty(thread_id)
+            return tup
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        with self._lock:
+            out = super().put(config, checkpoint, metadata, new_versions)
+            for channel, version in new_versions.items():
+                self._blob_keys[thread_id].add((thread_id, checkpoint_ns, channel, version))
+            self._prune(thread_id, checkpoint_ns)
+            self._touch(thread_id)
+            self._evict()
+            return out
+
+    def put_writes(self, config, writes, task_id, task_path: str = ""):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        with self._lock:
+            super().put_writes(config, writes, task_id, task_path)
+            self._write_keys[thread_id].add((thread_id, checkpoint_ns, checkpoint_id))
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            self._drop(thread_id)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "threads": len(self._last_used),
+                "checkpoints": sum(len(c) for ns in self.storage.values() for c in ns.values()),
+                "blobs": len(self.blobs),
+                "evicted": self.evicted,
+            }
+
+    # -----------------------------
+    # Internals (call with the lock held)
+    # -----------------------------
+    def _is_stale(self, last_used: float, now: float) -> bool:
+        return self.ttl_seconds > 0 and (now - last_used) > self.ttl_seconds
+
+    def _touch(self, thread_id: str) -> None:
+        self._last_used[thread_id] = time.time()
+        self._last_used.move_to_end(thread_id)
+
+    def _evict(self) -> None:
+        now = time.time()
+        while self._last_used:
+            oldest, last = next(iter(self._last_used.items()))
+            if len(self._last_used) > self.max_threads or self._is_stale(last, now):
+                self._drop(oldest)
+                self.evicted += 1
+            else:
+                break
+
+    def _drop(self, thread_id: str) -> None:
+        self.storage.pop(thread_id, None)
+        for k in self._write_keys.pop(thread_id, ()):
+            self.writes.pop(k, None)
+        for k in self._blob_keys.pop(thread_id, ()):
+            self.blobs.pop(k, None)
+        self._last_used.pop(thread_id, None)
+
+    def _discard_empty(self, thread_id: str) -> None:
+        ns = self.storage.get(thread_id)
+        if ns is not None and not any(ns.values()):
+            del self.storage[thread_id]
+
+    def _prune(self, thread_id: str, checkpoint_ns: str) -> None:
+        checkpoints = self.storage[thread_id][checkpoint_ns]
+        if len(checkpoints) <= self.keep_checkpoints:
+            return
+
+        # checkpoint ids are time-ordered (uuid6), newest last
+        ordered = sorted(checkpoints)
+        keep, drop = ordered[-self.keep_checkpoints:], ordered[:-self.keep_checkpoints]
+
+        for cid in drop:
+            del checkpoints[cid]
+
+        # pending writes of older steps can land after the next checkpoint, so drop by id order
+        for key in [k for k in self._write_keys[thread_id] if k[1] == checkpoint_ns and k[2] < keep[0]]:
+            self.writes.pop(key, None)
+            self._write_keys[thread_id].discard(key)
+
+        # keep only the blobs the retained checkpoints still point at
+        referenced = set()
+        for cid in keep:
+            versions = self.serde.loads_typed(checkpoints[cid][0]).get("channel_versions", {})
+            referenced.update((thread_id, checkpoint_ns, ch, v) for ch, v in versions.items())
+
+        for k in [k for k in self._blob_keys[thread_id] if k[1] == checkpoint_ns and k not in referenced]:
+            self.blobs.pop(k, None)
+            self._blob_keys[thread_id].discard(k)
+
+
+class SQLiteCheckpointSaver(BaseCheckpointSaver):
+    """
+    File-backed checkpointer so every uvicorn worker on the node sees the same
+    thread state (no sticky sessions) and state survives restarts.
+
+    - WAL mode + busy_timeout: many readers, one writer, across processes
+    - checkpoints are stored serialized and zlib-compressed, channel values inline
+    - each put keeps only the latest `keep_checkpoints` checkpoints of the thread
+    - every `compact_every` puts: threads idle past `ttl_seconds` are deleted and
+      the WAL is checkpointed back into the main file
+    """
+
+    COMPRESS_MIN_BYTES = 512
+
+    def __init__(
+        self,
+        path: str | Path,
+        *,
+        keep_checkpoints: int = 1,
+        ttl_seconds: float = 6 * 3600,
+        compact_every: int = 500,
+        serde=None,
+    ):
+        super().__init__(serde=serde)
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.keep_checkpoints = max(1, keep_checkpoints)
+        self.ttl_seconds = ttl_seconds
+        self.compact_every = compact_every
+
+        self._puts = 0
+        self.compactions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False, isolation_level=None)
+        self._setup()
+
+    def _setup(self) -> None:
+        with self._lock:
+            c = self._conn
+            c.execute("PRAGMA journal_mode=WAL")
+            c.execute("PRAGMA synchronous=NORMAL")
+            c.execute("PRAGMA busy_timeout=30000")
+            c.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS checkpoints (
+                    thread_id TEXT NOT NULL,
+                    checkpoint_ns TEXT NOT NULL DEFAULT '',
+                    checkpoint_id TEXT NOT NULL,
+                    parent_checkpoint_id TEXT,
+                    type TEXT,
+                    checkpoint BLOB,
+                    metadata_type TEXT,
+                    metadata BLOB,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+                );
+                CREATE INDEX IF NOT EXISTS idx_checkpoints_updated ON checkpoints (updated_at);
+                CREATE TABLE IF NOT EXISTS writes (
+                    thread_id TEXT NOT NULL,
+                    checkpoint_ns TEXT NOT NULL DEFAULT '',
+                    checkpoint_id TEXT NOT NULL,
+                    task_id TEXT NOT NULL,
+                    idx INTEGER NOT NULL,
+                    channel TEXT NOT NULL,
+                    type TEXT,
+                    value BLOB,
+                    task_path TEXT NOT NULL DEFAULT '',
+                    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+                );
+                """
+            )
+
+    # -----------------------------
+    # Serialization
+    # -----------------------------
+    def _dump(self, obj: Any) -> Tuple[str, bytes]:
+        type_, data = self.serde.dumps_typed(obj)
+        if len(data) >= self.COMPRESS_MIN_BYTES:
+            return f"z:{type_}", zlib.compress(data, 6)
+        return type_, data
+
+    def _load(self, type_: str, data: bytes) -> Any:
+        if type_.startswith("z:"):
+            return self.serde.loads_typed((type_[2:], zlib.decompress(data)))
+        return self.serde.loads_typed((type_, data))
+
+    # -----------------------------
+    # Saver API
+    # -----------------------------
+    def get_next_version(self, current: str | None, channel: None) -> str:
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"
+
+    def get_tuple(self, config) -> CheckpointTuple | None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = get_checkpoint_id(config)
+
+        with self._lock:
+            if checkpoint_id:
+                row = self._conn.execute(
+                    "SELECT checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata FROM checkpoints "
+                    "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                    (thread_id, checkpoint_ns, checkpoint_id),
+                ).fetchone()
+            else:
+                row = self._conn.execute(
+                    "SELECT checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata FROM checkpoints "
+                    "WHERE thread_id = ? AND checkpoint_ns = ? ORDER BY checkpoint_id DESC LIMIT 1",
+                    (thread_id, checkpoint_ns),
+                ).fetchone()
+            if row is None:
+                return None
+            writes = self._conn.execute(
+                "SELECT task_id, channel, type, value FROM writes "
+                "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? ORDER BY task_id, idx",
+                (thread_id, checkpoint_ns, row[0]),
+            ).fetchall()
+
+        return self._to_tuple(thread_id, checkpoint_ns, row, writes)
+
+    def list(self, config, *, filter=None, before=None, limit=None) -> Iterator[CheckpointTuple]:
+        sql = "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata FROM checkpoints"
+        where, params = [], []
+        if config:
+            where.append("thread_id = ?")
+            params.append(config["configurable"]["thread_id"])
+            if "checkpoint_ns" in config["configurable"]:
+                where.append("checkpoint_ns = ?")
+                params.append(config["configurable"]["checkpoint_ns"])
+        if before and get_checkpoint_id(before):
+            where.append("checkpoint_id < ?")
+            params.append(get_checkpoint_id(before))
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY checkpoint_id DESC"
+
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+
+        emitted = 0
+        for thread_id, checkpoint_ns, *row in rows:
+            with self._lock:
+                writes = self._conn.execute(
+                    "SELECT task_id, channel, type, value FROM writes "
+                    "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? ORDER BY task_id, idx",
+                    (thread_id, checkpoint_ns, row[0]),
+                ).fetchall()
+            tup = self._to_tuple(thread_id, checkpoint_ns, tuple(row), writes)
+            if filter and not all(tup.metadata.get(k) == v for k, v in filter.items()):
+                continue
+            yield tup
+            emitted += 1
+            if limit is not None and emitted >= limit:
+                return
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        parent_id = config["configurable"].get("checkpoint_id")
+
+        type_, data = self._dump(checkpoint)
+        meta_type, meta = self._dump(get_checkpoint_metadata(config, metadata))
+
+        with self._lock:
+            c = self._conn
+            c.execute("BEGIN IMMEDIATE")
+            try:
+                c.execute(
+                    "INSERT OR REPLACE INTO checkpoints "
+                    "(thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (thread_id, checkpoint_ns, checkpoint["id"], parent_id, type_, data, meta_type, meta, time.time()),
+                )
+                self._prune(thread_id, checkpoint_ns)
+                c.execute("COMMIT")
+            except Exception:
+                c.execute("ROLLBACK")
+                raise
+
+            self._puts += 1
+            if self.compact_every > 0 and self._puts % self.compact_every == 0:
+                self._compact()
+
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    def put_writes(self, config, writes, task_id, task_path: str = "") -> None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+
+        # special channels (errors, interrupts) overwrite; regular writes are idempotent
+        verb = "INSERT OR REPLACE" if all(ch in WRITES_IDX_MAP for ch, _ in writes) else "INSERT OR IGNORE"
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            type_, data = self._dump(value)
+            rows.append((thread_id, checkpoint_ns, checkpoint_id, task_id, WRITES_IDX_MAP.get(channel, idx),
+                         channel, type_, data, task_path))
+
+        with self._lock:
+            self._conn.executemany(
+                f"{verb} INTO writes (thread_id, checkpoint_ns, checkpoint_id, task_id, idx, channel, type, value, task_path) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM checkpoints WHERE thread_id = ?", (thread_id,))
+            self._conn.execute("DELETE FROM writes WHERE thread_id = ?", (thread_id,))
+
+    # async variants: sqlite3 is blocking, so run on the default thread pool
+    async def aget_tuple(self, config) -> CheckpointTuple | None:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        items = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for item in items:
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path: str = "") -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            threads, checkpoints = self._conn.execute(
+                "SELECT COUNT(DISTINCT thread_id), COUNT(*) FROM checkpoints"
+            ).fetchone()
+            writes = self._conn.execute("SELECT COUNT(*) FROM writes").fetchone()[0]
+        return {"threads": threads, "checkpoints": checkpoints, "writes": writes, "compactions": self.compactions}
+
+    # -----------------------------
+    # Internals (call with the lock held)
+    # -----------------------------
+    def _to_tuple(self, thread_id: str, checkpoint_ns: str, row, writes) -> CheckpointTuple:
+        checkpoint_id, parent_id, type_, data, meta_type, meta = row
+        return CheckpointTuple(
+            config={"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id}},
+            checkpoint=self._load(type_, data),
+            metadata=self._load(meta_type, meta),
+            pending_writes=[(task_id, channel, self._load(t, v)) for task_id, channel, t, v in writes],
+            parent_config=(
+                {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": parent_id}}
+                if parent_id
+                else None
+            ),
+        )
+
+    def _prune(self, thread_id: str, checkpoint_ns: str) -> None:
+        row = self._conn.execute(
+            "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+            "ORDER BY checkpoint_id DESC LIMIT 1 OFFSET ?",
+            (thread_id, checkpoint_ns, self.keep_checkpoints - 1),
+        ).fetchone()
+        if row is None:
+            return
+        # checkpoint ids are time-ordered; writes of older steps can land after the next put
+        oldest_kept = row[0]
+        self._conn.execute(
+            "DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id < ?",
+            (thread_id, checkpoint_ns, oldest_kept),
+        )
+        self._conn.execute(
+            "DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id < ?",
+            (thread_id, checkpoint_ns, oldest_kept),
+        )
+
+    def _compact(self) -> None:
+        try:
+            if self.ttl_seconds > 0:
+                cutoff = time.time() - self.ttl_seconds
+                idle = "SELECT thread_id FROM checkpoints GROUP BY thread_id HAVING MAX(updated_at) < ?"
+                self._conn.execute(f"DELETE FROM writes WHERE thread_id IN ({idle})", (cutoff,))
+                self._conn.execute(f"DELETE FROM checkpoints WHERE thread_id IN ({idle})", (cutoff,))
+            self._conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+            self.compactions += 1
+        except sqlite3.OperationalError as e:
+            # another worker holds the write lock; the next compaction will catch up
+            print(f"⚠️ Checkpoint compaction skipped: {e}")
@@ -17,6 +17,15 @@ class Settings:
     openai_api_key: str | None = os.getenv("OPENAI_API_KEY")
     openai_chat_model: str = os.getenv("OPENAI_CHAT_MODEL", "gpt-4o-mini")
 
+    # Providers: "openai" or "fake" (offline, deterministic; for benchmarks/CI)
+    llm_provider: str = os.getenv("LLM_PROVIDER", "openai").lower()
+    embedding_provider: str = os.getenv("EMBEDDING_PROVIDER", "openai").lower()
+    fake_llm_latency_ms: float = float(os.getenv("FAKE_LLM_LATENCY_MS", "300"))
+    fake_llm_tokens_per_sec: float = float(os.getenv("FAKE_LLM_TOKENS_PER_SEC", "80"))
+    fake_llm_answer_tokens: int = int(os.getenv("FAKE_LLM_ANSWER_TOKENS", "120"))
+    fake_embedding_dim: int = int(os.getenv("FAKE_EMBEDDING_DIM", "1536"))
+    fake_embedding_latency_ms: float = float(os.getenv("FAKE_EMBEDDING_LATENCY_MS", "0"))
+
     # Paths (ABSOLUTE)
     docs_dir: Path = Path(os.getenv("TAX_DOCS_DIR", str(PROJECT_ROOT / "docs")))
     chroma_dir: Path = Path(os.getenv("CHROMA_DIR", str(PROJECT_ROOT / "chroma_db")))
@@ -28,5 +37,29 @@ class Settings:
     chunk_chars: int = int(os.getenv("CHUNK_CHARS", "1200"))
     chunk_overlap: int = int(os.getenv("CHUNK_OVERLAP", "150"))
 
+    # Local intent classifier (between the regex router and the LLM router)
+    intent_model_path: Path = Path(os.getenv("INTENT_MODEL", str(PROJECT_ROOT / "ai_engine" / "models" / "intent_router.npz")))
+    intent_threshold: float = float(os.getenv("INTENT_THRESHOLD", "0.8"))
+    route_log_path: str = os.getenv("ROUTE_LOG", "")
+
+    # Start retrieval alongside the LLM router instead of after it
+    speculative_retrieval: bool = os.getenv("SPECULATIVE_RETRIEVAL", "true").lower() in ("1", "true", "yes")
+
+    # Answer cache (size 0 disables it; similarity 0 = exact matches only)
+    answer_cache_size: int = int(os.getenv("ANSWER_CACHE_SIZE", "1000"))
+    answer_cache_ttl: int = int(os.getenv("ANSWER_CACHE_TTL", "86400"))
+    answer_cache_similarity: float = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0"))
+
+    # Concurrent identical context-free questions share one graph run
+    single_flight: bool = os.getenv("SINGLE_FLIGHT", "true").lower() in ("1", "true", "yes")
+
+    # Graph checkpointer: "memory" (per process) or "sqlite" (shared by all workers on the node)
+    checkpointer: str = os.getenv("CHECKPOINTER", "memory").lower()
+    checkpoint_db: Path = Path(os.getenv("CHECKPOINT_DB", str(PROJECT_ROOT / "checkpoints" / "graph.sqlite")))
+    checkpoint_max_threads: int = int(os.getenv("CHECKPOINT_MAX_THREADS", "5000"))
+    checkpoint_ttl: int = int(os.getenv("CHECKPOINT_TTL", "21600"))
+    checkpoint_keep: int = int(os.getenv("CHECKPOINT_KEEP", "1"))
+    checkpoint_message_window: int = int(os.getenv("CHECKPOINT_MESSAGE_WINDOW", "12"))
+
 
 settings = Settings()
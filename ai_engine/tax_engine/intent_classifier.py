@@ -0,0 +1,214 @@
+from __future__ import annotations
+
+import json
+import re
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+from .config import settings
+from .metrics import ROUTE_DECISIONS
+
+
+ROUTES: Tuple[str, ...] = ("smalltalk", "clarify", "qa", "compare", "claim_check")
+
+WORD_RE = re.compile(r"[a-z0-9%]+")
+
+
+# -----------------------------
+# Features: hashed char n-grams + words
+# -----------------------------
+def _grams(text: str, ngram_range: Tuple[int, int]) -> List[str]:
+    t = " ".join(WORD_RE.findall((text or "").lower()))
+    padded = f" {t} "
+    lo, hi = ngram_range
+    grams = [padded[i : i + n] for n in range(lo, hi + 1) for i in range(len(padded) - n + 1)]
+    grams.extend(f"w:{w}" for w in t.split())
+    return grams
+
+
+def featurize(text: str, dim: int, ngram_range: Tuple[int, int] = (2, 4)) -> Tuple[np.ndarray, np.ndarray]:
+    """Sparse (indices, values) of an L2-normalised hashed bag of n-grams"""
+    counts: Dict[int, float] = {}
+    for g in _grams(text, ngram_range):
+        h = zlib.crc32(g.encode("utf-8")) % dim
+        counts[h] = counts.get(h, 0.0) + 1.0
+    if not counts:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    idx = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+    val = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+    val = np.sqrt(val)  # dampen repeated n-grams
+    val /= np.linalg.norm(val)
+    return idx, val
+
+
+class IntentClassifier:
+    """
+    Multinomial logistic regression over hashed character n-grams, in plain NumPy.
+
+    Small enough to train in about a second on a few thousand messages and
+    cheap to run per request (a few hundred multiply-adds).
+    """
+
+    def __init__(self, dim: int = 2**14, labels: Sequence[str] = ROUTES, ngram_range: Tuple[int, int] = (2, 4)):
+        self.dim = dim
+        self.labels = tuple(labels)
+        self.ngram_range = ngram_range
+        self.W = np.zeros((dim, len(self.labels)), dtype=np.float32)
+        self.b = np.zeros(len(self.labels), dtype=np.float32)
+
+    def _matrix(self, texts: Sequence[str]) -> np.ndarray:
+        X = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            idx, val = featurize(text, self.dim, self.ngram_range)
+            np.add.at(X[row], idx, val)
+        return X
+
+    def fit(
+        self,
+        texts: Sequence[str],
+        labels: Sequence[str],
+        *,
+        epochs: int = 300,
+        lr: float = 10.0,
+        l2: float = 1e-4,
+    ) -> "IntentClassifier":
+        X = self._matrix(texts)
+        y = np.array([self.labels.index(l) for l in labels])
+        Y = np.eye(len(self.labels), dtype=np.float32)[y]
+
+        # inverse-frequency weights so small classes (smalltalk/clarify) still count
+        freq = Y.sum(axis=0)
+        weights = (len(y) / (len(self.labels) * np.maximum(freq, 1)))[y][:, None]
+
+        n = len(texts)
+        for _ in range(epochs):
+            P = _softmax(X @ self.W + self.b)
+            G = (P - Y) * weights / n
+            self.W -= lr * (X.T @ G + l2 * self.W)
+            self.b -= lr * G.sum(axis=0)
+        return self
+
+    def predict_proba(self, text: str) -> np.ndarray:
+        idx, val = featurize(text, self.dim, self.ngram_range)
+        logits = val @ self.W[idx] + self.b
+        return _softmax(logits[None, :])[0]
+
+    def predict(self, text: str) -> Tuple[str, float]:
+        p = self.predict_proba(text)
+        i = int(p.argmax())
+        return self.labels[i], float(p[i])
+
+    def save(self, path: str | Path) -> None:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        np.savez_compressed(
+            path,
+            W=self.W.astype(np.float16),
+            b=self.b,
+            labels=np.array(self.labels),
+            ngram_range=np.array(self.ngram_range),
+        )
+
+    @classmethod
+    def load(cls, path: str | Path) -> "IntentClassifier":
+        data = np.load(path)
+        W = data["W"].astype(np.float32)
+        model = cls(dim=W.shape[0], labels=[str(l) for l in data["labels"]], ngram_range=tuple(int(n) for n in data["ngram_range"]))
+        model.W, model.b = W, data["b"].astype(np.float32)
+        return model
+
+
+def _softmax(z: np.ndarray) -> np.ndarray:
+    z = z - z.max(axis=1, keepdims=True)
+    e = np.exp(z)
+    return e / e.sum(axis=1, keepdims=True)
+
+
+# -----------------------------
+# Runtime: model loaded once, used by route_node
+# -----------------------------
+_MODEL: IntentClassifier | None = None
+_MODEL_LOADED = False
+_MODEL_LOCK = threading.Lock()
+
+
+def _model() -> IntentClassifier | None:
+    global _MODEL, _MODEL_LOADED
+    if _MODEL_LOADED:
+        return _MODEL
+    with _MODEL_LOCK:
+        if not _MODEL_LOADED:
+            path = settings.intent_model_path
+            if path.exists():
+                try:
+                    _MODEL = IntentClassifier.load(path)
+                    print(f"✅ Intent classifier loaded: {path}")
+                except Exception as e:
+                    print(f"⚠️ Could not load intent classifier ({path}): {e}")
+            _MODEL_LOADED = True
+    return _MODEL
+
+
+def classify_route(text: str) -> Tuple[str, float] | None:
+    """
+    (route, confidence) when the local model is confident enough to skip the
+    LLM router, else None (no model, disabled, or below INTENT_THRESHOLD).
+    """
+    if settings.intent_threshold >= 1:
+        return None
+    model = _model()
+    if model is None:
+        return None
+    route, conf = model.predict(text)
+    if conf < settings.intent_threshold:
+        return None
+    return route, conf
+
+
+# -----------------------------
+# Route log (training data for the classifier)
+# -----------------------------
+_LOG_LOCK = threading.Lock()
+
+
+def log_route(text: str, route: str, source: str) -> None:
+    """Count one routing decision and append it to ROUTE_LOG (JSONL) when set"""
+    ROUTE_DECISIONS.inc(source=source, route=route)
+    path = settings.route_log_path
+    if not path or not text:
+        return
+    line = json.dumps({"ts": round(time.time(), 3), "message": text, "route": route, "source": source})
+    try:
+        with _LOG_LOCK, open(path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+    except OSError as e:
+        print(f"⚠️ Could not write route log: {e}")
+
+
+def load_examples(paths: Iterable[Path], skip_sources: Sequence[str] = ("classifier",)) -> List[Tuple[str, str]]:
+    """
+    (message, route) pairs from JSONL files (eval testset, seed set, route logs).
+    Rows with unknown routes are skipped, and so are the classifier's own past
+    decisions so it never trains on itself.
+    """
+    out: List[Tuple[str, str]] = []
+    for path in paths:
+        if not path.exists():
+            continue
+        with path.open("r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                row = json.loads(line)
+                route = row.get("route") or row.get("expected_route")
+                if row.get("source") in skip_sources:
+                    continue
+                if row.get("message") and route in ROUTES:
+                    out.append((row["message"], route))
+    return out
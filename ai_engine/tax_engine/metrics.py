@@ -0,0 +1,303 @@
+"""
+Minimal in-process metrics registry rendered in Prometheus text format.
+
+Stdlib only, so the backend and the AI engine can both import it cheaply.
+Each uvicorn worker keeps its own registry; scrape every worker (or run one
+worker per container) to get totals.
+"""
+from __future__ import annotations
+
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(v: str) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt_value(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) and not v.is_integer() else str(int(v))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, doc: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class _Value(_Metric):
+    """
+    Counter/gauge storage. Values are either recorded directly or read at
+    scrape time from a callback returning {label_values_tuple: value}, which
+    suits components that already keep their own stats (caches, checkpointer).
+    """
+
+    def __init__(self, name, doc, labelnames=(), callback: Callable[[], Dict[LabelValues, float]] | None = None):
+        super().__init__(name, doc, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._callback = callback
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        with self._lock:
+            items = dict(self._values)
+        if self._callback is not None:
+            try:
+                items.update(self._callback() or {})
+            except Exception as e:
+                print(f"⚠️ Metric callback {self.name} failed: {e}")
+        return [f"{self.name}{_fmt_labels(self.labelnames, k)} {_fmt_value(v)}" for k, v in items.items()]
+
+
+class Counter(_Value):
+    kind = "counter"
+
+
+class Gauge(_Value):
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, doc, labelnames=(), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, doc, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # per label set: [bucket counts..., +Inf count], sum
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[i] += 1
+            total[0] += value
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, **labels)
+
+    def _samples(self):
+        with self._lock:
+            items = [(k, list(c), s[0]) for k, (c, s) in self._values.items()]
+        out = []
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = f'le="{_fmt_value(bound)}"'
+                out.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, key, le)} {cumulative}")
+            out.append(f"{self.name}_sum{_fmt_labels(self.labelnames, key)} {_fmt_value(total)}")
+            out.append(f"{self.name}_count{_fmt_labels(self.labelnames, key)} {cumulative}")
+        return out
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            # re-importing a module (reloads, tests) returns the existing metric
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, doc, labelnames=(), callback=None) -> Counter:
+        return self.register(Counter(name, doc, labelnames, callback))
+
+    def gauge(self, name, doc, labelnames=(), callback=None) -> Gauge:
+        return self.register(Gauge(name, doc, labelnames, callback))
+
+    def histogram(self, name, doc, labelnames=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, doc, labelnames, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for m in metrics:
+            lines.extend(m.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# -----------------------------
+# Metrics shared across the app
+# -----------------------------
+GRAPH_NODE_SECONDS = REGISTRY.histogram(
+    "tax_graph_node_seconds", "Time spent in each LangGraph node", ["node"]
+)
+GRAPH_NODE_ERRORS = REGISTRY.counter(
+    "tax_graph_node_errors_total", "Graph node executions that raised", ["node"]
+)
+LLM_SECONDS = REGISTRY.histogram(
+    "tax_llm_request_seconds", "LLM call latency (whole call, including streaming)", ["llm", "model"]
+)
+LLM_TOKENS = REGISTRY.counter(
+    "tax_llm_tokens_total", "LLM tokens used", ["llm", "model", "kind"]
+)
+LLM_ERRORS = REGISTRY.counter(
+    "tax_llm_errors_total", "LLM calls that failed", ["llm", "model"]
+)
+VECTOR_SEARCH_SECONDS = REGISTRY.histogram(
+    "tax_vector_search_seconds", "Similarity search latency (query embedding + Chroma query)", ["mode"], buckets=FAST_BUCKETS
+)
+ROUTE_DECISIONS = REGISTRY.counter(
+    "tax_route_decisions_total", "Routing decisions by source (regex/classifier/llm)", ["source", "route"]
+)
+HTTP_SECONDS = REGISTRY.histogram(
+    "http_request_seconds", "HTTP request latency", ["method", "route", "status"]
+)
+HTTP_DB_SECONDS = REGISTRY.histogram(
+    "http_request_db_seconds", "Total DB time spent per HTTP request", ["route"], buckets=FAST_BUCKETS
+)
+HTTP_DB_QUERIES = REGISTRY.histogram(
+    "http_request_db_queries", "DB statements executed per HTTP request", ["route"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 50),
+)
+DB_QUERY_SECONDS = REGISTRY.histogram(
+    "db_query_seconds", "Single DB statement latency", buckets=FAST_BUCKETS
+)
+
+
+# -----------------------------
+# Per-request DB time (SQLAlchemy events -> contextvar holder)
+# -----------------------------
+# The holder is a mutable list so time recorded inside threadpool workers
+# (which run with a copy of the request's context) is visible to the middleware.
+_request_db: contextvars.ContextVar[List[float] | None] = contextvars.ContextVar("request_db", default=None)
+
+
+def begin_request_db_timer() -> contextvars.Token:
+    return _request_db.set([0.0, 0])
+
+
+def end_request_db_timer(token: contextvars.Token) -> Tuple[float, int]:
+    holder = _request_db.get()
+    _request_db.reset(token)
+    return (holder[0], int(holder[1])) if holder else (0.0, 0)
+
+
+def record_db_query(seconds: float) -> None:
+    DB_QUERY_SECONDS.observe(seconds)
+    holder = _request_db.get()
+    if holder is not None:
+        holder[0] += seconds
+        holder[1] += 1
+
+
+def instrument_engine(engine) -> None:
+    """Time every statement run through a SQLAlchemy engine"""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("query_start")
+        if starts:
+            record_db_query(time.perf_counter() - starts.pop())
+
+    @event.listens_for(engine, "handle_error")
+    def _error(exception_context):
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("query_start"):
+            conn.info["query_start"].pop()
+
+
+# -----------------------------
+# Connection pools
+# -----------------------------
+DB_POOL_WAIT_SECONDS = REGISTRY.histogram(
+    "db_pool_wait_seconds", "Time a checkout waited for a pooled connection (includes opening a new one)",
+    ["engine"], buckets=FAST_BUCKETS,
+)
+DB_POOL_TIMEOUTS = REGISTRY.counter(
+    "db_pool_timeouts_total", "Checkouts that gave up after pool_timeout (pool exhausted)", ["engine"]
+)
+
+_pools: Dict[str, object] = {}  # label -> engine (engine.pool is read at scrape time, it survives dispose())
+
+
+def _pool_gauge(read: Callable[[object], float]) -> Callable[[], Dict[LabelValues, float]]:
+    def collect():
+        out = {}
+        for name, engine in list(_pools.items()):
+            try:
+                out[(name,)] = read(engine.pool)
+            except (AttributeError, NotImplementedError):
+                pass  # pools without a size (StaticPool, NullPool, ...)
+        return out
+    return collect
+
+
+REGISTRY.gauge("db_pool_size", "Persistent connections the pool keeps", ["engine"], callback=_pool_gauge(lambda p: p.size()))
+REGISTRY.gauge("db_pool_checked_out", "Connections in use", ["engine"], callback=_pool_gauge(lambda p: p.checkedout()))
+REGISTRY.gauge("db_pool_checked_in", "Idle connections in the pool", ["engine"], callback=_pool_gauge(lambda p: p.checkedin()))
+REGISTRY.gauge("db_pool_overflow", "Connections open beyond the pool size", ["engine"], callback=_pool_gauge(lambda p: max(0, p.overflow())))
+
+
+def observe_pool_wait(name: str, seconds: float, timed_out: bool) -> None:
+    """Checkout wait reported by the backend's timed pools (database.pool_wait_observers)"""
+    if timed_out:
+        DB_POOL_TIMEOUTS.inc(engine=name)
+    DB_POOL_WAIT_SECONDS.observe(seconds, engine=name)
+
+
+def instrument_pool(engine, name: str) -> None:
+    """Pool gauges for a SQLAlchemy engine, labelled engine=<name>"""
+    _pools[name] = engine
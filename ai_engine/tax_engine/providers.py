@@ -0,0 +1,214 @@
+"""
+Model providers for the AI engine.
+
+LLM_PROVIDER / EMBEDDING_PROVIDER select "openai" (default) or "fake". The fake
+providers are deterministic, offline stand-ins with realistic timing so the
+whole graph and /api/chat can be load-tested without network or API spend.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import time
+from functools import lru_cache
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+import numpy as np
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from .config import settings
+
+
+# -----------------------------
+# Fake chat model
+# -----------------------------
+# route mix used by the fake router: mostly retrieval routes, like real traffic
+_FAKE_ROUTES = ["qa"] * 12 + ["compare"] * 3 + ["claim_check"] * 3 + ["smalltalk", "clarify"]
+
+_FILLER = (
+    "Under the bill the relevant provision applies to taxable persons and the "
+    "revenue service shall administer the charge in line with the schedule and "
+    "the stated thresholds as cited in the documents provided"
+).split()
+
+
+def _digest(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Deterministic chat model: waits `latency_s` (time to first token), then emits
+    tokens at `tokens_per_sec`. The "router" role answers with router-shaped JSON;
+    other roles return filler prose of `answer_tokens` words.
+    """
+
+    role: str = "write"
+    latency_s: float = 0.3
+    tokens_per_sec: float = 80.0
+    answer_tokens: int = 120
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _prompt_text(self, messages: List[BaseMessage]) -> str:
+        return "\n".join(str(m.content) for m in messages)
+
+    def _render(self, messages: List[BaseMessage]) -> str:
+        prompt = self._prompt_text(messages)
+        seed = _digest(prompt)
+        if self.role == "router":
+            route = _FAKE_ROUTES[seed % len(_FAKE_ROUTES)]
+            return json.dumps({"route": route, "need_retrieval": route in ("qa", "compare", "claim_check")})
+        n = self.answer_tokens if self.role == "write" else max(8, self.answer_tokens // 4)
+        return " ".join(_FILLER[(seed + i) % len(_FILLER)] for i in range(n)) + "."
+
+    def _pieces(self, text: str) -> List[str]:
+        words = text.split(" ")
+        return [w + (" " if i < len(words) - 1 else "") for i, w in enumerate(words)]
+
+    def _usage(self, messages: List[BaseMessage], text: str) -> dict:
+        prompt_tokens = max(1, len(self._prompt_text(messages)) // 4)
+        completion_tokens = len(text.split())
+        return {"input_tokens": prompt_tokens, "output_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+
+    def _duration(self, text: str) -> float:
+        return self.latency_s + len(text.split()) / max(self.tokens_per_sec, 1e-6)
+
+    def _generate(self, messages, stop=None, run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs) -> ChatResult:
+        text = self._render(messages)
+        time.sleep(self._duration(text))
+        msg = AIMessage(content=text, usage_metadata=self._usage(messages, text))
+        return ChatResult(generations=[ChatGeneration(message=msg)])
+
+    async def _agenerate(self, messages, stop=None, run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs) -> ChatResult:
+        text = self._render(messages)
+        await asyncio.sleep(self._duration(text))
+        msg = AIMessage(content=text, usage_metadata=self._usage(messages, text))
+        return ChatResult(generations=[ChatGeneration(message=msg)])
+
+    def _stream(self, messages, stop=None, run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        text = self._render(messages)
+        time.sleep(self.latency_s)
+        for piece in self._pieces(text):
+            time.sleep(1 / max(self.tokens_per_sec, 1e-6))
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=piece))
+            if run_manager:
+                run_manager.on_llm_new_token(piece, chunk=chunk)
+            yield chunk
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=self._usage(messages, text)))
+
+    async def _astream(self, messages, stop=None, run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        text = self._render(messages)
+        await asyncio.sleep(self.latency_s)
+        for piece in self._pieces(text):
+            await asyncio.sleep(1 / max(self.tokens_per_sec, 1e-6))
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=piece))
+            if run_manager:
+                await run_manager.on_llm_new_token(piece, chunk=chunk)
+            yield chunk
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=self._usage(messages, text)))
+
+
+# -----------------------------
+# Fake embeddings
+# -----------------------------
+@lru_cache(maxsize=50000)
+def _word_vector(word: str, dim: int) -> np.ndarray:
+    return np.random.default_rng(_digest(word)).standard_normal(dim).astype(np.float32)
+
+
+class HashEmbeddings(Embeddings):
+    """
+    Deterministic embeddings: sum of hash-seeded random vectors of the words,
+    normalised. Texts sharing words land close together, so retrieval and the
+    semantic answer cache behave plausibly without a model.
+    """
+
+    def __init__(self, dim: int = 1536, latency_s: float = 0.0):
+        self.dim = dim
+        self.latency_s = latency_s
+
+    def _embed(self, text: str) -> List[float]:
+        words = [w for w in "".join(c.lower() if c.isalnum() else " " for c in text or "").split() if w]
+        v = np.zeros(self.dim, dtype=np.float32)
+        for w in words:
+            v += _word_vector(w, self.dim)
+        norm = float(np.linalg.norm(v))
+        return (v / norm).tolist() if norm else v.tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        return self._embed(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.latency_s:
+            await asyncio.sleep(self.latency_s)
+        return [self._embed(t) for t in texts]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        if self.latency_s:
+            await asyncio.sleep(self.latency_s)
+        return self._embed(text)
+
+
+# -----------------------------
+# Factories
+# -----------------------------
+def _require_openai_key() -> None:
+    if not settings.openai_api_key:
+        raise RuntimeError(
+            "OPENAI_API_KEY is missing. Put it in a .env file at the project root "
+            "or set it in your terminal environment (or use LLM_PROVIDER=fake / EMBEDDING_PROVIDER=fake)."
+        )
+
+
+def chat_model_name() -> str:
+    return "fake" if settings.llm_provider == "fake" else settings.openai_chat_model
+
+
+def chat_model(role: str, temperature: float, callbacks: Optional[list] = None) -> BaseChatModel:
+    if settings.llm_provider == "fake":
+        return FakeChatModel(
+            role=role,
+            latency_s=settings.fake_llm_latency_ms / 1000,
+            tokens_per_sec=settings.fake_llm_tokens_per_sec,
+            answer_tokens=settings.fake_llm_answer_tokens,
+            callbacks=callbacks,
+        )
+
+    from langchain_openai import ChatOpenAI
+
+    return ChatOpenAI(
+        model=settings.openai_chat_model,
+        temperature=temperature,
+        stream_usage=True,  # token counts for streamed answers too
+        callbacks=callbacks,
+    )
+
+
+def embeddings() -> Embeddings:
+    if settings.embedding_provider == "fake":
+        return HashEmbeddings(dim=settings.fake_embedding_dim, latency_s=settings.fake_embedding_latency_ms / 1000)
+
+    from langchain_openai import OpenAIEmbeddings
+
+    _require_openai_key()
+    return OpenAIEmbeddings(api_key=settings.openai_api_key)
+
+
+def collection_name(base: str) -> str:
+    """Fake vectors must never mix with real ones, so they get their own collection"""
+    return base if settings.embedding_provider == "openai" else f"{base}__{settings.embedding_provider}"
@@ -1,13 +1,20 @@
 from __future__ import annotations
 
+import asyncio
 import re
-from typing import List
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
 from functools import lru_cache
 
 from langchain_core.documents import Document
 
 from .config import settings
-from .vectorstore import load_chroma
+from .metrics import VECTOR_SEARCH_SECONDS
+from .vectorstore import load_chroma, load_collection, index_generation
+
+# Shared pool for concurrent Chroma searches in the sync retrieval path
+_SEARCH_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix="retrieve")
 
 
 def _dedupe(docs: List[Document]) -> List[Document]:
@@ -40,8 +47,10 @@ def _looks_like_vat_derivation_question(q: str) -> bool:
     )
 
 
+@lru_cache(maxsize=4096)
 def _compact(text: str) -> str:
     # remove whitespace + hyphens so "distribu\n ted" still matches "distributed"
+    # (cached: chunk texts are checked against many tokens, for every query)
     return re.sub(r"[\s\-]+", "", (text or "").lower())
 
 
@@ -92,7 +101,7 @@ def _expand_query(q: str) -> List[str]:
 
 
 @lru_cache(maxsize=1)
-def _all_chunks_cached() -> List[Document]:
+def _all_chunks_for(generation: str) -> List[Document]:
     chroma = load_chroma()
     got = chroma.get(include=["documents", "metadatas"])
     docs = got.get("documents", []) or []
@@ -103,13 +112,15 @@ def _all_chunks_cached() -> List[Document]:
     return out
 
 
-def _strict_rate_filter(query: str) -> List[Document]:
-    ql = (query or "").lower()
-    if not _looks_like_rate_question(ql):
-        return []
+def _all_chunks_cached() -> List[Document]:
+    # keyed on the index generation so a rebuild is picked up without a restart
+    return _all_chunks_for(index_generation())
 
+
+@lru_cache(maxsize=1)
+def _rate_chunks_for(generation: str) -> List[Document]:
     hits = []
-    for d in _all_chunks_cached():
+    for d in _all_chunks_for(generation):
         t = (d.page_content or "").lower()
         has_rate_word = ("rate" in t) or ("rates" in t)
         has_tax_context = ("tax" in t) or ("vat" in t) or ("income tax" in t) or ("paye" in t)
@@ -118,15 +129,19 @@ def _strict_rate_filter(query: str) -> List[Document]:
     return hits
 
 
-def _strict_vat_derivation_filter(query: str) -> List[Document]:
-    """
-    Force-retrieve derivation/distribution clauses even if PDF breaks words across lines.
-    """
-    if not _looks_like_vat_derivation_question(query):
+def _strict_rate_filter(query: str) -> List[Document]:
+    ql = (query or "").lower()
+    if not _looks_like_rate_question(ql):
         return []
 
+    # the scan itself does not depend on the query, only the gate above does
+    return list(_rate_chunks_for(index_generation()))
+
+
+@lru_cache(maxsize=1)
+def _vat_derivation_chunks_for(generation: str) -> List[Document]:
     hits: List[Document] = []
-    for d in _all_chunks_cached():
+    for d in _all_chunks_for(generation):
         text = d.page_content or ""
 
         # must mention derivation (robust)
@@ -149,6 +164,25 @@ def _strict_vat_derivation_filter(query: str) -> List[Document]:
     return hits
 
 
+def _strict_vat_derivation_filter(query: str) -> List[Document]:
+    """
+    Force-retrieve derivation/distribution clauses even if PDF breaks words across lines.
+    """
+    if not _looks_like_vat_derivation_question(query):
+        return []
+
+    # like the rate scan, only the gate depends on the query
+    return list(_vat_derivation_chunks_for(index_generation()))
+
+
+def preload_chunks() -> int:
+    """Load the chunk cache and the strict-filter scans for the current index generation"""
+    generation = index_generation()
+    _rate_chunks_for(generation)
+    _vat_derivation_chunks_for(generation)
+    return len(_all_chunks_for(generation))
+
+
 def _boost_sort(query: str, docs: List[Document]) -> List[Document]:
     if not _looks_like_vat_derivation_question(query):
         return docs
@@ -178,18 +212,7 @@ def _boost_sort(query: str, docs: List[Document]) -> List[Document]:
     return sorted(docs, key=score, reverse=True)
 
 
-def retrieve(query: str) -> List[Document]:
-    chroma = load_chroma()
-
-    final_k = max(settings.top_k, 8)
-    candidate_k = max(25, final_k)
-
-    queries = _expand_query(query)
-
-    results: List[Document] = []
-    for qq in queries[:8]:
-        results.extend(chroma.similarity_search(qq, k=candidate_k))
-
+def _finalize(query: str, results: List[Document], final_k: int) -> List[Document]:
     results = _dedupe(results)
 
     strict_rate = _strict_rate_filter(query)
@@ -204,3 +227,162 @@ def retrieve(query: str) -> List[Document]:
     results = _boost_sort(query, results)
 
     return results[:final_k]
+
+
+def _limits() -> Tuple[int, int]:
+    final_k = max(settings.top_k, 8)
+    candidate_k = max(25, final_k)
+    return final_k, candidate_k
+
+
+def _expansion_plan(queries: List[str]) -> Tuple[List[List[str]], List[str]]:
+    """
+    Per-query expansions plus the de-duplicated union across all queries.
+    Related queries share most expansions ("VAT rate" / "Value Added Tax rate"
+    differ only in the first one), so each unique expansion is searched once.
+    """
+    per_query = [_expand_query(q)[:8] for q in queries]
+    unique = list(dict.fromkeys(e for exps in per_query for e in exps))
+    return per_query, unique
+
+
+def _assemble(queries: List[str], per_query: List[List[str]], hits: Dict[str, List[Document]], final_k: int) -> List[List[Document]]:
+    out = []
+    for q, exps in zip(queries, per_query):
+        results = [d for e in exps for d in hits[e]]
+        out.append(_finalize(q, results, final_k))
+    return out
+
+
+def _search(chroma, query: str, k: int) -> List[Document]:
+    with VECTOR_SEARCH_SECONDS.time(mode="sync"):
+        return chroma.similarity_search(query, k=k)
+
+
+async def _asearch(chroma, query: str, k: int) -> List[Document]:
+    with VECTOR_SEARCH_SECONDS.time(mode="async"):
+        return await chroma.asimilarity_search(query, k=k)
+
+
+def retrieve_many(queries: List[str]) -> List[List[Document]]:
+    """retrieve() for several queries; expansions are shared and searched concurrently."""
+    if not queries:
+        return []
+    chroma = load_chroma()
+    final_k, candidate_k = _limits()
+
+    per_query, unique = _expansion_plan(queries)
+    searched = _SEARCH_POOL.map(lambda e: _search(chroma, e, candidate_k), unique)
+    hits = dict(zip(unique, searched))
+
+    return _assemble(queries, per_query, hits, final_k)
+
+
+async def aretrieve_many(queries: List[str]) -> List[List[Document]]:
+    """
+    Async retrieve_many(): the expanded queries run concurrently and the
+    blocking parts (Chroma client, strict filters over all chunks) run in threads.
+    """
+    if not queries:
+        return []
+    chroma = await asyncio.to_thread(load_chroma)
+    final_k, candidate_k = _limits()
+
+    per_query, unique = _expansion_plan(queries)
+    searched = await asyncio.gather(
+        *(_asearch(chroma, e, candidate_k) for e in unique)
+    )
+    hits = dict(zip(unique, searched))
+
+    return await asyncio.to_thread(_assemble, queries, per_query, hits, final_k)
+
+
+def _search_by_vectors(vectors: List[List[float]], k: int) -> List[List[Document]]:
+    """k nearest chunks for each vector, in a single Chroma query"""
+    # the LangChain wrapper only takes one vector per call; the collection takes many
+    got = load_collection().query(query_embeddings=vectors, n_results=k, include=["documents", "metadatas"])
+    return [
+        [Document(page_content=text or "", metadata=meta or {}, id=cid) for cid, text, meta in zip(ids, texts, metas)]
+        for ids, texts, metas in zip(got["ids"], got["documents"], got["metadatas"])
+    ]
+
+
+def retrieve_batch(queries: List[str]) -> List[List[Document]]:
+    """
+    retrieve_many() for a batch of independent questions: every unique expanded
+    query in the batch is embedded in ONE embeddings call and searched in ONE
+    Chroma query.
+    """
+    if not queries:
+        return []
+    chroma = load_chroma()
+    final_k, candidate_k = _limits()
+
+    per_query, unique = _expansion_plan(queries)
+    with VECTOR_SEARCH_SECONDS.time(mode="batch"):
+        vectors = chroma.embeddings.embed_documents(unique)
+        hits = dict(zip(unique, _search_by_vectors(vectors, candidate_k)))
+
+    return _assemble(queries, per_query, hits, final_k)
+
+
+async def aretrieve_batch(queries: List[str]) -> List[List[Document]]:
+    if not queries:
+        return []
+    chroma = await asyncio.to_thread(load_chroma)
+    final_k, candidate_k = _limits()
+
+    per_query, unique = _expansion_plan(queries)
+    with VECTOR_SEARCH_SECONDS.time(mode="batch"):
+        vectors = await chroma.embeddings.aembed_documents(unique)
+        searched = await asyncio.to_thread(_search_by_vectors, vectors, candidate_k)
+        hits = dict(zip(unique, searched))
+
+    return await asyncio.to_thread(_assemble, queries, per_query, hits, final_k)
+
+
+def retrieve(query: str) -> List[Document]:
+    return retrieve_many([query])[0]
+
+
+async def aretrieve(query: str) -> List[Document]:
+    return (await aretrieve_many([query]))[0]
+
+
+# (index generation, queries) -> concatenated results, for fixed query sets
+_FIXED_CACHE: Dict[Tuple[str, Tuple[str, ...]], List[Document]] = {}
+_FIXED_LOCK = threading.Lock()
+
+
+def _fixed_key(queries: List[str]) -> Tuple[str, Tuple[str, ...]]:
+    return (index_generation(), tuple(queries))
+
+
+def _store_fixed(key: Tuple[str, Tuple[str, ...]], batches: List[List[Document]]) -> List[Document]:
+    docs = [d for batch in batches for d in batch]
+    with _FIXED_LOCK:
+        # older generations can never be hit again
+        for k in [k for k in _FIXED_CACHE if k[0] != key[0]]:
+            del _FIXED_CACHE[k]
+        _FIXED_CACHE[key] = docs
+    return list(docs)
+
+
+def retrieve_fixed(queries: List[str]) -> List[Document]:
+    """
+    Concatenated retrieve() results for a FIXED query set (e.g. the VAT rate
+    lookups in answer_node), computed once per index generation.
+    """
+    key = _fixed_key(queries)
+    cached = _FIXED_CACHE.get(key)
+    if cached is not None:
+        return list(cached)
+    return _store_fixed(key, retrieve_many(queries))
+
+
+async def aretrieve_fixed(queries: List[str]) -> List[Document]:
+    key = _fixed_key(queries)
+    cached = _FIXED_CACHE.get(key)
+    if cached is not None:
+        return list(cached)
+    return _store_fixed(key, await aretrieve_many(queries))
@@ -0,0 +1,134 @@
+"""
+Single-flight request coalescing.
+
+When the same context-free question arrives several times at once (a trending
+topic), only the first caller runs the graph; the others wait for its result.
+Keys are the answer cache keys (index generation, route hint, normalized
+question), so a re-index never shares a run across generations.
+"""
+from __future__ import annotations
+
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, TypeVar
+
+from .config import settings
+from .metrics import REGISTRY
+
+T = TypeVar("T")
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    At most one in-flight computation per key; concurrent callers with the same
+    key share its result (or its exception).
+
+    Async and sync callers are tracked separately: async flights are tasks on
+    the caller's event loop, sync flights are plain threads waiting on an Event.
+    """
+
+    def __init__(self, name: str, enabled: bool = True):
+        self.name = name
+        self.enabled = enabled
+        self._tasks: Dict[Hashable, "asyncio.Task"] = {}
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self._stats = {"leaders": 0, "coalesced": 0}
+
+    # -----------------------------
+    # Async
+    # -----------------------------
+    async def run(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        if not self.enabled:
+            return await fn()
+
+        task = self._tasks.get(key)
+        if task is None:
+            # the run is its own task, so a leader whose client disconnects
+            # does not cancel the result everyone else is waiting for
+            task = asyncio.ensure_future(fn())
+            self._tasks[key] = task
+            task.add_done_callback(lambda t, k=key: self._tasks.pop(k, None) if self._tasks.get(k) is t else None)
+            self._count("leaders")
+        else:
+            self._count("coalesced")
+        return await asyncio.shield(task)
+
+    async def join(self, key: Hashable) -> Optional[Any]:
+        """Result of an async flight already running for `key`, or None if there is none"""
+        task = self._tasks.get(key) if self.enabled else None
+        if task is None:
+            return None
+        self._count("coalesced")
+        return await asyncio.shield(task)
+
+    # -----------------------------
+    # Sync
+    # -----------------------------
+    def run_sync(self, key: Hashable, fn: Callable[[], T]) -> T:
+        if not self.enabled:
+            return fn()
+
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._stats["leaders"] += 1
+            else:
+                self._stats["coalesced"] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    # -----------------------------
+    # Stats
+    # -----------------------------
+    def _count(self, what: str) -> None:
+        with self._lock:
+            self._stats[what] += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            s = dict(self._stats)
+            s["in_flight"] = len(self._tasks) + len(self._calls)
+        return s
+
+
+answer_flight = SingleFlight("answer", enabled=settings.single_flight)
+
+
+REGISTRY.counter(
+    "tax_single_flight_requests_total",
+    "Requests that ran the graph (leader) or waited for an identical in-flight run (coalesced)",
+    ["flight", "result"],
+    callback=lambda: {
+        (answer_flight.name, "leader"): answer_flight.stats()["leaders"],
+        (answer_flight.name, "coalesced"): answer_flight.stats()["coalesced"],
+    },
+)
+REGISTRY.gauge(
+    "tax_single_flight_in_flight", "Distinct computations currently being shared", ["flight"],
+    callback=lambda: {(answer_flight.name,): answer_flight.stats()["in_flight"]},
+)
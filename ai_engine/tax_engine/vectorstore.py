@@ -1,36 +1,114 @@
 from __future__ import annotations
 
 import hashlib
+import threading
+import time
 from typing import List, Dict, Any
 
+import chromadb
 from langchain_core.documents import Document
-from langchain_openai import OpenAIEmbeddings
+from langchain_core.embeddings import Embeddings
 from langchain_chroma import Chroma  # pip install -U langchain-chroma
 
 from .config import settings
+from . import providers
+
+
+# Stamp file next to the Chroma data; rewritten whenever the collection changes
+GENERATION_FILE = "index_generation.txt"
 
 
 def _sha1_text(text: str) -> str:
     return hashlib.sha1(text.encode("utf-8", errors="ignore")).hexdigest()
 
-def get_embeddings() -> OpenAIEmbeddings:
-    if not settings.openai_api_key:
-        raise RuntimeError(
-            "OPENAI_API_KEY is missing. Put it in a .env file at the project root "
-            "or set it in your terminal environment."
-        )
-    return OpenAIEmbeddings(api_key=settings.openai_api_key)
+
+# index_generation() is on every retrieval and cache lookup: the stamp file is
+# re-checked (stat, and a read only if its mtime moved) at most this often
+GENERATION_CHECK_SECONDS = 1.0
+_generation = {"value": None, "mtime": None, "checked": 0.0}
+_generation_lock = threading.Lock()
+
+
+def index_generation() -> str:
+    """
+    Identifier of the current index contents. Anything derived from the index
+    (memoized retrievals, cached answers) should be keyed on it.
+    Kept on disk so every worker process sees a rebuild (within
+    GENERATION_CHECK_SECONDS).
+    """
+    now = time.monotonic()
+    cached = _generation["value"]
+    if cached is not None and now - _generation["checked"] < GENERATION_CHECK_SECONDS:
+        return cached
+    with _generation_lock:
+        path = settings.chroma_dir / GENERATION_FILE
+        try:
+            mtime = path.stat().st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if _generation["value"] is None or mtime != _generation["mtime"]:
+            try:
+                _generation["value"] = path.read_text(encoding="utf-8").strip() or "0"
+            except FileNotFoundError:
+                _generation["value"] = "0"
+            _generation["mtime"] = mtime
+        _generation["checked"] = now
+        return _generation["value"]
+
+
+def _bump_generation() -> str:
+    gen = f"{time.time_ns():x}"
+    settings.chroma_dir.mkdir(parents=True, exist_ok=True)
+    path = settings.chroma_dir / GENERATION_FILE
+    path.write_text(gen, encoding="utf-8")
+    with _generation_lock:  # this process sees its own rebuild at once
+        _generation.update(value=gen, mtime=path.stat().st_mtime_ns, checked=time.monotonic())
+    return gen
+
+def get_embeddings() -> Embeddings:
+    """Embedding model for EMBEDDING_PROVIDER (OpenAI by default)"""
+    return providers.embeddings()
+
+_CHROMA: Dict[tuple, Chroma] = {}
+_COLLECTIONS: Dict[tuple, "chromadb.Collection"] = {}
+_CHROMA_LOCK = threading.Lock()
+
+
+def _chroma_key() -> tuple:
+    return (str(settings.chroma_dir), providers.collection_name("nigeria_tax_bills"))
+
 
 def load_chroma() -> Chroma:
     """
     Always open the SAME persistent Chroma DB regardless of current working directory.
+    One client per process: building clients concurrently races inside chromadb
+    ("Could not connect to tenant default_tenant") and costs a few ms per query.
     """
-    settings.chroma_dir.mkdir(parents=True, exist_ok=True)
-    return Chroma(
-        collection_name="nigeria_tax_bills",
-        persist_directory=str(settings.chroma_dir),  # ✅ absolute path from config.py
-        embedding_function=get_embeddings(),
-    )
+    key = _chroma_key()
+    chroma = _CHROMA.get(key)
+    if chroma is not None:
+        return chroma
+    with _CHROMA_LOCK:
+        if key not in _CHROMA:
+            settings.chroma_dir.mkdir(parents=True, exist_ok=True)
+            client = chromadb.PersistentClient(path=key[0])  # ✅ absolute path from config.py
+            chroma = Chroma(
+                collection_name=key[1],
+                client=client,
+                embedding_function=get_embeddings(),
+            )  # creates the collection if it is missing
+            _COLLECTIONS[key] = client.get_collection(key[1])
+            _CHROMA[key] = chroma
+        return _CHROMA[key]
+
+
+def load_collection() -> "chromadb.Collection":
+    """
+    The chromadb collection behind load_chroma(), for what the LangChain
+    wrapper does not offer (e.g. searching many vectors in one query).
+    """
+    load_chroma()
+    return _COLLECTIONS[_chroma_key()]
 
 
 def upsert_incremental(all_docs: List[Document], batch_size: int = 200) -> Dict[str, Any]:
@@ -131,6 +209,9 @@ def upsert_incremental(all_docs: List[Document], batch_size: int = 200) -> Dict[
     if to_add:
         chroma.add_documents([incoming[cid] for cid in to_add], ids=to_add)
 
+    if to_add or to_update or to_delete_dupes:
+        _bump_generation()
+
     return {
         "total_input_docs": len(all_docs),
         "existing_store_docs_before": len(existing_ids),
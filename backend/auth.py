@@ -6,12 +6,13 @@ from typing import Optional, Dict, Any
 import secrets
 import uuid
 
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text
 
-from database import get_db
+from database import get_async_db
 from security import (
-    hash_password, verify_password, create_access_token, decode_access_token,
+    hash_password_async, verify_password_async, password_needs_rehash,
+    create_access_token, decode_access_token,
     generate_reset_token, verify_reset_token, get_password_reset_expiry,
     validate_password_strength, validate_email
 )
@@ -20,6 +21,8 @@ from errors import (
     NotFoundError, RateLimitError, create_error_response
 )
 from rate_limiter import rate_limit, get_client_ip
+from log_sink import log_sink
+from auth_cache import user_cache, cache_user, invalidate_user
 
 router = APIRouter()
 security = HTTPBearer(auto_error=False)
@@ -93,7 +96,7 @@ class Token(BaseModel):
 # Helper Functions
 async def get_current_user(
     credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ) -> Optional[Dict[str, Any]]:
     """Get current authenticated user"""
     if not credentials:
@@ -107,18 +110,22 @@ async def get_current_user(
     
     user_id = int(payload.get("sub"))
     
+    cached = user_cache.get(user_id)
+    if cached is not None:
+        return dict(cached)
+    
     # Get user from database
-    result = db.execute(
+    result = (await db.execute(
         text("""
             SELECT id, email, username, full_name, is_verified, created_at
             FROM users 
             WHERE id = :user_id AND is_active = TRUE
         """),
         {"user_id": user_id}
-    ).fetchone()
+    )).fetchone()
     
     if result:
-        return {
+        user = {
             "id": result[0],
             "email": result[1],
             "username": result[2],
@@ -126,10 +133,12 @@ async def get_current_user(
             "is_verified": result[4],
             "created_at": result[5]
         }
+        cache_user(user)
+        return user
     
     return None
 
-def check_account_lockout(user: Dict[str, Any], db: Session) -> bool:
+def check_account_lockout(user: Dict[str, Any], db: AsyncSession) -> bool:
     """Check if account is locked"""
     if user.get("locked_until"):
         locked_until = user["locked_until"]
@@ -143,7 +152,7 @@ def check_account_lockout(user: Dict[str, Any], db: Session) -> bool:
 async def register(
     request: Request,
     user: UserCreate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Register a new user"""
     # Validate email
@@ -154,10 +163,10 @@ async def register(
         )
     
     # Check if email exists
-    existing_email = db.execute(
+    existing_email = (await db.execute(
         text("SELECT id FROM users WHERE email = :email"),
         {"email": user.email}
-    ).fetchone()
+    )).fetchone()
     
     if existing_email:
         raise ValidationException(
@@ -166,10 +175,10 @@ async def register(
         )
     
     # Check if username exists
-    existing_username = db.execute(
+    existing_username = (await db.execute(
         text("SELECT id FROM users WHERE username = :username"),
         {"username": user.username}
-    ).fetchone()
+    )).fetchone()
     
     if existing_username:
         raise ValidationException(
@@ -178,10 +187,10 @@ async def register(
         )
     
     # Hash password
-    hashed_password = hash_password(user.password)
+    hashed_password = await hash_password_async(user.password)
     
     # Create user
-    result = db.execute(
+    result = await db.execute(
         text("""
             INSERT INTO users (email, username, password_hash, full_name)
             VALUES (:email, :username, :password_hash, :full_name)
@@ -193,7 +202,7 @@ async def register(
             "full_name": user.full_name
         }
     )
-    db.commit()
+    await db.commit()
     
     user_id = result.lastrowid
     
@@ -201,23 +210,17 @@ async def register(
     access_token = create_access_token(user_id)
     
     # Get user data for response
-    user_data = db.execute(
+    user_data = (await db.execute(
         text("""
             SELECT id, email, username, full_name, is_verified, created_at
             FROM users WHERE id = :user_id
         """),
         {"user_id": user_id}
-    ).fetchone()
+    )).fetchone()
+    cache_user(dict(zip(("id", "email", "username", "full_name", "is_verified", "created_at"), user_data)))
     
     # Log registration
-    db.execute(
-        text("""
-            INSERT INTO system_logs (level, service, message, ip_address, user_id)
-            VALUES ('INFO', 'auth', 'User registered', :ip, :user_id)
-        """),
-        {"ip": get_client_ip(request), "user_id": user_id}
-    )
-    db.commit()
+    await log_sink.log("INFO", "auth", "User registered", ip=get_client_ip(request), user_id=user_id)
     
     return Token(
         access_token=access_token,
@@ -238,11 +241,11 @@ async def register(
 async def login(
     request: Request,
     user: UserLogin,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Login user"""
     # Get user
-    result = db.execute(
+    result = (await db.execute(
         text("""
             SELECT id, email, username, password_hash, full_name, 
                    is_verified, created_at, failed_login_attempts, locked_until
@@ -250,18 +253,11 @@ async def login(
             WHERE email = :email AND is_active = TRUE
         """),
         {"email": user.email}
-    ).fetchone()
+    )).fetchone()
     
     if not result:
         # Log failed attempt
-        db.execute(
-            text("""
-                INSERT INTO system_logs (level, service, message, ip_address)
-                VALUES ('WARN', 'auth', 'Failed login attempt - user not found', :ip)
-            """),
-            {"ip": get_client_ip(request)}
-        )
-        db.commit()
+        await log_sink.log("WARN", "auth", "Failed login attempt - user not found", ip=get_client_ip(request))
         
         raise AuthenticationError(
             message="Invalid email or password",
@@ -279,14 +275,14 @@ async def login(
         )
     
     # Verify password
-    if not verify_password(user.password, password_hash):
+    if not await verify_password_async(user.password, password_hash):
         # Increment failed attempts
         failed_attempts = failed_attempts + 1 if failed_attempts else 1
         
         # Lock account after 5 failed attempts
         if failed_attempts >= 5:
             locked_until = datetime.utcnow() + timedelta(minutes=15)
-            db.execute(
+            await db.execute(
                 text("""
                     UPDATE users 
                     SET failed_login_attempts = :attempts, locked_until = :locked_until
@@ -298,15 +294,11 @@ async def login(
                     "user_id": user_id
                 }
             )
+            await db.commit()
+            invalidate_user(user_id)
             
             # Log account lock
-            db.execute(
-                text("""
-                    INSERT INTO system_logs (level, service, message, ip_address, user_id)
-                    VALUES ('WARN', 'auth', 'Account locked due to failed attempts', :ip, :user_id)
-                """),
-                {"ip": get_client_ip(request), "user_id": user_id}
-            )
+            await log_sink.log("WARN", "auth", "Account locked due to failed attempts", ip=get_client_ip(request), user_id=user_id)
             
             raise AuthenticationError(
                 message="Account temporarily locked",
@@ -314,50 +306,49 @@ async def login(
             )
         else:
             # Update failed attempts
-            db.execute(
+            await db.execute(
                 text("UPDATE users SET failed_login_attempts = :attempts WHERE id = :user_id"),
                 {"attempts": failed_attempts, "user_id": user_id}
             )
         
-        db.commit()
+        await db.commit()
         
         # Log failed attempt
-        db.execute(
-            text("""
-                INSERT INTO system_logs (level, service, message, ip_address, user_id)
-                VALUES ('WARN', 'auth', 'Failed login attempt - wrong password', :ip, :user_id)
-            """),
-            {"ip": get_client_ip(request), "user_id": user_id}
-        )
-        db.commit()
+        await log_sink.log("WARN", "auth", "Failed login attempt - wrong password", ip=get_client_ip(request), user_id=user_id)
         
         raise AuthenticationError(
             message="Invalid email or password",
             detail=f"{5 - failed_attempts} attempts remaining"
         )
     
+    # Rehash with the current cost if BCRYPT_ROUNDS changed since the hash was made
+    if password_needs_rehash(password_hash):
+        password_hash = await hash_password_async(user.password)
+    
     # Reset failed attempts on successful login
-    db.execute(
+    await db.execute(
         text("""
             UPDATE users 
-            SET failed_login_attempts = 0, locked_until = NULL
+            SET failed_login_attempts = 0, locked_until = NULL, password_hash = :password_hash
             WHERE id = :user_id
         """),
-        {"user_id": user_id}
+        {"user_id": user_id, "password_hash": password_hash}
     )
+    await db.commit()
     
     # Create access token
     access_token = create_access_token(user_id)
+    cache_user({
+        "id": user_id,
+        "email": email,
+        "username": username,
+        "full_name": full_name,
+        "is_verified": is_verified,
+        "created_at": created_at
+    })
     
     # Log successful login
-    db.execute(
-        text("""
-            INSERT INTO system_logs (level, service, message, ip_address, user_id)
-            VALUES ('INFO', 'auth', 'User logged in', :ip, :user_id)
-        """),
-        {"ip": get_client_ip(request), "user_id": user_id}
-    )
-    db.commit()
+    await log_sink.log("INFO", "auth", "User logged in", ip=get_client_ip(request), user_id=user_id)
     
     return Token(
         access_token=access_token,
@@ -376,7 +367,7 @@ async def login(
 @router.get("/me", response_model=UserResponse)
 async def get_current_user_info(
     current_user: Dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get current user information"""
     if not current_user:
@@ -391,7 +382,7 @@ async def get_current_user_info(
 async def update_profile(
     update_data: UserUpdate,
     current_user: Dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Update user profile"""
     if not current_user:
@@ -401,20 +392,21 @@ async def update_profile(
         )
     
     # Update user profile
-    db.execute(
+    await db.execute(
         text("UPDATE users SET full_name = :full_name WHERE id = :user_id"),
         {"full_name": update_data.full_name, "user_id": current_user["id"]}
     )
-    db.commit()
+    await db.commit()
+    invalidate_user(current_user["id"])
     
     # Get updated user
-    user_data = db.execute(
+    user_data = (await db.execute(
         text("""
             SELECT id, email, username, full_name, is_verified, created_at
             FROM users WHERE id = :user_id
         """),
         {"user_id": current_user["id"]}
-    ).fetchone()
+    )).fetchone()
     
     return {
         "message": "Profile updated successfully",
@@ -432,7 +424,7 @@ async def update_profile(
 async def change_password(
     password_data: PasswordChange,
     current_user: Dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Change user password"""
     if not current_user:
@@ -442,10 +434,10 @@ async def change_password(
         )
     
     # Get current password hash
-    result = db.execute(
+    result = (await db.execute(
         text("SELECT password_hash FROM users WHERE id = :user_id"),
         {"user_id": current_user["id"]}
-    ).fetchone()
+    )).fetchone()
     
     if not result:
         raise NotFoundError(resource="User")
@@ -453,31 +445,25 @@ async def change_password(
     current_password_hash = result[0]
     
     # Verify current password
-    if not verify_password(password_data.current_password, current_password_hash):
+    if not await verify_password_async(password_data.current_password, current_password_hash):
         raise AuthenticationError(
             message="Current password is incorrect",
             detail="Please enter your current password correctly"
         )
     
     # Hash new password
-    new_password_hash = hash_password(password_data.new_password)
+    new_password_hash = await hash_password_async(password_data.new_password)
     
     # Update password
-    db.execute(
+    await db.execute(
         text("UPDATE users SET password_hash = :password_hash WHERE id = :user_id"),
         {"password_hash": new_password_hash, "user_id": current_user["id"]}
     )
-    db.commit()
+    await db.commit()
+    invalidate_user(current_user["id"])
     
     # Log password change
-    db.execute(
-        text("""
-            INSERT INTO system_logs (level, service, message, user_id)
-            VALUES ('INFO', 'auth', 'Password changed', :user_id)
-        """),
-        {"user_id": current_user["id"]}
-    )
-    db.commit()
+    await log_sink.log("INFO", "auth", "Password changed", user_id=current_user["id"])
     
     return {"message": "Password changed successfully"}
 
@@ -486,14 +472,14 @@ async def change_password(
 async def forgot_password(
     request: Request,
     reset_request: PasswordResetRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Request password reset"""
     # Find user by email
-    result = db.execute(
+    result = (await db.execute(
         text("SELECT id, email, full_name FROM users WHERE email = :email AND is_active = TRUE"),
         {"email": reset_request.email}
-    ).fetchone()
+    )).fetchone()
     
     if not result:
         # Don't reveal if user exists (security best practice)
@@ -508,13 +494,13 @@ async def forgot_password(
     expires_at = get_password_reset_expiry()
     
     # Invalidate any existing reset tokens for this user
-    db.execute(
+    await db.execute(
         text("UPDATE password_reset_tokens SET used = TRUE WHERE user_id = :user_id AND used = FALSE"),
         {"user_id": user_id}
     )
     
     # Store new token
-    db.execute(
+    await db.execute(
         text("""
             INSERT INTO password_reset_tokens (user_id, token, expires_at)
             VALUES (:user_id, :token, :expires_at)
@@ -525,21 +511,14 @@ async def forgot_password(
             "expires_at": expires_at
         }
     )
-    db.commit()
+    await db.commit()
     
     # In a real app, you would send an email here
     # For demo purposes, we'll return the token
     # In production: send_email(user.email, "Password Reset", f"Token: {token}")
     
     # Log reset request
-    db.execute(
-        text("""
-            INSERT INTO system_logs (level, service, message, ip_address, user_id)
-            VALUES ('INFO', 'auth', 'Password reset requested', :ip, :user_id)
-        """),
-        {"ip": get_client_ip(request), "user_id": user_id}
-    )
-    db.commit()
+    await log_sink.log("INFO", "auth", "Password reset requested", ip=get_client_ip(request), user_id=user_id)
     
     return {
         "message": "Password reset instructions sent",
@@ -550,11 +529,11 @@ async def forgot_password(
 @router.post("/reset-password")
 async def reset_password(
     reset_data: PasswordResetConfirm,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Reset password using token"""
     # Find valid reset token
-    result = db.execute(
+    result = (await db.execute(
         text("""
             SELECT prt.id, prt.user_id, prt.token, prt.expires_at, prt.used
             FROM password_reset_tokens prt
@@ -563,7 +542,7 @@ async def reset_password(
             AND prt.used = FALSE
             AND u.is_active = TRUE
         """)
-    ).fetchall()
+    )).fetchall()
     
     token_found = None
     for token_record in result:
@@ -580,16 +559,16 @@ async def reset_password(
     token_id, user_id, _, expires_at, used = token_found
     
     # Mark token as used
-    db.execute(
+    await db.execute(
         text("UPDATE password_reset_tokens SET used = TRUE WHERE id = :token_id"),
         {"token_id": token_id}
     )
     
     # Hash new password
-    new_password_hash = hash_password(reset_data.new_password)
+    new_password_hash = await hash_password_async(reset_data.new_password)
     
     # Update user password and reset failed attempts
-    db.execute(
+    await db.execute(
         text("""
             UPDATE users 
             SET password_hash = :password_hash, 
@@ -600,17 +579,11 @@ async def reset_password(
         {"password_hash": new_password_hash, "user_id": user_id}
     )
     
-    db.commit()
+    await db.commit()
+    invalidate_user(user_id)
     
     # Log password reset
-    db.execute(
-        text("""
-            INSERT INTO system_logs (level, service, message, user_id)
-            VALUES ('INFO', 'auth', 'Password reset completed', :user_id)
-        """),
-        {"user_id": user_id}
-    )
-    db.commit()
+    await log_sink.log("INFO", "auth", "Password reset completed", user_id=user_id)
     
     return {"message": "Password reset successfully. You can now login with your new password."}
 
@@ -618,7 +591,7 @@ async def reset_password(
 async def logout(
     current_user: Dict = Depends(get_current_user),
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Logout user (in JWT, we can't invalidate token, but we can log it)"""
     if not current_user or not credentials:
@@ -628,14 +601,7 @@ async def logout(
         )
     
     # Log logout action
-    db.execute(
-        text("""
-            INSERT INTO system_logs (level, service, message, user_id)
-            VALUES ('INFO', 'auth', 'User logged out', :user_id)
-        """),
-        {"user_id": current_user["id"]}
-    )
-    db.commit()
+    await log_sink.log("INFO", "auth", "User logged out", user_id=current_user["id"])
     
     return {"message": "Logged out successfully"}
 
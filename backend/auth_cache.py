@@ -0,0 +1,100 @@
+"""
+In-process caches for authentication.
+
+get_current_user runs on every authenticated request; these caches let it
+skip both the JWT signature check and the users SELECT for a user seen
+recently:
+
+  token_cache  token -> decoded payload, kept until the token expires
+  user_cache   user_id -> user record, kept for USER_CACHE_TTL seconds
+
+The user cache is filled on register/login and invalidated when the record
+or the account state changes (profile update, password change or reset,
+lockout). Caches are per worker process: a change made through another
+worker, or directly in the database (e.g. deactivating a user), is seen
+here within USER_CACHE_TTL at the latest.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "60"))
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+
+
+class TTLCache:
+    """Bounded LRU cache whose entries expire after a default or per-entry TTL"""
+
+    def __init__(self, name: str, max_entries: int, ttl_seconds: float):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()  # key -> (value, expires at)
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.ttl_seconds > 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= now:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """Store `value`; `ttl` overrides the default lifetime (capped by it)"""
+        if not self.enabled:
+            return
+        ttl = self.ttl_seconds if ttl is None else min(ttl, self.ttl_seconds)
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, time.time() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self._stats["invalidations"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            s = dict(self._stats)
+            s["size"] = len(self._entries)
+        return s
+
+
+user_cache = TTLCache("user", USER_CACHE_SIZE, USER_CACHE_TTL)
+# entries live for the token's remaining lifetime (put() passes it); the default only caps it
+token_cache = TTLCache("token", TOKEN_CACHE_SIZE, float("inf"))
+
+
+def cache_user(user: Dict[str, Any]) -> None:
+    user_cache.put(user["id"], dict(user))
+
+
+def invalidate_user(user_id: int) -> None:
+    """Drop a cached user record; call after any change to the user's row"""
+    user_cache.invalidate(user_id)
@@ -1,22 +1,31 @@
-from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Depends, Query, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, ConfigDict, Field, validator
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, AsyncIterator, Set, Tuple
 from datetime import datetime
+import asyncio
+import base64
+import hashlib
 import uuid
 import json
 import sys
 import os
 from pathlib import Path
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 import traceback
+import threading
+import time
+from collections import OrderedDict
 
 # Database
-from database import get_db
-from sqlalchemy import text
+from database import get_async_db, db_manager
+from sqlalchemy import bindparam, text
 
 # Import auth and rate limiting
 from auth import get_current_user_dependency as get_current_user
 from rate_limiter import rate_limit, get_client_ip
+from log_sink import log_sink
+from responses import FastJSONResponse, json_response, make_etag, not_modified
 from errors import (
     AppException, ValidationException, NotFoundError,
     AuthenticationError, create_error_response
@@ -28,27 +37,94 @@ PROJECT_ROOT = CURRENT_DIR.parent  # project_root/
 if str(PROJECT_ROOT) not in sys.path:
     sys.path.insert(0, str(PROJECT_ROOT))
 
-# AI Engine imports
-try:
-    from ai_engine.tax_engine.agent_graph import build_graph
-    from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
-    AI_ENGINE_AVAILABLE = True
-except ImportError as e:
-    print(f"⚠️ AI Engine import failed: {e}")
-    AI_ENGINE_AVAILABLE = False
-
 router = APIRouter()
 
-# Initialize AI Graph
+# AI engine: imported and built by load_ai_engine(), on the first chat or by the
+# startup warm-up, so importing this module (and binding the server) does not
+# pull in langchain/langgraph/chromadb or create the LLM clients.
+AI_ENGINE_AVAILABLE = False
 ai_graph = None
-if AI_ENGINE_AVAILABLE:
+batch_graph = None  # stateless twin of ai_graph for /chat/batch (no sessions, nothing checkpointed)
+answer_cache = None
+answer_flight = None
+_ai_engine_loaded = False
+_ai_engine_lock = threading.Lock()
+
+# Startup warm-up state, reported by GET /ready
+ai_engine_status: Dict[str, Any] = {"state": "cold", "seconds": None, "steps": {}, "error": None}
+
+
+def load_ai_engine() -> bool:
+    """Import the AI engine and build the graphs (once per process). Returns AI_ENGINE_AVAILABLE."""
+    global AI_ENGINE_AVAILABLE, ai_graph, batch_graph, answer_cache, answer_flight, _ai_engine_loaded
+    global build_graph, abatch_inputs, is_context_free, question_key, route_hint
+    global HumanMessage, AIMessage, AIMessageChunk, SystemMessage
+
+    if _ai_engine_loaded:
+        return AI_ENGINE_AVAILABLE
+
+    with _ai_engine_lock:
+        if _ai_engine_loaded:
+            return AI_ENGINE_AVAILABLE
+        try:
+            from ai_engine.tax_engine.agent_graph import build_graph, abatch_inputs
+            from ai_engine.tax_engine.answer_cache import answer_cache, is_context_free, question_key, route_hint
+            from ai_engine.tax_engine.singleflight import answer_flight
+            from langchain_core.messages import HumanMessage, AIMessage, AIMessageChunk, SystemMessage
+
+            ai_graph = build_graph()
+            batch_graph = build_graph(checkpoint=False)
+            AI_ENGINE_AVAILABLE = True
+            print(" AI Engine graph built successfully")
+        except ImportError as e:
+            print(f"⚠️ AI Engine import failed: {e}")
+        except Exception as e:
+            print(f" AI Engine initialization failed: {e}")
+            traceback.print_exc()
+        _ai_engine_loaded = True
+    return AI_ENGINE_AVAILABLE
+
+
+async def aload_ai_engine() -> bool:
+    """load_ai_engine() off the event loop"""
+    if _ai_engine_loaded:
+        return AI_ENGINE_AVAILABLE
+    return await asyncio.to_thread(load_ai_engine)
+
+
+async def warm_up_ai_engine() -> None:
+    """
+    Load the AI engine and pay its first-request costs (vector store, chunk
+    cache, embeddings client, ...) before /ready reports the worker ready.
+    """
+    ai_engine_status.update(state="loading", error=None)
+    t0 = time.perf_counter()
     try:
-        ai_graph = build_graph()
-        print(" AI Engine graph built successfully")
+        if not await aload_ai_engine():
+            raise RuntimeError("AI engine unavailable")
+        steps = {"import_and_build": round(time.perf_counter() - t0, 3)}
+
+        from ai_engine.tax_engine.agent_graph import warm_up
+        steps.update(await asyncio.to_thread(warm_up))
+
+        ai_engine_status.update(state="ready", steps=steps)
+        print(f"🔥 AI engine warm in {time.perf_counter() - t0:.2f}s: {steps}")
     except Exception as e:
-        print(f" AI Engine initialization failed: {e}")
-        traceback.print_exc()
-        AI_ENGINE_AVAILABLE = False
+        ai_engine_status.update(state="failed", error=str(e))
+        print(f" AI engine warm-up failed: {e}")
+    finally:
+        ai_engine_status["seconds"] = round(time.perf_counter() - t0, 3)
+
+# Graph nodes whose LLM tokens are streamed to the client
+STREAM_NODES = ("smalltalk", "clarify", "answer")
+
+# Max graph runs in flight per worker; extra chats wait instead of piling onto the LLM API
+AI_MAX_CONCURRENCY = int(os.getenv("AI_MAX_CONCURRENCY", "32"))
+graph_semaphore = asyncio.Semaphore(AI_MAX_CONCURRENCY)
+
+# /chat/batch: questions per request, and graph runs in flight per batch
+CHAT_BATCH_MAX_QUESTIONS = int(os.getenv("CHAT_BATCH_MAX_QUESTIONS", "500"))
+CHAT_BATCH_CONCURRENCY = int(os.getenv("CHAT_BATCH_CONCURRENCY", "8"))
 
 # Pydanti models
 class Citation(BaseModel):
@@ -83,6 +159,21 @@ class ChatRequest(BaseModel):
             raise ValueError('Message is too long')
         return v
 
+class BatchQuestion(BaseModel):
+    id: Optional[str] = Field(None, max_length=100)
+    message: str = Field(..., min_length=1, max_length=2000)
+
+    @validator('message')
+    def validate_message(cls, v):
+        v = v.strip()
+        if not v:
+            raise ValueError('Message cannot be empty')
+        return v
+
+class BatchRequest(BaseModel):
+    questions: List[BatchQuestion] = Field(..., min_length=1, max_length=CHAT_BATCH_MAX_QUESTIONS)
+    concurrency: Optional[int] = Field(None, ge=1, le=CHAT_BATCH_CONCURRENCY)
+
 class ChatResponse(BaseModel):
     answer: str
     session_id: str
@@ -98,6 +189,8 @@ class HistoryResponse(BaseModel):
     messages: List[MessageRead]
     created_at: datetime
     updated_at: datetime
+    has_more: bool = False  # older messages exist; fetch them with before_id=next_before_id
+    next_before_id: Optional[int] = None
 
 class ConversationItem(BaseModel):
     session_id: str
@@ -106,101 +199,97 @@ class ConversationItem(BaseModel):
     created_at: datetime
     updated_at: datetime
     last_message: Optional[str] = None
+    last_message_at: Optional[datetime] = None
+
+DEFAULT_CONVERSATION_TITLE = "New Conversation"
+
+def _conversation_title(message: str) -> str:
+    """Title of a conversation, taken from its first user message"""
+    return message[:50] + "..." if len(message) > 50 else message
 
-def get_or_create_conversation(
-    db: Session, 
+def _message_preview(content: str) -> str:
+    """conversations.last_message: the start of the message on one line"""
+    preview = " ".join(str(content or "").split())
+    return preview[:100] + "..." if len(preview) > 100 else preview
+
+async def _upsert_conversation(
+    db: AsyncSession,
+    session_id: str,
+    user_id: Optional[int] = None,
+    title: str = DEFAULT_CONVERSATION_TITLE,
+    new_message: Optional[str] = None
+) -> int:
+    """
+    Create the conversation or touch the existing one, in a single statement,
+    and return its id. An untitled conversation takes `title`; the owner is
+    only set if it was missing. With `new_message`, the summary columns
+    (message_count, last_message, last_message_at) already count the message
+    the caller is about to insert with _insert_message(..., touch=False).
+    Does not commit.
+    """
+    params = {
+        "session_id": session_id,
+        "user_id": user_id,
+        "title": title,
+        "default_title": DEFAULT_CONVERSATION_TITLE,
+        "added": 1 if new_message is not None else 0,
+        "last_message": _message_preview(new_message) if new_message is not None else None
+    }
+
+    if db.get_bind().dialect.name == "mysql":
+        # LAST_INSERT_ID(id) makes lastrowid the existing row's id on a duplicate key
+        result = await db.execute(
+            text("""
+                INSERT INTO conversations (session_id, user_id, title, message_count, last_message, last_message_at)
+                VALUES (:session_id, :user_id, :title, :added, :last_message,
+                        CASE WHEN :added = 1 THEN NOW() END)
+                ON DUPLICATE KEY UPDATE
+                    id = LAST_INSERT_ID(id),
+                    user_id = COALESCE(user_id, VALUES(user_id)),
+                    title = CASE WHEN title = :default_title THEN VALUES(title) ELSE title END,
+                    message_count = message_count + VALUES(message_count),
+                    last_message = COALESCE(VALUES(last_message), last_message),
+                    last_message_at = COALESCE(VALUES(last_message_at), last_message_at),
+                    updated_at = NOW()
+            """),
+            params
+        )
+        return result.lastrowid
+
+    # SQLite / PostgreSQL
+    return (await db.execute(
+        text("""
+            INSERT INTO conversations (session_id, user_id, title, message_count, last_message, last_message_at)
+            VALUES (:session_id, :user_id, :title, :added, :last_message,
+                    CASE WHEN :added = 1 THEN NOW() END)
+            ON CONFLICT (session_id) DO UPDATE SET
+                user_id = COALESCE(conversations.user_id, excluded.user_id),
+                title = CASE WHEN conversations.title = :default_title
+                             THEN excluded.title ELSE conversations.title END,
+                message_count = conversations.message_count + excluded.message_count,
+                last_message = COALESCE(excluded.last_message, conversations.last_message),
+                last_message_at = COALESCE(excluded.last_message_at, conversations.last_message_at),
+                updated_at = CURRENT_TIMESTAMP
+            RETURNING id
+        """),
+        params
+    )).scalar()
+
+async def get_or_create_conversation(
+    db: AsyncSession, 
     session_id: str, 
     user_id: Optional[int] = None
 ) -> int:
     """Get existing conversation or create new one"""
     try:
         print(f"🔍 Conversation lookup - Session: {session_id}, User: {user_id}")
-        
-        # Check if conversation exists
-        if user_id:
-            result = db.execute(
-                text("""
-                    SELECT id, user_id FROM conversations 
-                    WHERE session_id = :session_id
-                """),
-                {"session_id": session_id}
-            ).fetchone()
-        else:
-            result = db.execute(
-                text("SELECT id, user_id FROM conversations WHERE session_id = :session_id"),
-                {"session_id": session_id}
-            ).fetchone()
-        
-        if result:
-            conv_id, existing_user_id = result
-            
-            # Update conversation with user_id if not set
-            if user_id and not existing_user_id:
-                db.execute(
-                    text("""
-                        UPDATE conversations 
-                        SET updated_at = NOW(), user_id = :user_id 
-                        WHERE id = :id
-                    """),
-                    {"user_id": user_id, "id": conv_id}
-                )
-            else:
-                db.execute(
-                    text("UPDATE conversations SET updated_at = NOW() WHERE id = :id"),
-                    {"id": conv_id}
-                )
-            db.commit()
-            
-            print(f" Found existing conversation: {conv_id}")
-            return conv_id
-        else:
-            # Create new conversation
-            print(f" Creating new conversation for session: {session_id}")
-            
-            if user_id:
-                result = db.execute(
-                    text("""
-                        INSERT INTO conversations (session_id, user_id, title) 
-                        VALUES (:session_id, :user_id, :title)
-                    """),
-                    {
-                        "session_id": session_id,
-                        "user_id": user_id,
-                        "title": "New Conversation"
-                    }
-                )
-            else:
-                result = db.execute(
-                    text("""
-                        INSERT INTO conversations (session_id, title) 
-                        VALUES (:session_id, :title)
-                    """),
-                    {"session_id": session_id, "title": "New Conversation"}
-                )
-            
-            db.commit()
-            
-            # Get the new ID
-            result = db.execute(
-                text("SELECT id FROM conversations WHERE session_id = :session_id"),
-                {"session_id": session_id}
-            ).fetchone()
-            
-            if result:
-                conv_id = result[0]
-                print(f" Created new conversation: {conv_id}")
-                return conv_id
-            else:
-                raise AppException(
-                    error_code="CONVERSATION_CREATION_FAILED",
-                    message="Failed to create conversation",
-                    status_code=500
-                )
+        conv_id = await _upsert_conversation(db, session_id, user_id)
+        await db.commit()
+        print(f" Conversation ready: {conv_id}")
+        return conv_id
                 
-    except AppException:
-        raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         print(f" Database error: {e}")
         traceback.print_exc()
         raise AppException(
@@ -210,8 +299,147 @@ def get_or_create_conversation(
             detail=str(e)
         )
 
-def save_message(
-    db: Session, 
+# Rows of the citations table never change once written, so both directions
+# of the lookup are cached per process (bounded LRU)
+CITATION_CACHE_SIZE = 10000
+_citation_ids: "OrderedDict[Tuple[str, str, str], int]" = OrderedDict()  # (generation, chunk_id, quote_hash) -> id
+_citation_models: "OrderedDict[int, Citation]" = OrderedDict()  # id -> Citation
+
+def _cache_put(cache: OrderedDict, key, value) -> None:
+    cache[key] = value
+    cache.move_to_end(key)
+    while len(cache) > CITATION_CACHE_SIZE:
+        cache.popitem(last=False)
+
+def _citation_generation() -> str:
+    """Index generation the citations were retrieved from (the engine is loaded once there is an answer)"""
+    try:
+        from ai_engine.tax_engine.vectorstore import index_generation
+        return index_generation()
+    except Exception:
+        return "0"
+
+async def _store_citations(db: AsyncSession, citations: List[Dict]) -> List[int]:
+    """
+    Ids of `citations` in the citations table, inserting the ones not stored
+    yet. A clause quoted by many answers is stored once per index generation.
+    Does not commit: ids read in this transaction wait in db.info until the
+    caller commits (_citations_committed) or rolls back (_citations_rolled_back),
+    so the cache never holds an id whose row was rolled back.
+    """
+    generation = _citation_generation()
+    keyed = [
+        ((generation, str(c.get("chunk_id", "")), hashlib.sha1(str(c.get("quote", "")).encode("utf-8")).hexdigest()), c)
+        for c in citations
+    ]
+    pending = db.info.setdefault("citation_ids", {})
+    known = {key: _citation_ids.get(key, pending.get(key)) for key, _ in keyed}
+    missing = {key: c for key, c in keyed if known[key] is None}
+
+    if missing:
+        ignore = "INSERT IGNORE" if db.get_bind().dialect.name == "mysql" else "INSERT OR IGNORE"
+        await db.execute(
+            text(f"""
+                {ignore} INTO citations (generation, chunk_id, quote_hash, source, pages, quote)
+                VALUES (:generation, :chunk_id, :quote_hash, :source, :pages, :quote)
+            """),
+            [
+                {
+                    "generation": key[0], "chunk_id": key[1], "quote_hash": key[2],
+                    "source": str(c.get("source", "")), "pages": str(c.get("pages", "")), "quote": str(c.get("quote", ""))
+                }
+                for key, c in missing.items()
+            ]
+        )
+        rows = await db.execute(
+            text("""
+                SELECT id, chunk_id, quote_hash FROM citations
+                WHERE generation = :generation AND quote_hash IN :hashes
+            """).bindparams(bindparam("hashes", expanding=True)),
+            {"generation": generation, "hashes": sorted({key[2] for key in missing})}
+        )
+        for citation_id, chunk_id, quote_hash in rows:
+            key = (generation, chunk_id, quote_hash)
+            pending[key] = known[key] = citation_id
+
+    return [known[key] for key, _ in keyed if known[key] is not None]
+
+def _citations_committed(db: AsyncSession) -> None:
+    """Cache the citation ids read by the transaction that was just committed"""
+    for key, citation_id in db.info.pop("citation_ids", {}).items():
+        _cache_put(_citation_ids, key, citation_id)
+
+def _citations_rolled_back(db: AsyncSession) -> None:
+    """Forget the citation ids read by the transaction that was just rolled back"""
+    db.info.pop("citation_ids", None)
+
+async def _resolve_citations(db: AsyncSession, rows) -> Dict[int, Citation]:
+    """Citation models for every id referenced by message `rows` (citation_ids at index 6), in one query"""
+    wanted = set()
+    for row in rows:
+        if row[6]:
+            try:
+                wanted.update(json.loads(row[6]))
+            except (TypeError, ValueError):
+                pass
+
+    resolved = {cid: _citation_models[cid] for cid in wanted if cid in _citation_models}
+    missing = sorted(wanted - resolved.keys())
+    if missing:
+        result = await db.execute(
+            text("SELECT id, chunk_id, source, pages, quote FROM citations WHERE id IN :ids")
+            .bindparams(bindparam("ids", expanding=True)),
+            {"ids": missing}
+        )
+        for cid, chunk_id, source, pages, quote in result:
+            resolved[cid] = Citation(chunk_id=chunk_id, source=source, pages=pages, quote=quote)
+            _cache_put(_citation_models, cid, resolved[cid])
+    return resolved
+
+async def _insert_message(
+    db: AsyncSession,
+    conversation_id: int,
+    role: str,
+    content: str,
+    citations: Optional[List[Dict]] = None,
+    metadata: Optional[Dict] = None,
+    touch: bool = True
+) -> int:
+    """
+    INSERT one message (no commit); returns its id. Citations go to the
+    citations table and the message keeps their ids. With `touch`, also bumps
+    the conversation's summary columns (pass False when _upsert_conversation
+    already counted it).
+    """
+    citation_ids = await _store_citations(db, citations) if citations else None
+    result = await db.execute(
+        text("""
+            INSERT INTO messages 
+            (conversation_id, role, content, citation_ids, metadata)
+            VALUES (:conversation_id, :role, :content, :citation_ids, :metadata)
+        """),
+        {
+            "conversation_id": conversation_id,
+            "role": role,
+            "content": content,
+            "citation_ids": json.dumps(citation_ids) if citation_ids else None,
+            "metadata": json.dumps(metadata) if metadata else None
+        }
+    )
+    if touch:
+        await db.execute(
+            text("""
+                UPDATE conversations
+                SET message_count = message_count + 1, last_message = :last_message,
+                    last_message_at = NOW(), updated_at = NOW()
+                WHERE id = :conversation_id
+            """),
+            {"conversation_id": conversation_id, "last_message": _message_preview(content)}
+        )
+    return result.lastrowid
+
+async def save_message(
+    db: AsyncSession, 
     conversation_id: int, 
     role: str, 
     content: str,  
@@ -220,105 +448,462 @@ def save_message(
 ):
     """Save message to database"""
     try:
-        citations_json = json.dumps(citations) if citations else None
-        metadata_json = json.dumps(metadata) if metadata else None
-        
-        result = db.execute(
-            text("""
-                INSERT INTO messages 
-                (conversation_id, role, content, citations, metadata)
-                VALUES (:conversation_id, :role, :content, :citations, :metadata)
-            """),
-            {
-                "conversation_id": conversation_id,
-                "role": role,
-                "content": content,
-                "citations": citations_json,
-                "metadata": metadata_json
-            }
-        )
-        db.commit()
-        message_id = result.lastrowid
+        message_id = await _insert_message(db, conversation_id, role, content, citations, metadata)
         
-        # Update conversation title if it's the first user message
+        # Title an untitled conversation after its first user message
         if role == "user":
-            msg_count = db.execute(
-                text("SELECT COUNT(*) FROM messages WHERE conversation_id = :conv_id"),
-                {"conv_id": conversation_id}
-            ).scalar()
-            
-            if msg_count == 1:  # First user message
-                title = content[:50] + "..." if len(content) > 50 else content
-                db.execute(
-                    text("UPDATE conversations SET title = :title WHERE id = :id"),
-                    {"title": title, "id": conversation_id}
-                )
-                db.commit()
+            await db.execute(
+                text("UPDATE conversations SET title = :title WHERE id = :id AND title = :default_title"),
+                {"title": _conversation_title(content), "id": conversation_id, "default_title": DEFAULT_CONVERSATION_TITLE}
+            )
+        await db.commit()
+        _citations_committed(db)
         
         print(f" Saved {role} message, ID: {message_id}")
         return True
         
     except Exception as e:
         print(f" Failed to save message: {e}")
-        db.rollback()
+        await db.rollback()
+        _citations_rolled_back(db)
         return False
 
-def get_conversation_history(
-    db: Session, 
+def _history_message(row, citations_by_id: Optional[Dict[int, Citation]] = None) -> Dict:
+    """
+    messages row (id, role, content, created_at, citations, metadata, citation_ids)
+    -> history dict. citation_ids are looked up in `citations_by_id`
+    (_resolve_citations); the citations JSON column only holds older rows.
+    """
+    # Ensure content is always a string for AI agent
+    content = str(row[2]) if row[2] is not None else ""
+    
+    citations = None
+    if row[6] and citations_by_id is not None:
+        try:
+            citations = [citations_by_id[cid] for cid in json.loads(row[6]) if cid in citations_by_id]
+        except (TypeError, ValueError):
+            pass
+    elif row[4]:
+        try:
+            citations_raw = json.loads(row[4])
+            citations = [Citation(**cite) for cite in citations_raw]
+        except:
+            pass
+    
+    metadata = None
+    if row[5]:
+        try:
+            metadata = json.loads(row[5])
+        except:
+            pass
+    
+    return {
+        "id": row[0],
+        "role": row[1],  # "user" or "assistant"
+        "content": content,  # String content
+        "created_at": row[3],
+        "citations": citations,
+        "metadata": metadata
+    }
+
+async def get_conversation_history(
+    db: AsyncSession, 
     session_id: str, 
-    limit: int = 100
+    limit: int = 100,
+    before_id: Optional[int] = None
 ) -> List[Dict]:
-    """Get conversation history - FIXED for AI agent compatibility"""
+    """
+    The last `limit` messages of a conversation (older than message `before_id`
+    if given), oldest first. Reads backwards on the (conversation_id, id)
+    index, so the cost does not grow with the length of the conversation.
+    """
     try:
-        result = db.execute(
-            text("""
-                SELECT m.id, m.role, m.content, m.created_at, m.citations, m.metadata
-                FROM messages m
-                JOIN conversations c ON m.conversation_id = c.id
+        result = await db.execute(
+            text(f"""
+                SELECT m.id, m.role, m.content, m.created_at, m.citations, m.metadata, m.citation_ids
+                FROM conversations c
+                JOIN messages m ON m.conversation_id = c.id
                 WHERE c.session_id = :session_id
-                ORDER BY m.created_at ASC
+                {"AND m.id < :before_id" if before_id is not None else ""}
+                ORDER BY m.id DESC
                 LIMIT :limit
             """),
-            {"session_id": session_id, "limit": limit}
+            {"session_id": session_id, "limit": limit, "before_id": before_id}
         )
-        
-        messages = []
-        for row in result:
-            # Ensure content is always a string for AI agent
-            content = str(row[2]) if row[2] is not None else ""
-            
-            citations = None
-            if row[4]:
-                try:
-                    citations_raw = json.loads(row[4])
-                    citations = [Citation(**cite) for cite in citations_raw]
-                except:
-                    pass
-            
-            metadata = None
-            if row[5]:
-                try:
-                    metadata = json.loads(row[5])
-                except:
-                    pass
-            
-            messages.append({
-                "id": row[0],
-                "role": row[1],  # "user" or "assistant"
-                "content": content,  # String content
-                "created_at": row[3],
-                "citations": citations,
-                "metadata": metadata
-            })
-        return messages
+        rows = result.fetchall()
+        citations_by_id = await _resolve_citations(db, rows)
+        return [_history_message(row, citations_by_id) for row in reversed(rows)]
         
     except Exception as e:
         print(f"⚠️ Error fetching history: {e}")
         traceback.print_exc()
         return []
 
+# session_id -> set once the previous turn's assistant message is written (write-behind).
+# The next turn of the session waits for it, so message ids keep the turn order.
+_pending_replies: Dict[str, asyncio.Event] = {}
+
+def _expect_reply(session_id: str) -> asyncio.Event:
+    written = _pending_replies[session_id] = asyncio.Event()
+    return written
+
+def _reply_written(session_id: str, written: Optional[asyncio.Event]) -> None:
+    if written is None:
+        return
+    written.set()
+    if _pending_replies.get(session_id) is written:
+        del _pending_replies[session_id]
+
+# Streamed turns run in their own task so a client disconnect does not cancel them;
+# strong references until they finish (the event loop only keeps weak ones)
+_stream_turns: Set[asyncio.Task] = set()
+
+async def begin_chat_turn(
+    db: AsyncSession,
+    session_id: str,
+    user_id: Optional[int],
+    message: str,
+    history_limit: int = 6
+) -> Tuple[int, Optional[str], List[Dict]]:
+    """
+    Everything a chat turn needs from the database before the AI call, in one
+    transaction: upsert the conversation, insert the user message, read the
+    title and recent history back. Returns (conversation_id, title, history).
+
+    The assistant message is written after the response (persist_chat_reply).
+    """
+    written = _pending_replies.get(session_id)
+    if written is not None:
+        try:
+            await asyncio.wait_for(written.wait(), timeout=5)
+        except asyncio.TimeoutError:
+            pass
+
+    try:
+        conv_id = await _upsert_conversation(db, session_id, user_id, _conversation_title(message), new_message=message)
+        await _insert_message(db, conv_id, "user", message, touch=False)
+
+        # the model only needs role and content, so citations are not loaded here
+        rows = (await db.execute(
+            text("""
+                SELECT m.id, m.role, m.content, m.created_at, NULL, m.metadata, NULL, c.title
+                FROM conversations c
+                JOIN messages m ON m.conversation_id = c.id
+                WHERE c.id = :conv_id
+                ORDER BY m.id DESC
+                LIMIT :limit
+            """),
+            {"conv_id": conv_id, "limit": history_limit}
+        )).fetchall()
+        await db.commit()
+        _citations_committed(db)
+
+        title = rows[0][7] if rows else None
+        return conv_id, title, [_history_message(row) for row in reversed(rows)]
+
+    except Exception as e:
+        await db.rollback()
+        _citations_rolled_back(db)
+        print(f" Database error: {e}")
+        traceback.print_exc()
+        raise AppException(
+            error_code="DATABASE_ERROR",
+            message="Failed to access conversation",
+            status_code=500,
+            detail=str(e)
+        )
+
+async def persist_chat_reply(
+    conversation_id: int,
+    answer: str,
+    citations: Optional[List[Dict]],
+    metadata: Dict,
+    log_message: str,
+    ip: Optional[str],
+    user_id: Optional[int],
+    session_id: Optional[str] = None,
+    written: Optional[asyncio.Event] = None
+):
+    """
+    Write-behind for a chat turn: the assistant message on a fresh session,
+    plus its system_logs row via the log sink. Runs as a background task,
+    after the response has been sent, so its commit is off the request path.
+    Sets `written` (from _expect_reply) when done.
+    """
+    db = db_manager.get_async_session()
+    try:
+        message_id = await _insert_message(db, conversation_id, "assistant", answer, citations, metadata)
+        await db.commit()
+        _citations_committed(db)
+        print(f" Saved assistant message, ID: {message_id}")
+    except Exception as e:
+        await db.rollback()
+        _citations_rolled_back(db)
+        print(f" Failed to save assistant message: {e}")
+    finally:
+        await db.close()
+        _reply_written(session_id, written)
+    await log_sink.log("INFO", "chat", log_message, ip=ip, user_id=user_id)
+
 # AIclient with fixed integration
 class AIClient:
+    @staticmethod
+    def _graph_config(session_id: str) -> Dict:
+        return {"configurable": {"thread_id": session_id}}
+
+    @staticmethod
+    def _seed_history(user_message: str, conversation_history: List[Dict] = None) -> List[Dict]:
+        """DB history without the trailing copy of the current message (it is saved before the AI call)"""
+        history = list(conversation_history or [])
+        if history and history[-1].get("role") == "user" and str(history[-1].get("content", "")).strip() == user_message.strip():
+            history.pop()
+        return history
+
+    @staticmethod
+    def _graph_input(user_message: str, conversation_history: List[Dict], thread_has_state: bool) -> Dict:
+        """
+        The checkpointer already keeps the conversation for a live thread, so only the
+        new message is sent. DB history is used to seed new or evicted threads only.
+        """
+        history = None if thread_has_state else AIClient._seed_history(user_message, conversation_history)
+        return {"messages": AIClient._build_messages(user_message, history)}
+
+    @staticmethod
+    def _thread_has_state(session_id: str) -> bool:
+        try:
+            snapshot = ai_graph.get_state(AIClient._graph_config(session_id))
+            return bool(snapshot.values.get("messages"))
+        except Exception as e:
+            print(f" Could not read thread state: {e}")
+            return False
+
+    @staticmethod
+    async def _athread_has_state(session_id: str) -> bool:
+        try:
+            snapshot = await ai_graph.aget_state(AIClient._graph_config(session_id))
+            return bool(snapshot.values.get("messages"))
+        except Exception as e:
+            print(f" Could not read thread state: {e}")
+            return False
+
+    @staticmethod
+    def _turn_update(user_message: str, response: Dict) -> Dict:
+        """Checkpoint update for a turn, with the AI message in the graph's own JSON payload format"""
+        payload = {
+            "answer": response["answer"],
+            "citations": [c.model_dump() for c in response["citations"] or []],
+            "refusal": response["refusal"],
+            "route": response["route"],
+        }
+        return {"messages": [HumanMessage(content=user_message), AIMessage(content=json.dumps(payload, ensure_ascii=False))]}
+
+    @staticmethod
+    def _record_turn(session_id: str, user_message: str, response: Dict) -> None:
+        """
+        Append a turn answered without running the graph (answer cache, shared
+        single-flight run) to the session thread, so the next follow-up sees it.
+        A thread without state is left alone: it is seeded from the DB history,
+        which already has the turn.
+        """
+        try:
+            if AIClient._thread_has_state(session_id):
+                ai_graph.update_state(
+                    AIClient._graph_config(session_id), AIClient._turn_update(user_message, response), as_node="answer"
+                )
+        except Exception as e:
+            print(f" Could not record turn in thread state: {e}")
+
+    @staticmethod
+    async def _arecord_turn(session_id: str, user_message: str, response: Dict) -> None:
+        """_record_turn() for async callers"""
+        try:
+            if await AIClient._athread_has_state(session_id):
+                await ai_graph.aupdate_state(
+                    AIClient._graph_config(session_id), AIClient._turn_update(user_message, response), as_node="answer"
+                )
+        except Exception as e:
+            print(f" Could not record turn in thread state: {e}")
+
+    @staticmethod
+    def _build_messages(user_message: str, conversation_history: List[Dict] = None) -> List:
+        """Convert DB history + current message into LangChain messages"""
+        messages = []
+
+        # Add conversation history if available
+        if conversation_history:
+            print(f"📜 Adding {len(conversation_history)} recent messages from history")
+            for msg in conversation_history:
+                if msg["role"] == "user":
+                    # Create HumanMessage object
+                    messages.append(HumanMessage(content=str(msg["content"])))
+                elif msg["role"] == "assistant":
+                    # Create AIMessage object - check if it's JSON or plain text
+                    content = msg["content"]
+                    if isinstance(content, dict):
+                        # If it's already a dict (like from previous AI response)
+                        content = json.dumps(content)
+                    messages.append(AIMessage(content=str(content)))
+
+        # Add current user message as HumanMessage
+        messages.append(HumanMessage(content=user_message))
+
+        print(f"📤 Total messages being sent to AI: {len(messages)}")
+
+        # Debug
+        for i, msg in enumerate(messages):
+            print(f"  [{i}] {type(msg).__name__}: {msg.content[:80]}...")
+
+        return messages
+
+    @staticmethod
+    def _parse_content(content: str) -> Dict:
+        """Parse the agent's JSON payload (or plain text) into a response dict"""
+        print(f" AI Response content length: {len(content)}")
+        print(f" AI Response preview: {content[:200]}...")
+
+        # Try to parse as JSON (your agent should return JSON)
+        try:
+            payload = json.loads(content)
+            print(f" AI response parsed as JSON")
+
+            answer = payload.get("answer", "")
+            citations_raw = payload.get("citations", [])
+            route = payload.get("route", "qa")
+            refusal = bool(payload.get("refusal", False))
+
+            return {
+                "answer": answer,
+                "citations": AIClient._to_citations(citations_raw),
+                "route": route,
+                "refusal": refusal
+            }
+
+        except json.JSONDecodeError:
+
+            print(f" AI response not JSON, treating as plain text")
+            return {
+                "answer": content,
+                "citations": [],
+                "route": "qa",
+                "refusal": False
+            }
+
+    @staticmethod
+    def _to_citations(citations_raw: List) -> List[Citation]:
+        """Convert citation dicts to Citation objects"""
+        citations = []
+        for cite in citations_raw or []:
+            if isinstance(cite, dict):
+                citations.append(Citation(
+                    chunk_id=cite.get("chunk_id", ""),
+                    source=cite.get("source", "unknown"),
+                    pages=cite.get("pages", "p.?"),
+                    quote=cite.get("quote", "")
+                ))
+        return citations
+
+    @staticmethod
+    def _cache_route(user_message: str, conversation_history: List[Dict] = None) -> Optional[str]:
+        """Route hint for the answer cache, or None when the cache must be skipped"""
+        if answer_cache is None or not answer_cache.enabled:
+            return None
+        if not is_context_free(user_message, conversation_history):
+            # follow-ups depend on the conversation, never serve them from cache
+            answer_cache.bypass()
+            return None
+        return route_hint(user_message)
+
+    @staticmethod
+    def _from_cache(hit: Optional[Dict]) -> Optional[Dict]:
+        if hit is None:
+            return None
+        print(f" Answer cache hit (route: {hit['route']})")
+        return {
+            "answer": hit["answer"],
+            "citations": AIClient._to_citations(hit["citations"]),
+            "route": hit["route"],
+            "refusal": hit["refusal"]
+        }
+
+    @staticmethod
+    def _cached_response(user_message: str, cache_route: Optional[str]) -> Optional[Dict]:
+        if cache_route is None:
+            return None
+        return AIClient._from_cache(answer_cache.get(user_message, cache_route))
+
+    @staticmethod
+    async def _acached_response(user_message: str, cache_route: Optional[str]) -> Optional[Dict]:
+        """_cached_response() for async callers: a semantic lookup's embedding call does not block the loop"""
+        if cache_route is None:
+            return None
+        return AIClient._from_cache(await answer_cache.aget(user_message, cache_route))
+
+    @staticmethod
+    def _cache_value(cache_route: Optional[str], response: Dict) -> Optional[Dict]:
+        if cache_route is None or response["route"] == "fallback" or not response["answer"]:
+            return None
+        return {
+            "answer": response["answer"],
+            "citations": [c.model_dump() for c in response["citations"]],
+            "route": response["route"],
+            "refusal": response["refusal"]
+        }
+
+    @staticmethod
+    def _remember(user_message: str, cache_route: Optional[str], response: Dict) -> None:
+        value = AIClient._cache_value(cache_route, response)
+        if value is not None:
+            answer_cache.put(user_message, cache_route, value)
+
+    @staticmethod
+    async def _aremember(user_message: str, cache_route: Optional[str], response: Dict) -> None:
+        value = AIClient._cache_value(cache_route, response)
+        if value is not None:
+            await answer_cache.aput(user_message, cache_route, value)
+
+    @staticmethod
+    def _extract_content(out: Dict) -> str:
+        """Get the last AI message content from the graph output"""
+        ai_messages = out.get("messages", [])
+
+        if not ai_messages:
+            print(" No messages in AI response")
+            raise AppException(
+                error_code="AI_NO_RESPONSE",
+                message="AI engine did not return a response",
+                status_code=500
+            )
+
+        # Get the last AI message
+        last_message = ai_messages[-1]
+        print(f"📥 Last message type: {type(last_message)}")
+
+        # Handle both JSON and plain text responses
+        if isinstance(last_message, AIMessage):
+            return last_message.content
+        if isinstance(last_message, dict):
+            return last_message.get("content", "")
+        return str(last_message)
+
+    @staticmethod
+    def _flight_key(user_message: str, conversation_history: List[Dict] = None) -> Optional[Tuple]:
+        """
+        Single-flight key, or None when the request must run on its own. Only
+        context-free questions are shared: like cache hits, a coalesced request
+        does not run the graph on its own session thread, so the turn is
+        appended to that thread afterwards (_record_turn).
+        """
+        if answer_flight is None or not answer_flight.enabled:
+            return None
+        if not is_context_free(user_message, conversation_history):
+            return None
+        return question_key(user_message, route_hint(user_message))
+
+    @staticmethod
+    def _shared(response: Dict) -> Dict:
+        """Per-caller copy of a response produced by another request's graph run"""
+        return {**response, "citations": list(response["citations"])}
+
     @staticmethod
     def get_response(
         session_id: str, 
@@ -326,109 +911,50 @@ class AIClient:
         conversation_history: List[Dict] = None
     ) -> Dict:
         """Get response from AI engine - FIXED VERSION"""
-        if not AI_ENGINE_AVAILABLE or not ai_graph:
+        if not load_ai_engine() or not ai_graph:
             print(" AI Engine not available, using fallback")
             return AIClient._fallback_response(user_message)
         
+        cache_route = AIClient._cache_route(user_message, conversation_history)
+        cached = AIClient._cached_response(user_message, cache_route)
+        if cached:
+            AIClient._record_turn(session_id, user_message, cached)
+            return cached
+
+        ran = []
+
+        def run() -> Dict:
+            ran.append(True)
+            return AIClient._run_graph(session_id, user_message, conversation_history, cache_route)
+
+        flight_key = AIClient._flight_key(user_message, conversation_history)
+        if flight_key is None:
+            return run()
+        response = AIClient._shared(answer_flight.run_sync(flight_key, run))
+        if not ran:  # answered by another session's run
+            AIClient._record_turn(session_id, user_message, response)
+        return response
+
+    @staticmethod
+    def _run_graph(
+        session_id: str,
+        user_message: str,
+        conversation_history: List[Dict],
+        cache_route: Optional[str]
+    ) -> Dict:
         try:
             print(f" Calling AI Agent for session: {session_id}")
-            messages = []
-            
-            # Add conversation history if available
-            if conversation_history:
-                print(f"📜 Adding {len(conversation_history)} recent messages from history")
-                for msg in conversation_history:
-                    if msg["role"] == "user":
-                        # Create HumanMessage object
-                        messages.append(HumanMessage(content=str(msg["content"])))
-                    elif msg["role"] == "assistant":
-                        # Create AIMessage object - check if it's JSON or plain text
-                        content = msg["content"]
-                        if isinstance(content, dict):
-                            # If it's already a dict (like from previous AI response)
-                            content = json.dumps(content)
-                        messages.append(AIMessage(content=str(content)))
-            
-            # Add current user message as HumanMessage
-            messages.append(HumanMessage(content=user_message))
-            
-            print(f"📤 Total messages being sent to AI: {len(messages)}")
-            
-            # Debug
-            for i, msg in enumerate(messages):
-                print(f"  [{i}] {type(msg).__name__}: {msg.content[:80]}...")
+            graph_input = AIClient._graph_input(
+                user_message, conversation_history, AIClient._thread_has_state(session_id)
+            )
             
             # Call LangGraph with the correct state structure (The graph expects a dict with "messages" key containing LangChain messages)
-            out = ai_graph.invoke(
-                {"messages": messages},
-                config={"configurable": {"thread_id": session_id}},
-            )
+            out = ai_graph.invoke(graph_input, config=AIClient._graph_config(session_id))
             
             print(f" AI Graph invoked successfully")
-            
-            # Extract the AI response
-            ai_messages = out.get("messages", [])
-            
-            if not ai_messages:
-                print(" No messages in AI response")
-                raise AppException(
-                    error_code="AI_NO_RESPONSE",
-                    message="AI engine did not return a response",
-                    status_code=500
-                )
-            
-            # Get the last AI message
-            last_message = ai_messages[-1]
-            print(f"📥 Last message type: {type(last_message)}")
-            
-            # Handle both JSON and plain text responses
-            if isinstance(last_message, AIMessage):
-                content = last_message.content
-            elif isinstance(last_message, dict):
-                content = last_message.get("content", "")
-            else:
-                content = str(last_message)
-            
-            print(f" AI Response content length: {len(content)}")
-            print(f" AI Response preview: {content[:200]}...")
-            
-            # Try to parse as JSON (your agent should return JSON)
-            try:
-                payload = json.loads(content)
-                print(f" AI response parsed as JSON")
-                
-                answer = payload.get("answer", "")
-                citations_raw = payload.get("citations", [])
-                route = payload.get("route", "qa")
-                refusal = bool(payload.get("refusal", False))
-                
-                # Convert citations to Citation objects
-                citations = []
-                for cite in citations_raw:
-                    if isinstance(cite, dict):
-                        citations.append(Citation(
-                            chunk_id=cite.get("chunk_id", ""),
-                            source=cite.get("source", "unknown"),
-                            pages=cite.get("pages", "p.?"),
-                            quote=cite.get("quote", "")
-                        ))
-                
-                return {
-                    "answer": answer,
-                    "citations": citations,
-                    "route": route,
-                    "refusal": refusal
-                }
-                
-            except json.JSONDecodeError:
-            
-                print(f" AI response not JSON, treating as plain text")
-                return {
-                    "answer": content,
-                    "citations": [],  
-                    "route": "qa",
-                    "refusal": False
-                }
+            response = AIClient._parse_content(AIClient._extract_content(out))
+            AIClient._remember(user_message, cache_route, response)
+            return response
                 
         except AppException as ae:
             print(f" AppException in AI client: {ae}")
@@ -437,6 +963,232 @@ class AIClient:
             print(f" AI Engine error: {e}")
             traceback.print_exc()
             return AIClient._fallback_response(user_message)
+
+    @staticmethod
+    async def aget_response(
+        session_id: str,
+        user_message: str,
+        conversation_history: List[Dict] = None
+    ) -> Dict:
+        """Non-blocking get_response(): runs the graph with ainvoke under the concurrency cap"""
+        if not await aload_ai_engine() or not ai_graph:
+            print(" AI Engine not available, using fallback")
+            return AIClient._fallback_response(user_message)
+
+        cache_route = AIClient._cache_route(user_message, conversation_history)
+        cached = await AIClient._acached_response(user_message, cache_route)
+        if cached:
+            await AIClient._arecord_turn(session_id, user_message, cached)
+            return cached
+
+        ran = []
+
+        async def run() -> Dict:
+            ran.append(True)
+            return await AIClient._arun_graph(session_id, user_message, conversation_history, cache_route)
+
+        flight_key = AIClient._flight_key(user_message, conversation_history)
+        if flight_key is None:
+            return await run()
+        response = AIClient._shared(await answer_flight.run(flight_key, run))
+        if not ran:  # answered by another session's run
+            await AIClient._arecord_turn(session_id, user_message, response)
+        return response
+
+    @staticmethod
+    async def _arun_graph(
+        session_id: str,
+        user_message: str,
+        conversation_history: List[Dict],
+        cache_route: Optional[str]
+    ) -> Dict:
+        try:
+            print(f" Calling AI Agent (async) for session: {session_id}")
+            graph_input = AIClient._graph_input(
+                user_message, conversation_history, await AIClient._athread_has_state(session_id)
+            )
+
+            async with graph_semaphore:
+                out = await ai_graph.ainvoke(graph_input, config=AIClient._graph_config(session_id))
+
+            print(f" AI Graph invoked successfully")
+            response = AIClient._parse_content(AIClient._extract_content(out))
+            await AIClient._aremember(user_message, cache_route, response)
+            return response
+
+        except AppException as ae:
+            print(f" AppException in AI client: {ae}")
+            raise
+        except Exception as e:
+            print(f" AI Engine error: {e}")
+            traceback.print_exc()
+            return AIClient._fallback_response(user_message)
+
+    @staticmethod
+    async def batch_responses(
+        questions: List[str],
+        concurrency: int = CHAT_BATCH_CONCURRENCY
+    ) -> AsyncIterator[Tuple[int, Dict, bool]]:
+        """
+        Answer independent questions (no session, no history) and yield
+        (index, response, cached) in completion order.
+
+        Cache hits come back first. Identical questions run once, retrieval for
+        the whole batch is done up front (one embeddings call), and at most
+        `concurrency` graph runs of this batch are in flight at a time.
+        """
+        if not await aload_ai_engine() or not batch_graph:
+            print(" AI Engine not available, using fallback")
+            for i, q in enumerate(questions):
+                yield i, AIClient._fallback_response(q), False
+            return
+
+        groups: Dict[Tuple, List[int]] = {}
+        cache_routes: Dict[Tuple, Optional[str]] = {}
+        for i, q in enumerate(questions):
+            cache_route = AIClient._cache_route(q)
+            cached = await AIClient._acached_response(q, cache_route)
+            if cached:
+                yield i, cached, True
+                continue
+            key = question_key(q, route_hint(q))
+            groups.setdefault(key, []).append(i)
+            cache_routes[key] = cache_route
+
+        if not groups:
+            return
+
+        keys = list(groups)
+        unique = [questions[groups[k][0]] for k in keys]
+        print(f" Batch: {len(questions)} questions, {len(unique)} to run, concurrency {concurrency}")
+        try:
+            inputs = await abatch_inputs(unique)
+        except Exception as e:
+            print(f"⚠️ Batch retrieval failed, retrieving per question: {e}")
+            inputs = [{"messages": [HumanMessage(content=q)]} for q in unique]
+
+        batch_semaphore = asyncio.Semaphore(concurrency)
+
+        async def run(key: Tuple, question: str, graph_input: Dict) -> Dict:
+            try:
+                async with batch_semaphore, graph_semaphore:
+                    out = await batch_graph.ainvoke(graph_input)
+                response = AIClient._parse_content(AIClient._extract_content(out))
+                await AIClient._aremember(question, cache_routes[key], response)
+                return response
+            except Exception as e:
+                print(f" AI Engine error (batch): {e}")
+                return AIClient._fallback_response(question)
+
+        async def one(key: Tuple, question: str, graph_input: Dict) -> Tuple[Tuple, Dict]:
+            # shares the run with an identical live chat question, if one is in flight
+            return key, await answer_flight.run(key, lambda: run(key, question, graph_input))
+
+        tasks = [asyncio.create_task(one(k, q, x)) for k, q, x in zip(keys, unique, inputs)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                key, response = await next_done
+                for i in groups[key]:
+                    yield i, AIClient._shared(response), False
+        finally:
+            for t in tasks:
+                t.cancel()
+
+    @staticmethod
+    async def stream_response(
+        session_id: str,
+        user_message: str,
+        conversation_history: List[Dict] = None
+    ) -> AsyncIterator[Tuple[str, Dict]]:
+        """
+        Stream the AI response as (event, data) pairs:
+        route -> citations -> token* -> done.
+        The "done" event carries the same dict as get_response().
+        """
+        if not await aload_ai_engine() or not ai_graph:
+            print(" AI Engine not available, using fallback")
+            fallback = AIClient._fallback_response(user_message)
+            yield "route", {"route": fallback["route"]}
+            yield "token", {"text": fallback["answer"]}
+            yield "done", fallback
+            return
+
+        cache_route = AIClient._cache_route(user_message, conversation_history)
+        cached = await AIClient._acached_response(user_message, cache_route)
+        if cached is None:
+            # an identical question is already being answered: wait for it instead of a second run
+            flight_key = AIClient._flight_key(user_message, conversation_history)
+            shared = await answer_flight.join(flight_key) if flight_key is not None else None
+            cached = AIClient._shared(shared) if shared else None
+        if cached:
+            await AIClient._arecord_turn(session_id, user_message, cached)
+            yield "route", {"route": cached["route"]}
+            if cached["citations"]:
+                yield "citations", {
+                    "route": cached["route"],
+                    "citations": [c.model_dump() for c in cached["citations"]],
+                }
+            yield "token", {"text": cached["answer"]}
+            yield "done", cached
+            return
+
+        final = None
+        streamed_tokens = False
+        try:
+            print(f" Streaming AI Agent for session: {session_id}")
+            graph_input = AIClient._graph_input(
+                user_message, conversation_history, await AIClient._athread_has_state(session_id)
+            )
+
+            async with graph_semaphore:
+                async for mode, chunk in ai_graph.astream(
+                    graph_input,
+                    config=AIClient._graph_config(session_id),
+                    stream_mode=["updates", "custom", "messages"],
+                ):
+                    if mode == "updates":
+                        for node, update in (chunk or {}).items():
+                            if node == "route" and update:
+                                yield "route", {"route": update.get("route", "qa")}
+                            elif node in STREAM_NODES and update and update.get("messages"):
+                                final = AIClient._parse_content(update["messages"][-1].content)
+
+                    elif mode == "custom":
+                        if isinstance(chunk, dict) and chunk.get("event") == "citations":
+                            citations = AIClient._to_citations(chunk.get("citations"))
+                            yield "citations", {
+                                "route": chunk.get("route", "qa"),
+                                "citations": [c.model_dump() for c in citations],
+                            }
+
+                    elif mode == "messages":
+                        msg, meta = chunk
+                        # Only LLM token chunks; the final JSON payload arrives via "updates"
+                        if (
+                            isinstance(msg, AIMessageChunk)
+                            and meta.get("langgraph_node") in STREAM_NODES
+                            and msg.content
+                        ):
+                            streamed_tokens = True
+                            yield "token", {"text": msg.content}
+
+        except Exception as e:
+            print(f" AI Engine streaming error: {e}")
+            traceback.print_exc()
+            if final is None:
+                final = AIClient._fallback_response(user_message)
+
+        if final is None:
+            print(" No messages in AI stream")
+            final = AIClient._fallback_response(user_message)
+        else:
+            await AIClient._aremember(user_message, cache_route, final)
+
+        # Refusals (and non-streaming models) never produce token chunks
+        if not streamed_tokens:
+            yield "token", {"text": final["answer"]}
+
+        yield "done", final
     
     @staticmethod
     def _fallback_response(user_message: str) -> Dict:
@@ -467,8 +1219,9 @@ class AIClient:
 async def chat_endpoint(
     request: Request,
     chat_request: ChatRequest,
+    background_tasks: BackgroundTasks,
     current_user: Optional[dict] = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Main chat endpoint - UPDATED with proper AI integration"""
     try:
@@ -483,18 +1236,14 @@ async def chat_endpoint(
         print(f"💬 Chat request - Session: {session_id}, User: {user_id}")
         print(f"💬 User message: {chat_request.message}")
         
-        # Get or create conversation
-        conversation_id = get_or_create_conversation(db, session_id, user_id)
-        
-        # Save user message
-        save_message(db, conversation_id, "user", chat_request.message.strip())
-        
-        # Get recent history (last 6 messages for context)
-        recent_history = get_conversation_history(db, session_id, limit=6)
+        # Conversation upsert, user message and recent history (last 6 messages) in one transaction
+        conversation_id, title, recent_history = await begin_chat_turn(
+            db, session_id, user_id, chat_request.message.strip()
+        )
         print(f" Recent history loaded: {len(recent_history)} messages")
         
         # Get AI response
-        ai_response = AIClient.get_response(
+        ai_response = await AIClient.aget_response(
             session_id=session_id,
             user_message=chat_request.message,
             conversation_history=recent_history
@@ -502,38 +1251,24 @@ async def chat_endpoint(
         
         print(f" AI Response - Route: {ai_response['route']}, Citations: {len(ai_response['citations'] or [])}")
         
-        # Save AI response
+        # Save AI response and log the chat after the response is sent
         citations_for_db = None
         if ai_response["citations"]:
             citations_for_db = [cite.model_dump() for cite in ai_response["citations"]]
         
-        save_message(
-            db, conversation_id, "assistant",
+        background_tasks.add_task(
+            persist_chat_reply,
+            conversation_id,
             ai_response["answer"],
             citations_for_db,
-            {"route": ai_response["route"], "refusal": ai_response["refusal"]}
+            {"route": ai_response["route"], "refusal": ai_response["refusal"]},
+            "Chat message processed",
+            get_client_ip(request),
+            user_id,
+            session_id,
+            _expect_reply(session_id)
         )
         
-        # Get conversation title
-        title_result = db.execute(
-            text("SELECT title FROM conversations WHERE session_id = :session_id"),
-            {"session_id": session_id}
-        ).fetchone()
-        title = title_result[0] if title_result else None
-        
-        # Log successful chat
-        try:
-            db.execute(
-                text("""
-                    INSERT INTO system_logs (level, service, message, ip_address, user_id)
-                    VALUES ('INFO', 'chat', 'Chat message processed', :ip, :user_id)
-                """),
-                {"ip": get_client_ip(request), "user_id": user_id}
-            )
-            db.commit()
-        except Exception as log_error:
-            print(f" Failed to log to database: {log_error}")
-        
         return ChatResponse(
             answer=ai_response["answer"],
             session_id=session_id,
@@ -552,21 +1287,12 @@ async def chat_endpoint(
         traceback.print_exc()
         
         # Log error
-        try:
-            db.execute(
-                text("""
-                    INSERT INTO system_logs (level, service, message, ip_address, user_id, details)
-                    VALUES ('ERROR', 'chat', 'Chat processing failed', :ip, :user_id, :details)
-                """),
-                {
-                    "ip": get_client_ip(request),
-                    "user_id": current_user.get("id") if current_user else None,
-                    "details": json.dumps({"error": str(e)})
-                }
-            )
-            db.commit()
-        except:
-            pass
+        await log_sink.log(
+            "ERROR", "chat", "Chat processing failed",
+            details={"error": str(e)},
+            ip=get_client_ip(request),
+            user_id=current_user.get("id") if current_user else None
+        )
         
         raise AppException(
             error_code="CHAT_PROCESSING_ERROR",
@@ -575,34 +1301,237 @@ async def chat_endpoint(
             detail="Please try again in a moment"
         )
 
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+@router.post("/chat/stream")
+@rate_limit("chat")  # shares the chat quota
+async def chat_stream_endpoint(
+    request: Request,
+    chat_request: ChatRequest,
+    current_user: Optional[dict] = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Streaming chat endpoint (Server-Sent Events).
+
+    Events, in order:
+      route     -> {"route"}
+      citations -> {"route", "citations"}   (retrieval routes only)
+      token     -> {"text"}                 (repeated)
+      done      -> ChatResponse fields (the reply is saved once the stream ends,
+                   even if the client has disconnected)
+      error     -> {"error", "message"}
+    """
+    # Generate or use session ID
+    if chat_request.new_session or not chat_request.session_id:
+        session_id = str(uuid.uuid4())
+    else:
+        session_id = chat_request.session_id
+
+    user_id = current_user.get("id") if current_user else None
+    client_ip = get_client_ip(request)
+
+    print(f"💬 Stream request - Session: {session_id}, User: {user_id}")
+
+    conversation_id, title, recent_history = await begin_chat_turn(
+        db, session_id, user_id, chat_request.message.strip()
+    )
+    written = _expect_reply(session_id)
+    events: asyncio.Queue = asyncio.Queue()  # (event, data) for event_stream; None ends it
+
+    async def run_turn():
+        """
+        Run the graph and save the reply. Not tied to the response: if the
+        client goes away mid-stream the turn still finishes and its reply
+        is saved, as with /chat.
+        """
+        reply = None
+        try:
+            async for event, data in AIClient.stream_response(
+                session_id=session_id,
+                user_message=chat_request.message,
+                conversation_history=recent_history
+            ):
+                if event != "done":
+                    events.put_nowait((event, data))
+                    continue
+
+                reply = data
+                response = ChatResponse(
+                    answer=data["answer"],
+                    session_id=session_id,
+                    citations=data["citations"],
+                    created_at=datetime.now(),
+                    route=data["route"],
+                    refusal=data["refusal"],
+                    conversation_title=title
+                )
+                events.put_nowait(("done", response.model_dump(mode="json")))
+
+        except Exception as e:
+            print(f" Chat stream error: {e}")
+            traceback.print_exc()
+            events.put_nowait(("error", {
+                "error": "CHAT_PROCESSING_ERROR",
+                "message": "Failed to process your message"
+            }))
+        finally:
+            events.put_nowait(None)
+
+        # After the stream has been sent, so the commit is off the response path
+        if reply is None:
+            _reply_written(session_id, written)
+            return
+        await persist_chat_reply(
+            conversation_id,
+            reply["answer"],
+            [cite.model_dump() for cite in reply["citations"]] or None,
+            {"route": reply["route"], "refusal": reply["refusal"]},
+            "Chat message streamed", client_ip, user_id, session_id, written
+        )
+
+    turn = asyncio.create_task(run_turn())
+    _stream_turns.add(turn)
+    turn.add_done_callback(_stream_turns.discard)
+
+    async def event_stream():
+        while True:
+            item = await events.get()
+            if item is None:
+                break
+            yield _sse(*item)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",  # disable proxy buffering (nginx)
+            "X-Session-Id": session_id,
+        },
+    )
+
+@router.post("/chat/batch")
+@rate_limit("chat_batch")
+async def chat_batch_endpoint(
+    request: Request,
+    batch_request: BatchRequest,
+    current_user: Optional[dict] = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Answer many independent questions in one request (bulk evaluation,
+    pre-generation). Nothing is saved to conversations.
+
+    Streams NDJSON, one line per question as it completes:
+      {"index", "id", "answer", "citations", "route", "refusal", "cached", "elapsed_ms"}
+    and a final summary line:
+      {"done": true, "count", "cached", "elapsed_ms"}
+    """
+    questions = [q.message for q in batch_request.questions]
+    ids = [q.id for q in batch_request.questions]
+    concurrency = batch_request.concurrency or CHAT_BATCH_CONCURRENCY
+    user_id = current_user.get("id") if current_user else None
+    client_ip = get_client_ip(request)
+
+    print(f"📦 Batch request - {len(questions)} questions, User: {user_id}")
+
+    async def ndjson():
+        started = time.perf_counter()
+        count = cached_count = 0
+        try:
+            async for i, response, cached in AIClient.batch_responses(questions, concurrency):
+                count += 1
+                cached_count += int(cached)
+                yield json.dumps({
+                    "index": i,
+                    "id": ids[i],
+                    "answer": response["answer"],
+                    "citations": [c.model_dump() for c in response["citations"]],
+                    "route": response["route"],
+                    "refusal": response["refusal"],
+                    "cached": cached,
+                    "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+                }, ensure_ascii=False) + "\n"
+        except Exception as e:
+            print(f" Chat batch error: {e}")
+            traceback.print_exc()
+            yield json.dumps({"error": "CHAT_PROCESSING_ERROR", "message": "Failed to process the batch"}) + "\n"
+
+        elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+        yield json.dumps({"done": True, "count": count, "cached": cached_count, "elapsed_ms": elapsed_ms}) + "\n"
+
+        await log_sink.log(
+            "INFO", "chat", "Chat batch processed",
+            details={"questions": len(questions), "answered": count, "cached": cached_count, "elapsed_ms": elapsed_ms},
+            ip=client_ip,
+            user_id=user_id
+        )
+
+    return StreamingResponse(
+        ndjson(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+def _timestamp(value):
+    """DB timestamp as datetime (SQLite hands back strings), so JSON output matches the models"""
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            return value
+    return value
+
+def _message_json(msg: Dict) -> Dict:
+    """history dict (_history_message) -> MessageRead-shaped dict, without building the model"""
+    return {
+        "id": msg["id"],
+        "role": msg["role"],
+        "content": msg["content"],
+        "created_at": _timestamp(msg["created_at"]),
+        "citations": msg["citations"],
+        "metadata": msg["metadata"],
+    }
+
 @router.get("/history/{session_id}", response_model=HistoryResponse)
 async def get_history(
+    request: Request,
     session_id: str,
+    limit: int = Query(100, ge=1, le=500),
+    before_id: Optional[int] = Query(None, ge=1),
     current_user: Optional[dict] = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Get conversation history"""
+    """
+    Get conversation history: the latest `limit` messages, or the page before
+    message `before_id`. The ETag follows the conversation's updated_at and
+    message_count, so revalidating an unchanged conversation is a 304 without
+    reading any messages.
+    """
     try:
         # Check if conversation exists and user has access
         if current_user:
-            result = db.execute(
+            result = (await db.execute(
                 text("""
-                    SELECT c.id, c.title, c.created_at, c.updated_at
+                    SELECT c.id, c.title, c.created_at, c.updated_at, c.message_count
                     FROM conversations c
                     WHERE c.session_id = :session_id 
                     AND (c.user_id = :user_id OR c.user_id IS NULL)
                 """),
                 {"session_id": session_id, "user_id": current_user["id"]}
-            ).fetchone()
+            )).fetchone()
         else:
-            result = db.execute(
+            result = (await db.execute(
                 text("""
-                    SELECT c.id, c.title, c.created_at, c.updated_at
+                    SELECT c.id, c.title, c.created_at, c.updated_at, c.message_count
                     FROM conversations c
                     WHERE c.session_id = :session_id AND c.user_id IS NULL
                 """),
                 {"session_id": session_id}
-            ).fetchone()
+            )).fetchone()
         
         if not result:
             raise NotFoundError(
@@ -610,19 +1539,27 @@ async def get_history(
                 detail="Conversation not found or you don't have access"
             )
         
-        conv_id, title, created_at, updated_at = result
+        conv_id, title, created_at, updated_at, message_count = result
+        etag = make_etag("history", conv_id, updated_at, message_count, limit, before_id)
+        unchanged = not_modified(request, etag)
+        if unchanged is not None:
+            return unchanged
         
-        # Get messages
-        messages_data = get_conversation_history(db, session_id)
-        messages = [MessageRead(**msg) for msg in messages_data]
+        # Get messages (one extra row tells whether an older page exists)
+        messages_data = await get_conversation_history(db, session_id, limit=limit + 1, before_id=before_id)
+        has_more = len(messages_data) > limit
+        messages = [_message_json(msg) for msg in messages_data[-limit:]]
         
-        return HistoryResponse(
-            session_id=session_id,
-            title=title,
-            messages=messages,
-            created_at=created_at,
-            updated_at=updated_at
-        )
+        # HistoryResponse layout, serialized straight from dicts (orjson) rather than through the models
+        return json_response(request, {
+            "session_id": session_id,
+            "title": title,
+            "messages": messages,
+            "created_at": _timestamp(created_at),
+            "updated_at": _timestamp(updated_at),
+            "has_more": has_more,
+            "next_before_id": messages[0]["id"] if has_more else None,
+        }, etag=etag)
         
     except AppException:
         raise
@@ -636,48 +1573,84 @@ async def get_history(
             detail=str(e)
         )
 
+def _encode_conversation_cursor(updated_at, conversation_id: int) -> str:
+    """Opaque /my-conversations cursor: position (updated_at, id) of the last row served"""
+    return base64.urlsafe_b64encode(f"{updated_at}|{conversation_id}".encode()).decode()
+
+def _decode_conversation_cursor(cursor: str) -> Tuple[str, int]:
+    try:
+        updated_at, conversation_id = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit("|", 1)
+        return updated_at, int(conversation_id)
+    except Exception:
+        raise ValidationException(
+            message="Invalid cursor",
+            detail="Use the X-Next-Cursor header of the previous page"
+        )
+
 @router.get("/my-conversations", response_model=List[ConversationItem])
 async def get_user_conversations(
+    request: Request,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
     current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Get all conversations for authenticated user"""
+    """
+    Conversations of the authenticated user, most recently active first.
+    Returns one page; when there are more, the X-Next-Cursor response header
+    holds the `cursor` for the next page.
+    """
     if not current_user:
         raise AuthenticationError(
             message="Authentication required",
             detail="Please login to view your conversations"
         )
     
+    after = _decode_conversation_cursor(cursor) if cursor else None
     try:
-        result = db.execute(
-            text("""
-                SELECT 
-                    c.session_id,
-                    c.title,
-                    c.created_at,
-                    c.updated_at,
-                    COUNT(m.id) as message_count,
-                    MAX(m.created_at) as last_message_time
-                FROM conversations c
-                LEFT JOIN messages m ON c.id = m.conversation_id
-                WHERE c.user_id = :user_id
-                GROUP BY c.id
-                ORDER BY c.updated_at DESC
+        # keyset read on (user_id, updated_at): cost is one page, however many conversations the user has
+        result = (await db.execute(
+            text(f"""
+                SELECT id, session_id, title, created_at, updated_at,
+                       message_count, last_message, last_message_at
+                FROM conversations
+                WHERE user_id = :user_id
+                {"AND (updated_at < :after_ts OR (updated_at = :after_ts AND id < :after_id))" if after else ""}
+                ORDER BY updated_at DESC, id DESC
+                LIMIT :limit
             """),
-            {"user_id": current_user["id"]}
-        ).fetchall()
+            {
+                "user_id": current_user["id"],
+                "limit": limit + 1,
+                "after_ts": after[0] if after else None,
+                "after_id": after[1] if after else None
+            }
+        )).fetchall()
+        
+        headers = {}
+        if len(result) > limit:
+            result = result[:limit]
+            headers["X-Next-Cursor"] = _encode_conversation_cursor(result[-1][4], result[-1][0])
+        
+        # the page changes only if a listed row changes (every new message bumps updated_at and message_count)
+        etag = make_etag("conversations", cursor, limit, [(row[0], row[2], row[4], row[5]) for row in result])
+        unchanged = not_modified(request, etag, headers)
+        if unchanged is not None:
+            return unchanged
         
         conversations = []
         for row in result:
-            conversations.append(ConversationItem(
-                session_id=row[0],
-                title=row[1],
-                created_at=row[2],
-                updated_at=row[3],
-                message_count=row[4] or 0
-            ))
+            conversations.append({
+                "session_id": row[1],
+                "title": row[2],
+                "message_count": row[5] or 0,
+                "created_at": _timestamp(row[3]),
+                "updated_at": _timestamp(row[4]),
+                "last_message": row[6],
+                "last_message_at": _timestamp(row[7]),
+            })
         
-        return conversations
+        return json_response(request, conversations, etag=etag, headers=headers)
         
     except Exception as e:
         print(f" Error in get_user_conversations: {e}")
@@ -688,14 +1661,14 @@ async def get_user_conversations(
             detail=str(e)
         )
 
-@router.get("/history/{session_id}/recent")
+@router.get("/history/{session_id}/recent", response_class=FastJSONResponse)
 async def get_recent_history(
     session_id: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get only recent conversation history (last 5 messages)"""
     try:
-        messages = get_recent_conversation_history(db, session_id, last_n_messages=5)
+        messages = await get_conversation_history(db, session_id, limit=5)
         
         # Convert to MessageRead format
         message_list = []
@@ -710,14 +1683,14 @@ async def get_recent_history(
         }
     except Exception as e:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            status_code=500,
             detail=f"Error fetching recent history: {str(e)}"
         )
 
 @router.post("/new-session")
 async def create_new_session(
     current_user: Optional[dict] = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Create a new chat session"""
     try:
@@ -725,7 +1698,7 @@ async def create_new_session(
         user_id = current_user.get("id") if current_user else None
         
         # Create conversation
-        conversation_id = get_or_create_conversation(db, session_id, user_id)
+        conversation_id = await get_or_create_conversation(db, session_id, user_id)
         
         return {
             "session_id": session_id,
@@ -745,10 +1718,10 @@ async def create_new_session(
 
 # Admin endpoints
 @router.get("/debug/conversations")
-async def debug_conversations(db: Session = Depends(get_db)):
+async def debug_conversations(db: AsyncSession = Depends(get_async_db)):
     """Debug endpoint to list all conversations"""
     try:
-        result = db.execute(
+        result = (await db.execute(
             text("""
                 SELECT 
                     c.id, c.session_id, c.user_id, c.title,
@@ -760,7 +1733,7 @@ async def debug_conversations(db: Session = Depends(get_db)):
                 ORDER BY c.updated_at DESC
                 LIMIT 20
             """)
-        ).fetchall()
+        )).fetchall()
         
         return {
             "conversations": [
@@ -783,7 +1756,7 @@ async def debug_conversations(db: Session = Depends(get_db)):
 async def delete_conversation(
     session_id: str,
     current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Delete a conversation"""
     if not current_user:
@@ -794,10 +1767,10 @@ async def delete_conversation(
     
     try:
         # Verify ownership
-        result = db.execute(
+        result = (await db.execute(
             text("SELECT id FROM conversations WHERE session_id = :session_id AND user_id = :user_id"),
             {"session_id": session_id, "user_id": current_user["id"]}
-        ).fetchone()
+        )).fetchone()
         
         if not result:
             raise NotFoundError(
@@ -806,18 +1779,18 @@ async def delete_conversation(
             )
         
         # Delete conversation
-        db.execute(
+        await db.execute(
             text("DELETE FROM conversations WHERE session_id = :session_id"),
             {"session_id": session_id}
         )
-        db.commit()
+        await db.commit()
         
         return {"message": "Conversation deleted successfully"}
         
     except AppException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         print(f" Error deleting conversation: {e}")
         raise AppException(
             error_code="CONVERSATION_DELETION_ERROR",
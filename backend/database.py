@@ -1,24 +1,140 @@
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from datetime import datetime
 from dotenv import load_dotenv
+from typing import Callable, List
 import os
 import sys
+import time
 
 load_dotenv()
 
+# Async driver for MySQL: aiomysql (default) or asyncmy
+DB_ASYNC_DRIVER = os.getenv("DB_ASYNC_DRIVER", "aiomysql")
+
+# Connection pool (per engine and per worker process)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))  # seconds a request waits for a connection
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # keep below MySQL wait_timeout
+# true: ping on every checkout (one extra round trip); false: rely on DB_POOL_RECYCLE
+# and let a connection dropped by the server fail one request
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() not in ("0", "false", "no")
+
+# Called after every pooled checkout with (engine label, seconds waited, timed out);
+# main.py registers the /metrics one
+pool_wait_observers: List[Callable[[str, float, bool], None]] = []
+
+class _TimedCheckout:
+    """Pool mixin: reports how long each checkout waited (including opening a new connection)"""
+    engine_label = ""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        timed_out = False
+        try:
+            return super()._do_get()
+        except PoolTimeout:
+            timed_out = True
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            for observe in pool_wait_observers:
+                observe(self.engine_label, waited, timed_out)
+
+class TimedQueuePool(_TimedCheckout, QueuePool):
+    engine_label = "sync"
+
+class TimedAsyncQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+    engine_label = "async"
+
+def pool_options(db_url: str, is_async: bool = False) -> dict:
+    """create_engine() / create_async_engine() pool arguments from the DB_POOL_* settings"""
+    url = make_url(db_url)
+    options = {"pool_pre_ping": DB_POOL_PRE_PING}
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        return options  # in-memory SQLite keeps its single-connection pool
+    options.update(
+        poolclass=TimedAsyncQueuePool if is_async else TimedQueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+    )
+    return options
+
+def async_url(db_url: str) -> str:
+    """Async twin of a sync database URL (same database, asyncio driver)"""
+    url = make_url(db_url)
+    if url.get_backend_name() == "mysql":
+        return url.set(drivername=f"mysql+{DB_ASYNC_DRIVER}").render_as_string(hide_password=False)
+    if url.get_backend_name() == "sqlite":
+        return url.set(drivername="sqlite+aiosqlite").render_as_string(hide_password=False)
+    return db_url
+
+def _sqlite_functions(dbapi_connection, connection_record):
+    """MySQL functions used in queries, for SQLite (local tests)"""
+    dbapi_connection.create_function("NOW", 0, lambda: datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+    dbapi_connection.create_function("UTC_TIMESTAMP", 0, lambda: datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"))
+
+def _ensure_index(conn, table: str, name: str, columns: str):
+    """ALTER TABLE ... ADD INDEX unless the index already exists (MySQL)"""
+    exists = conn.execute(
+        text("""
+            SELECT 1 FROM information_schema.statistics
+            WHERE table_schema = DATABASE() AND table_name = :table AND index_name = :name
+            LIMIT 1
+        """),
+        {"table": table, "name": name}
+    ).fetchone()
+    if not exists:
+        conn.execute(text(f"ALTER TABLE {table} ADD INDEX {name} ({columns})"))
+        print(f" Added index {name} on {table} ({columns})")
+
+def _ensure_column(conn, table: str, name: str, definition: str) -> bool:
+    """ALTER TABLE ... ADD COLUMN unless it exists (MySQL); True if it was added"""
+    exists = conn.execute(
+        text("""
+            SELECT 1 FROM information_schema.columns
+            WHERE table_schema = DATABASE() AND table_name = :table AND column_name = :name
+            LIMIT 1
+        """),
+        {"table": table, "name": name}
+    ).fetchone()
+    if exists:
+        return False
+    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {definition}"))
+    print(f" Added column {table}.{name}")
+    return True
+
 class Database:
     def __init__(self):
         self.db_url = None
         self.engine = None
         self.SessionLocal = None
+        self.async_engine = None
+        self.AsyncSessionLocal = None
         self._initialize()
     
     def _initialize(self):
         """Initialize database connection with error handling"""
         try:
-            self.db_url = f"mysql+pymysql://{os.getenv('dbuser')}:{os.getenv('dbpassword')}@{os.getenv('dbhost')}:{os.getenv('dbport')}/{os.getenv('dbname')}"
-            self.engine = create_engine(self.db_url, pool_pre_ping=True)
+            # DATABASE_URL overrides the MySQL settings, e.g. sqlite:///./dev.db for local tests
+            self.db_url = os.getenv("DATABASE_URL") or f"mysql+pymysql://{os.getenv('dbuser')}:{os.getenv('dbpassword')}@{os.getenv('dbhost')}:{os.getenv('dbport')}/{os.getenv('dbname')}"
+            self.engine = create_engine(self.db_url, **pool_options(self.db_url))
             self.SessionLocal = sessionmaker(bind=self.engine, autocommit=False, autoflush=False)
+
+            # Routers use the async engine; the sync one serves startup and scripts
+            self.async_engine = create_async_engine(async_url(self.db_url), **pool_options(self.db_url, is_async=True))
+            self.AsyncSessionLocal = async_sessionmaker(bind=self.async_engine, autoflush=False, expire_on_commit=False)
+
+            if self.engine.dialect.name == "sqlite":
+                event.listen(self.engine, "connect", _sqlite_functions)
+                event.listen(self.async_engine.sync_engine, "connect", _sqlite_functions)
             
             # Test connection
             with self.engine.connect() as conn:
@@ -31,9 +147,12 @@ class Database:
             print(f" Database connection failed: {e}")
             print(" Running in fallback mode")
             self.SessionLocal = sessionmaker()
+            self.AsyncSessionLocal = async_sessionmaker(class_=AsyncSession)
     
     def _create_tables(self):
         """Create ALL necessary tables"""
+        if self.engine.dialect.name == "sqlite":
+            return self._create_sqlite_tables()
         try:
             with self.engine.begin() as conn:
                 print("🔄 Creating database tables...")
@@ -83,11 +202,14 @@ class Database:
                         session_id VARCHAR(100) NOT NULL UNIQUE,
                         user_id INT NULL,
                         title VARCHAR(200) DEFAULT 'New Conversation',
+                        message_count INT NOT NULL DEFAULT 0,
+                        last_message_at TIMESTAMP NULL,
+                        last_message VARCHAR(255) NULL,
                         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                         updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
                         FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE SET NULL,
                         INDEX idx_session_id (session_id),
-                        INDEX idx_user_id (user_id),
+                        INDEX idx_user_updated (user_id, updated_at),
                         INDEX idx_updated_at (updated_at)
                     ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
                 """))
@@ -101,15 +223,32 @@ class Database:
                         role VARCHAR(20) NOT NULL,
                         content TEXT NOT NULL,
                         citations JSON,
+                        citation_ids JSON,
                         metadata JSON,
                         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                         FOREIGN KEY (conversation_id) REFERENCES conversations(id) ON DELETE CASCADE,
-                        INDEX idx_conversation_id (conversation_id),
+                        INDEX idx_conversation_id_id (conversation_id, id),
                         INDEX idx_created_at (created_at)
                     ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
                 """))
                 print("    ✅ Messages table created")
                 
+                # Citations, stored once per (index generation, chunk, quote) and referenced by messages.citation_ids
+                conn.execute(text("""
+                    CREATE TABLE IF NOT EXISTS citations (
+                        id INT AUTO_INCREMENT PRIMARY KEY,
+                        generation VARCHAR(32) NOT NULL,
+                        chunk_id VARCHAR(255) NOT NULL,
+                        quote_hash CHAR(40) NOT NULL,
+                        source VARCHAR(255) NOT NULL,
+                        pages VARCHAR(100) NOT NULL,
+                        quote TEXT NOT NULL,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        UNIQUE KEY uq_citation (generation, chunk_id, quote_hash)
+                    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+                """))
+                print("    ✅ Citations table created")
+                
                 # Rate limit logs table
                 conn.execute(text("""
                     CREATE TABLE IF NOT EXISTS rate_limit_logs (
@@ -121,7 +260,8 @@ class Database:
                         window_end TIMESTAMP NOT NULL,
                         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                         INDEX idx_ip_endpoint (ip_address, endpoint),
-                        INDEX idx_window (window_start, window_end)
+                        INDEX idx_window (window_start, window_end),
+                        INDEX idx_created_at (created_at)
                     ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
                 """))
                 print("    ✅ Rate limit logs table created")
@@ -145,6 +285,29 @@ class Database:
                 """))
                 print(" System logs table created")
                 
+                # Tables created by older versions get the columns and indexes added since
+                _ensure_index(conn, "messages", "idx_conversation_id_id", "conversation_id, id")
+                _ensure_index(conn, "conversations", "idx_user_updated", "user_id, updated_at")
+                _ensure_column(conn, "messages", "citation_ids", "JSON NULL AFTER citations")
+                _ensure_index(conn, "rate_limit_logs", "idx_created_at", "created_at")
+                if _ensure_column(conn, "conversations", "message_count", "INT NOT NULL DEFAULT 0"):
+                    _ensure_column(conn, "conversations", "last_message_at", "TIMESTAMP NULL")
+                    _ensure_column(conn, "conversations", "last_message", "VARCHAR(255) NULL")
+                    # one-off backfill; from here on chat.py keeps the summary current
+                    conn.execute(text("""
+                        UPDATE conversations c
+                        LEFT JOIN (
+                            SELECT conversation_id, COUNT(*) AS n, MAX(id) AS last_id
+                            FROM messages GROUP BY conversation_id
+                        ) s ON s.conversation_id = c.id
+                        LEFT JOIN messages m ON m.id = s.last_id
+                        SET c.message_count = COALESCE(s.n, 0),
+                            c.last_message_at = m.created_at,
+                            c.last_message = LEFT(m.content, 100),
+                            c.updated_at = c.updated_at
+                    """))
+                    print(" Backfilled conversation summaries")
+                
                 print("All database tables created successfully!")
                 
         except Exception as e:
@@ -152,10 +315,100 @@ class Database:
             import traceback
             traceback.print_exc()
     
+    def _create_sqlite_tables(self):
+        """Same schema for SQLite (DATABASE_URL=sqlite:///..., local tests only)"""
+        with self.engine.begin() as conn:
+            for ddl in [
+                """CREATE TABLE IF NOT EXISTS users (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    email VARCHAR(255) UNIQUE NOT NULL,
+                    username VARCHAR(100) UNIQUE NOT NULL,
+                    password_hash VARCHAR(255) NOT NULL,
+                    full_name VARCHAR(255),
+                    is_active BOOLEAN DEFAULT TRUE,
+                    is_verified BOOLEAN DEFAULT FALSE,
+                    failed_login_attempts INT DEFAULT 0,
+                    locked_until TIMESTAMP NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )""",
+                """CREATE TABLE IF NOT EXISTS password_reset_tokens (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+                    token VARCHAR(64) UNIQUE NOT NULL,
+                    expires_at DATETIME NOT NULL,
+                    used BOOLEAN DEFAULT FALSE,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )""",
+                """CREATE TABLE IF NOT EXISTS conversations (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    session_id VARCHAR(100) NOT NULL UNIQUE,
+                    user_id INT NULL REFERENCES users(id) ON DELETE SET NULL,
+                    title VARCHAR(200) DEFAULT 'New Conversation',
+                    message_count INT NOT NULL DEFAULT 0,
+                    last_message_at TIMESTAMP NULL,
+                    last_message VARCHAR(255) NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )""",
+                "CREATE INDEX IF NOT EXISTS idx_conversations_user_updated ON conversations (user_id, updated_at)",
+                """CREATE TABLE IF NOT EXISTS messages (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    conversation_id INT NOT NULL REFERENCES conversations(id) ON DELETE CASCADE,
+                    role VARCHAR(20) NOT NULL,
+                    content TEXT NOT NULL,
+                    citations JSON,
+                    citation_ids JSON,
+                    metadata JSON,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )""",
+                """CREATE TABLE IF NOT EXISTS citations (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    generation VARCHAR(32) NOT NULL,
+                    chunk_id VARCHAR(255) NOT NULL,
+                    quote_hash CHAR(40) NOT NULL,
+                    source VARCHAR(255) NOT NULL,
+                    pages VARCHAR(100) NOT NULL,
+                    quote TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    UNIQUE (generation, chunk_id, quote_hash)
+                )""",
+                "CREATE INDEX IF NOT EXISTS idx_messages_conversation_id_id ON messages (conversation_id, id)",
+                """CREATE TABLE IF NOT EXISTS rate_limit_logs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    ip_address VARCHAR(45) NOT NULL,
+                    endpoint VARCHAR(100) NOT NULL,
+                    request_count INT DEFAULT 1,
+                    window_start TIMESTAMP NOT NULL,
+                    window_end TIMESTAMP NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )""",
+                "CREATE INDEX IF NOT EXISTS idx_rate_limit_ip_endpoint ON rate_limit_logs (ip_address, endpoint)",
+                "CREATE INDEX IF NOT EXISTS idx_rate_limit_created_at ON rate_limit_logs (created_at)",
+                """CREATE TABLE IF NOT EXISTS system_logs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    level VARCHAR(20) NOT NULL,
+                    service VARCHAR(50) NOT NULL,
+                    message TEXT NOT NULL,
+                    details JSON,
+                    ip_address VARCHAR(45),
+                    user_id INT NULL REFERENCES users(id) ON DELETE SET NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )""",
+                "CREATE INDEX IF NOT EXISTS idx_system_logs_created_at ON system_logs (created_at)",
+                "CREATE INDEX IF NOT EXISTS idx_conversations_updated_at ON conversations (updated_at)",
+            ]:
+                conn.execute(text(ddl))
+        print("All database tables created successfully (SQLite)!")
+    
     def get_session(self):
         """Get database session with context manager"""
         return self.SessionLocal()
     
+    def get_async_session(self) -> AsyncSession:
+        """Get an async database session (use with `async with`)"""
+        return self.AsyncSessionLocal()
+    
     def close(self):
         """Close database connection"""
         if self.engine:
@@ -177,6 +430,15 @@ def get_db():
     finally:
         session.close()
 
+
+async def get_async_db():
+    """
+    FastAPI dependency that yields an async database session.
+    Usage: db: AsyncSession = Depends(get_async_db)
+    """
+    async with db_manager.get_async_session() as session:
+        yield session
+
 if __name__ == "__main__":
     print(" Testing database...")
     try:
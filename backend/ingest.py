@@ -6,11 +6,12 @@ import json
 import sys
 import os
 from pathlib import Path
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text
 
 # Database
-from database import get_db
+from database import get_async_db
+from log_sink import log_sink
 
 router = APIRouter()
 
@@ -20,18 +21,27 @@ PROJECT_ROOT = CURRENT_DIR.parent  # project_root/
 if str(PROJECT_ROOT) not in sys.path:
     sys.path.insert(0, str(PROJECT_ROOT))
 
-# Import AI engine components 
-try:
-    from ai_engine.tax_engine.ingest import ingest_pdfs
-    from ai_engine.tax_engine.vectorstore import upsert_incremental
-    from ai_engine.tax_engine.config import settings
+# AI engine ingest components, imported on the first /ingest call (PDF parsing,
+# chromadb and langchain are not needed to start the server)
+AI_INGEST_AVAILABLE = None  # unknown until the first import attempt
+
+
+def _load_ingest():
+    """(ingest_pdfs, upsert_incremental), or None if the AI engine cannot be imported"""
+    global AI_INGEST_AVAILABLE
+    try:
+        from ai_engine.tax_engine.ingest import ingest_pdfs
+        from ai_engine.tax_engine.vectorstore import upsert_incremental
+    except ImportError as e:
+        AI_INGEST_AVAILABLE = False
+        print(f" AI Engine ingest import failed: {e}")
+        print(f" Python path: {sys.path}")
+        print(f" Project root: {PROJECT_ROOT}")
+        return None
+    if not AI_INGEST_AVAILABLE:
+        print("AI Engine ingest module loaded")
     AI_INGEST_AVAILABLE = True
-    print("AI Engine ingest module loaded")
-except ImportError as e:
-    AI_INGEST_AVAILABLE = False
-    print(f" AI Engine ingest import failed: {e}")
-    print(f" Python path: {sys.path}")
-    print(f" Project root: {PROJECT_ROOT}")
+    return ingest_pdfs, upsert_incremental
 
 # Pydantic models
 class IngestResponse(BaseModel):
@@ -53,16 +63,18 @@ def sha1_text(text: str) -> str:
 @router.post("/ingest", response_model=IngestResponse)
 async def ingest_documents(
     request: IngestRequest = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Rebuild the vector database from PDF documents.
     """
-    if not AI_INGEST_AVAILABLE:
+    ingest_modules = _load_ingest()
+    if ingest_modules is None:
         raise HTTPException(
             status_code=500, 
             detail="AI Engine not available. Check that ai_engine folder exists at project root."
         )
+    ingest_pdfs, upsert_incremental = ingest_modules
     
     if request is None:
         request = IngestionRequest()
@@ -91,24 +103,15 @@ async def ingest_documents(
         stats = upsert_incremental(docs)
         
         # Log to database
-        try:
-            db.execute(
-                text("""
-                    INSERT INTO system_logs (action, details, timestamp)
-                    VALUES ('ingest', :details, NOW())
-                """),
-                {
-                    "details": json.dumps({
-                        "chunks_processed": len(docs),
-                        "stats": stats,
-                        "request": request.dict(),
-                        "duration_seconds": (datetime.now() - start_time).total_seconds()
-                    })
-                }
-            )
-            db.commit()
-        except Exception as log_error:
-            print(f" Failed to log to database: {log_error}")
+        await log_sink.log(
+            "INFO", "ingest", "Ingestion completed",
+            details={
+                "chunks_processed": len(docs),
+                "stats": stats,
+                "request": request.dict(),
+                "duration_seconds": (datetime.now() - start_time).total_seconds()
+            }
+        )
         
         # Prepare response
         duration = (datetime.now() - start_time).total_seconds()
@@ -141,18 +144,18 @@ async def ingest_documents(
         )
 
 @router.get("/ingest/status")
-async def get_ingest_status(db: Session = Depends(get_db)):
+async def get_ingest_status(db: AsyncSession = Depends(get_async_db)):
     """Get latest ingestion status"""
     try:
-        result = db.execute(
+        result = (await db.execute(
             text("""
-                SELECT details, timestamp 
+                SELECT details, created_at 
                 FROM system_logs 
-                WHERE action = 'ingest' 
-                ORDER BY timestamp DESC 
+                WHERE service = 'ingest' 
+                ORDER BY created_at DESC 
                 LIMIT 1
             """)
-        ).fetchone()
+        )).fetchone()
         
         if result:
             details = json.loads(result[0]) if result[0] else {}
@@ -0,0 +1,160 @@
+"""
+Batched writer for system_logs.
+
+Routes hand log rows to `log_sink.log(...)`, which only queues them; a
+background task writes them with one multi-row INSERT and one commit per
+batch (every LOG_SINK_BATCH rows or LOG_SINK_FLUSH_MS, whichever comes
+first). Log writes therefore add no round trip or fsync to user requests.
+
+The queue is bounded (LOG_SINK_QUEUE). When it is full, LOG_SINK_DROP decides:
+  oldest  drop the oldest queued row (default; keeps the most recent activity)
+  newest  drop the row being logged
+  block   wait up to LOG_SINK_BLOCK_MS for room (backpressure), then drop it
+"""
+import asyncio
+import json
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import text
+
+from database import db_manager
+
+LOG_SINK_QUEUE = int(os.getenv("LOG_SINK_QUEUE", "10000"))
+LOG_SINK_BATCH = int(os.getenv("LOG_SINK_BATCH", "200"))
+LOG_SINK_FLUSH_MS = float(os.getenv("LOG_SINK_FLUSH_MS", "1000"))
+LOG_SINK_DROP = os.getenv("LOG_SINK_DROP", "oldest").lower()
+LOG_SINK_BLOCK_MS = float(os.getenv("LOG_SINK_BLOCK_MS", "100"))
+
+INSERT_LOG = text("""
+    INSERT INTO system_logs (level, service, message, details, ip_address, user_id, created_at)
+    VALUES (:level, :service, :message, :details, :ip_address, :user_id, :created_at)
+""")
+
+
+class LogSink:
+    def __init__(
+        self,
+        max_queue: int = LOG_SINK_QUEUE,
+        batch_size: int = LOG_SINK_BATCH,
+        flush_interval: float = LOG_SINK_FLUSH_MS / 1000,
+        drop_policy: str = LOG_SINK_DROP,
+        block_timeout: float = LOG_SINK_BLOCK_MS / 1000
+    ):
+        if drop_policy not in ("oldest", "newest", "block"):
+            raise ValueError(f"LOG_SINK_DROP must be oldest, newest or block, not {drop_policy!r}")
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.drop_policy = drop_policy
+        self.block_timeout = block_timeout
+        self._queue: Optional[asyncio.Queue] = None
+        self._batch_ready: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self._stats = {"queued": 0, "written": 0, "dropped": 0, "failed": 0, "batches": 0}
+
+    # -----------------------------
+    # Producer side
+    # -----------------------------
+    async def log(
+        self,
+        level: str,
+        service: str,
+        message: str,
+        details: Optional[Dict[str, Any]] = None,
+        ip: Optional[str] = None,
+        user_id: Optional[int] = None
+    ) -> bool:
+        """Queue one system_logs row; returns False if it was dropped"""
+        self.start()
+        row = {
+            "level": level,
+            "service": service,
+            "message": message,
+            "details": json.dumps(details, default=str) if details else None,
+            "ip_address": ip,
+            "user_id": user_id,
+            "created_at": datetime.now(),
+        }
+        try:
+            self._queue.put_nowait(row)
+        except asyncio.QueueFull:
+            if self.drop_policy == "newest":
+                self._stats["dropped"] += 1
+                return False
+            if self.drop_policy == "oldest":
+                self._queue.get_nowait()
+                self._queue.put_nowait(row)
+                self._stats["dropped"] += 1
+            else:
+                try:
+                    await asyncio.wait_for(self._queue.put(row), self.block_timeout)
+                except asyncio.TimeoutError:
+                    self._stats["dropped"] += 1
+                    return False
+
+        self._stats["queued"] += 1
+        if self._queue.qsize() >= self.batch_size:
+            self._batch_ready.set()
+        return True
+
+    # -----------------------------
+    # Writer side
+    # -----------------------------
+    def start(self) -> None:
+        """Start the writer task on the running loop (idempotent; log() calls it)"""
+        if self._task is None or self._task.done():
+            self._queue = self._queue or asyncio.Queue(maxsize=self.max_queue)
+            self._batch_ready = self._batch_ready or asyncio.Event()
+            self._closing = False
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        """Flush what is queued and stop the writer"""
+        if self._task is None:
+            return
+        self._closing = True
+        self._batch_ready.set()
+        try:
+            await asyncio.wait_for(self._task, timeout=max(5.0, self.flush_interval * 2))
+        except asyncio.TimeoutError:
+            self._task.cancel()
+            print(f" Log sink: {self._queue.qsize()} rows not written at shutdown")
+        self._task = None
+
+    async def _run(self) -> None:
+        while not (self._closing and self._queue.empty()):
+            # sleep until a full batch is queued, the flush interval passes or we close
+            try:
+                await asyncio.wait_for(self._batch_ready.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._batch_ready.clear()
+
+            while not self._queue.empty():
+                batch = [self._queue.get_nowait() for _ in range(min(self.batch_size, self._queue.qsize()))]
+                await self._write(batch)
+
+    async def _write(self, batch: List[Dict[str, Any]]) -> None:
+        db = db_manager.get_async_session()
+        try:
+            await db.execute(INSERT_LOG, batch)  # executemany: one multi-row INSERT on MySQL
+            await db.commit()
+            self._stats["written"] += len(batch)
+            self._stats["batches"] += 1
+        except Exception as e:
+            await db.rollback()
+            self._stats["failed"] += len(batch)
+            print(f" Log sink: failed to write {len(batch)} rows: {e}")
+        finally:
+            await db.close()
+
+    def stats(self) -> Dict[str, int]:
+        s = dict(self._stats)
+        s["queue_depth"] = self._queue.qsize() if self._queue is not None else 0
+        return s
+
+
+log_sink = LogSink()
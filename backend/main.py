@@ -1,15 +1,20 @@
 from fastapi import FastAPI, HTTPException, status, Request  
 from fastapi.middleware.cors import CORSMiddleware 
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from dotenv import load_dotenv
+from sqlalchemy import text
 from datetime import datetime
+from contextlib import asynccontextmanager
+import asyncio
 import uvicorn
 import os
 import sys
+import time
 import uuid
 from pathlib import Path
 
-# Import routers
+# Import routers (the AI engine itself is loaded lazily, see lifespan below)
+import chat
 from chat import router as chat_router
 from ingest import router as ingest_router
 from auth import router as auth_router
@@ -40,7 +45,107 @@ else:
 
 load_dotenv()
 
+from ai_engine.tax_engine.metrics import (
+    REGISTRY, CONTENT_TYPE, HTTP_SECONDS, HTTP_DB_SECONDS, HTTP_DB_QUERIES,
+    begin_request_db_timer, end_request_db_timer, instrument_engine, instrument_pool, observe_pool_wait,
+)
+from database import db_manager, pool_wait_observers
+from log_sink import log_sink
+from rate_limiter import rate_limiter
+from responses import response_stats
+from maintenance import maintenance_loop, maintenance_stats, MAINTENANCE_INTERVAL_HOURS
+from auth_cache import user_cache, token_cache
+from security import bcrypt_stats, BCRYPT_WORKERS
+
+pool_wait_observers.append(observe_pool_wait)
+if db_manager.engine is not None:
+    instrument_engine(db_manager.engine)
+    instrument_pool(db_manager.engine, "sync")
+if db_manager.async_engine is not None:
+    instrument_engine(db_manager.async_engine.sync_engine)
+    instrument_pool(db_manager.async_engine.sync_engine, "async")
+
+REGISTRY.counter(
+    "rate_limit_store_busy_total", "Rate-limit hits counted in worker memory because the shared SQLite store was locked",
+    callback=lambda: {(): getattr(rate_limiter.store, "busy", 0)},
+)
+
+REGISTRY.counter(
+    "log_sink_rows_total", "system_logs rows by outcome (queued, written, dropped on a full queue, failed to write)", ["result"],
+    callback=lambda: {(k,): v for k, v in log_sink.stats().items() if k in ("queued", "written", "dropped", "failed")},
+)
+REGISTRY.counter("log_sink_batches_total", "Multi-row system_logs INSERTs committed", callback=lambda: {(): log_sink.stats()["batches"]})
+REGISTRY.gauge("log_sink_queue_depth", "system_logs rows waiting to be written", callback=lambda: {(): log_sink.stats()["queue_depth"]})
+
+REGISTRY.counter(
+    "auth_cache_requests_total", "get_current_user cache lookups (user records, verified JWTs)", ["cache", "result"],
+    callback=lambda: {
+        (c.name, result): c.stats()[key]
+        for c in (user_cache, token_cache) for result, key in (("hit", "hits"), ("miss", "misses"))
+    },
+)
+REGISTRY.gauge("auth_cache_size", "Entries in the auth caches", ["cache"], callback=lambda: {(c.name,): c.stats()["size"] for c in (user_cache, token_cache)})
+
+REGISTRY.gauge("password_hash_workers", "Threads in the bcrypt pool", callback=lambda: {(): BCRYPT_WORKERS})
+REGISTRY.gauge("password_hash_pending", "bcrypt calls queued or running", callback=lambda: {(): bcrypt_stats["pending"]})
+REGISTRY.counter("password_hash_total", "bcrypt calls completed", ["op"], callback=lambda: {(op,): bcrypt_stats[op] for op in ("hash", "verify")})
+REGISTRY.counter(
+    "password_hash_seconds_total", "Seconds spent in bcrypt (op) and queued for a bcrypt thread (wait)", ["op"],
+    callback=lambda: {(op,): bcrypt_stats[f"{op}_seconds"] for op in ("hash", "verify", "wait")},
+)
+REGISTRY.counter("password_hash_rejected_total", "Requests refused with 503 because the bcrypt queue was full", callback=lambda: {(): bcrypt_stats["rejected"]})
+
+REGISTRY.counter("maintenance_runs_total", "Completed retention/archival runs", callback=lambda: {(): maintenance_stats["runs"]})
+REGISTRY.counter("maintenance_failures_total", "Retention/archival runs that failed", callback=lambda: {(): maintenance_stats["failures"]})
+REGISTRY.counter(
+    "maintenance_rows_deleted_total", "Rows removed by retention (conversations: archived, then deleted)", ["table"],
+    callback=lambda: {(table,): n for table, n in maintenance_stats["deleted"].items()},
+)
+REGISTRY.counter("maintenance_partitions_dropped_total", "Expired monthly partitions dropped", callback=lambda: {(): maintenance_stats["partitions_dropped"]})
+REGISTRY.gauge("maintenance_last_run_seconds", "Duration of the last maintenance run", callback=lambda: {(): maintenance_stats["last_seconds"] or 0})
+
+REGISTRY.counter(
+    "http_conditional_responses_total", "History/conversation list responses: full body or 304 Not Modified", ["result"],
+    callback=lambda: {("full",): response_stats["full"], ("not_modified",): response_stats["not_modified"]},
+)
+REGISTRY.counter(
+    "http_response_encoding_total", "JSON bodies sent per Content-Encoding", ["encoding"],
+    callback=lambda: {(e,): response_stats[e] for e in ("identity", "gzip", "br")},
+)
+REGISTRY.counter(
+    "http_response_bytes_total", "JSON body bytes before (raw) and after (sent) compression", ["stage"],
+    callback=lambda: {("raw",): response_stats["bytes_raw"], ("sent",): response_stats["bytes_sent"]},
+)
+
+PROCESS_START = time.time()
+REGISTRY.gauge("process_start_time_seconds", "Start time of the process (unix epoch)", callback=lambda: {(): PROCESS_START})
+
+# AI_WARMUP=false skips the startup warm-up: the engine then loads on the first chat (dev reloads)
+AI_WARMUP = os.getenv("AI_WARMUP", "true").lower() not in ("0", "false", "no")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    The server binds before the AI engine is loaded; warm-up runs in the
+    background and GET /ready turns 200 once it is done, so autoscaling and
+    rolling restarts only route traffic to warm workers.
+    """
+    warmup = asyncio.create_task(chat.warm_up_ai_engine()) if AI_WARMUP else None
+    log_sink.start()
+    maintenance = asyncio.create_task(maintenance_loop()) if MAINTENANCE_INTERVAL_HOURS > 0 else None
+    yield
+    if warmup is not None and not warmup.done():
+        warmup.cancel()
+    if maintenance is not None:
+        maintenance.cancel()
+    await log_sink.stop()
+    if db_manager.async_engine is not None:
+        await db_manager.async_engine.dispose()
+
+
 app = FastAPI(
+    lifespan=lifespan,
     title="Taxify AI Assistant",
     version="1.0.0",
     description="Agentic RAG System for Nigerian Tax Reform Bills",
@@ -57,6 +162,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
 
@@ -125,17 +231,32 @@ async def add_request_id(request: Request, call_next):
     response = await call_next(request)
     return response
 
+def _route_template(request: Request) -> str:
+    """/api/history/abc -> /api/history/{session_id}: keeps metric label cardinality bounded"""
+    if request.scope.get("route") is None:
+        return "unmatched"
+    params = {str(v): k for k, v in (request.scope.get("path_params") or {}).items()}
+    return "/".join("{" + params[seg] + "}" if seg in params else seg for seg in request.url.path.split("/"))
+
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
-    """Log all incoming requests"""
-    start_time = datetime.now()
-    
-    response = await call_next(request)
-    
-    duration = (datetime.now() - start_time).total_seconds() * 1000
-    
-    
-    print(f"{request.method} {request.url.path} - {response.status_code} - {duration:.2f}ms")
+    """Log all incoming requests and record HTTP / DB timing metrics"""
+    start_time = time.perf_counter()
+    db_token = begin_request_db_timer()
+
+    try:
+        response = await call_next(request)
+    finally:
+        db_seconds, db_queries = end_request_db_timer(db_token)
+
+    duration = time.perf_counter() - start_time
+
+    route_label = _route_template(request)
+    HTTP_SECONDS.observe(duration, method=request.method, route=route_label, status=response.status_code)
+    HTTP_DB_SECONDS.observe(db_seconds, route=route_label)
+    HTTP_DB_QUERIES.observe(db_queries, route=route_label)
+
+    print(f"{request.method} {request.url.path} - {response.status_code} - {duration * 1000:.2f}ms (db {db_seconds * 1000:.1f}ms/{db_queries}q)")
     
     return response
 
@@ -162,6 +283,7 @@ def home():
             },
             "chat": {
                 "new_chat": "POST /api/chat",
+                "stream_chat": "POST /api/chat/stream",
                 "history": "GET /api/history/{session_id}",
                 "my_conversations": "GET /api/my-conversations"
             },
@@ -201,35 +323,44 @@ async def detailed_health_check():
     try:
         # Check database
         from database import db_manager
-        with db_manager.engine.connect() as conn:
-            conn.execute("SELECT 1")
+        async with db_manager.async_engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
         health_status["components"]["database"] = "healthy"
     except Exception as e:
         health_status["components"]["database"] = f"unhealthy: {str(e)}"
         health_status["status"] = "degraded"
     
-    # Check AI engine
+    # Check AI engine (not loaded yet counts as degraded too)
     try:
-        from chat import AI_ENGINE_AVAILABLE
-        health_status["components"]["ai_engine"] = "available" if AI_ENGINE_AVAILABLE else "unavailable"
-        if not AI_ENGINE_AVAILABLE:
+        health_status["components"]["ai_engine"] = "available" if chat.AI_ENGINE_AVAILABLE else chat.ai_engine_status["state"]
+        if not chat.AI_ENGINE_AVAILABLE:
             health_status["status"] = "degraded"
     except:
         health_status["components"]["ai_engine"] = "unknown"
     
     return health_status
 
+@app.get("/ready")
+async def readiness_check():
+    """
+    Readiness probe: 200 once the AI engine is loaded and warm, 503 before
+    that (or if warm-up failed). /health stays the liveness probe.
+    """
+    # with AI_WARMUP=false there is nothing to wait for; the first chat loads the engine
+    ready = chat.ai_engine_status["state"] == "ready" or not AI_WARMUP
+    return JSONResponse(
+        status_code=status.HTTP_200_OK if ready else status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={
+            "ready": ready,
+            "ai_engine": {**chat.ai_engine_status, "loaded": chat.AI_ENGINE_AVAILABLE},
+            "uptime_seconds": round(time.time() - PROCESS_START, 3),
+        },
+    )
+
 @app.get("/metrics")
 async def get_metrics():
-    """Basic metrics endpoint"""
-    return {
-        "timestamp": datetime.now().isoformat(),
-        "metrics": {
-            "uptime": "todo",
-            "requests_served": "todo",
-            "active_users": "todo"
-        }
-    }
+    """Prometheus metrics: graph nodes, LLM calls, vector search, HTTP/DB timing, caches"""
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
 
 # For evaluation compatibility
 @app.get("/health-check")
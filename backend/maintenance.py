@@ -0,0 +1,434 @@
+"""
+Retention and archival for the tables that grow with traffic.
+
+A background task (started in main.py's lifespan, MAINTENANCE_START_DELAY_S
+after startup and then every MAINTENANCE_INTERVAL_HOURS) or a cron job (`python maintenance.py`) runs:
+
+  system_logs       rows older than RETENTION_SYSTEM_LOGS_DAYS are deleted
+  rate_limit_logs   rows older than RETENTION_RATE_LIMIT_LOGS_DAYS are deleted
+  conversations     conversations idle for ARCHIVE_CONVERSATIONS_DAYS are written,
+                    with their messages and citations, to gzip NDJSON files in
+                    ARCHIVE_DIR (one JSON object per conversation), then deleted
+
+Deletes go in chunks of MAINTENANCE_BATCH rows, one short transaction each,
+with MAINTENANCE_PAUSE_MS between chunks, so they never hold long locks or
+bloat the undo log while requests are running. A conversation is only
+deleted once its archive line has been flushed to disk, and only if it is
+still idle when the delete runs (a new message in the meantime keeps it).
+Its LangGraph checkpoint thread is dropped too when the AI engine runs in
+the same process, and otherwise expires after CHECKPOINT_TTL. A retention of
+0 disables that step.
+
+With MAINTENANCE_PARTITIONING=true (MySQL), system_logs and rate_limit_logs
+are converted to monthly RANGE partitions on created_at: expired months are
+dropped with ALTER TABLE ... DROP PARTITION (no row-by-row delete) and
+MAINTENANCE_PARTITIONS_AHEAD future months are kept ready. Partitioned InnoDB
+tables cannot have foreign keys, so the conversion drops system_logs.user_id's
+FK and widens the primary key to (id, created_at). messages stays
+unpartitioned (it is referenced by, and references, other tables); archival
+keeps it small instead.
+
+Only one run at a time: MySQL GET_LOCK across hosts, plus a lock file in
+ARCHIVE_DIR for the workers on one host.
+"""
+import asyncio
+import gzip
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import bindparam, text
+
+from database import db_manager
+
+try:
+    import fcntl
+except ImportError:  # Windows: rely on GET_LOCK (MySQL) only
+    fcntl = None
+
+RETENTION_SYSTEM_LOGS_DAYS = int(os.getenv("RETENTION_SYSTEM_LOGS_DAYS", "90"))
+RETENTION_RATE_LIMIT_LOGS_DAYS = int(os.getenv("RETENTION_RATE_LIMIT_LOGS_DAYS", "7"))
+ARCHIVE_CONVERSATIONS_DAYS = int(os.getenv("ARCHIVE_CONVERSATIONS_DAYS", "180"))
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "archive"))
+MAINTENANCE_BATCH = int(os.getenv("MAINTENANCE_BATCH", "1000"))
+MAINTENANCE_PAUSE_MS = float(os.getenv("MAINTENANCE_PAUSE_MS", "50"))
+# 0 disables the in-process schedule (run `python maintenance.py` from cron instead)
+MAINTENANCE_INTERVAL_HOURS = float(os.getenv("MAINTENANCE_INTERVAL_HOURS", "24"))
+MAINTENANCE_START_DELAY_S = float(os.getenv("MAINTENANCE_START_DELAY_S", "300"))
+MAINTENANCE_PARTITIONING = os.getenv("MAINTENANCE_PARTITIONING", "false").lower() in ("1", "true", "yes")
+MAINTENANCE_PARTITIONS_AHEAD = int(os.getenv("MAINTENANCE_PARTITIONS_AHEAD", "3"))
+
+# table -> retention in days (rows are aged by created_at)
+LOG_RETENTION = {
+    "system_logs": RETENTION_SYSTEM_LOGS_DAYS,
+    "rate_limit_logs": RETENTION_RATE_LIMIT_LOGS_DAYS,
+}
+# conversations archived per chunk (their messages are read along with them)
+ARCHIVE_BATCH = max(1, MAINTENANCE_BATCH // 10)
+
+maintenance_stats: Dict[str, Any] = {
+    "runs": 0, "failures": 0, "last_run": None, "last_seconds": None,
+    "deleted": {}, "archived": 0, "partitions_dropped": 0,
+}
+
+
+def _count(table: str, n: int) -> None:
+    maintenance_stats["deleted"][table] = maintenance_stats["deleted"].get(table, 0) + n
+
+
+async def _pause() -> None:
+    if MAINTENANCE_PAUSE_MS > 0:
+        await asyncio.sleep(MAINTENANCE_PAUSE_MS / 1000)
+
+
+# -----------------------------
+# Chunked deletes
+# -----------------------------
+async def delete_older_than(table: str, cutoff: datetime, batch: int = MAINTENANCE_BATCH) -> int:
+    """Delete `table` rows with created_at < cutoff, `batch` primary keys per transaction"""
+    # created_at order walks idx_created_at ((created_at, id) in InnoDB); ORDER BY id would sort every expired row per chunk
+    select_ids = text(f"SELECT id FROM {table} WHERE created_at < :cutoff ORDER BY created_at, id LIMIT :batch")
+    delete_ids = text(f"DELETE FROM {table} WHERE id IN :ids").bindparams(bindparam("ids", expanding=True))
+    deleted = 0
+    while True:
+        async with db_manager.get_async_session() as db:
+            ids = [row[0] for row in await db.execute(select_ids, {"cutoff": cutoff, "batch": batch})]
+            if not ids:
+                break
+            await db.execute(delete_ids, {"ids": ids})
+            await db.commit()
+        deleted += len(ids)
+        _count(table, len(ids))
+        if len(ids) < batch:
+            break
+        await _pause()
+    return deleted
+
+
+# -----------------------------
+# Conversation archival
+# -----------------------------
+def _json_value(value):
+    """JSON columns come back as str (raw SQL); decode them for the archive"""
+    if isinstance(value, (str, bytes)):
+        try:
+            return json.loads(value)
+        except ValueError:
+            return value
+    return value
+
+
+async def _archive_chunk(db, conversations) -> List[Dict[str, Any]]:
+    """Archive records (conversation + messages + resolved citations) for one chunk"""
+    ids = [row[0] for row in conversations]
+    messages = (await db.execute(
+        text("""
+            SELECT conversation_id, id, role, content, citations, citation_ids, metadata, created_at
+            FROM messages WHERE conversation_id IN :ids ORDER BY conversation_id, id
+        """).bindparams(bindparam("ids", expanding=True)),
+        {"ids": ids}
+    )).fetchall()
+
+    citation_ids = set()
+    for m in messages:
+        citation_ids.update(_json_value(m[5]) or [])
+    citations = {}
+    if citation_ids:
+        result = await db.execute(
+            text("SELECT id, chunk_id, source, pages, quote FROM citations WHERE id IN :ids")
+            .bindparams(bindparam("ids", expanding=True)),
+            {"ids": sorted(citation_ids)}
+        )
+        citations = {cid: {"chunk_id": c, "source": s, "pages": p, "quote": q} for cid, c, s, p, q in result}
+
+    by_conversation: Dict[int, List[Dict[str, Any]]] = {cid: [] for cid in ids}
+    for conversation_id, mid, role, content, legacy, cids, metadata, created_at in messages:
+        if cids:
+            cited = [citations[c] for c in _json_value(cids) if c in citations]
+        else:
+            cited = _json_value(legacy)
+        by_conversation[conversation_id].append({
+            "id": mid, "role": role, "content": content,
+            "citations": cited or None, "metadata": _json_value(metadata), "created_at": created_at,
+        })
+
+    return [
+        {
+            "id": cid, "session_id": session_id, "user_id": user_id, "title": title,
+            "created_at": created_at, "updated_at": updated_at,
+            "messages": by_conversation[cid],
+        }
+        for cid, session_id, user_id, title, created_at, updated_at in conversations
+    ]
+
+
+def _forget_threads(session_ids: List[str]) -> None:
+    """
+    Drop the LangGraph checkpoint threads (thread_id = session_id) of archived
+    conversations from the checkpointer of the AI engine loaded in this
+    process. Threads elsewhere (other workers' in-memory savers, or a cron run
+    that never loads the engine) are not touched; they expire after
+    CHECKPOINT_TTL, which is far shorter than ARCHIVE_CONVERSATIONS_DAYS.
+    """
+    chat = sys.modules.get("chat")
+    saver = getattr(getattr(chat, "ai_graph", None), "checkpointer", None)
+    if saver is None or not hasattr(saver, "delete_thread"):
+        return
+    for session_id in session_ids:
+        try:
+            saver.delete_thread(session_id)
+        except Exception as e:
+            print(f" Could not drop checkpoint thread {session_id}: {e}")
+            return
+
+
+async def archive_conversations(cutoff: datetime, archive_dir: str = ARCHIVE_DIR, batch: int = ARCHIVE_BATCH) -> int:
+    """
+    Move conversations not updated since `cutoff` to
+    archive_dir/conversations-<timestamp>.ndjson.gz, `batch` conversations
+    per transaction. Returns the number archived.
+
+    A new message touches its conversation's updated_at in the same
+    transaction, so the deletes repeat the `updated_at < :cutoff` check:
+    a conversation that came back to life after the SELECT is kept (and
+    not archived). On MySQL the selected rows are also locked FOR UPDATE.
+    """
+    lock = " FOR UPDATE" if db_manager.async_engine.dialect.name == "mysql" else ""
+    select_idle = text(f"""
+        SELECT id, session_id, user_id, title, created_at, updated_at
+        FROM conversations WHERE updated_at < :cutoff
+        ORDER BY updated_at, id LIMIT :batch{lock}
+    """)
+    # messages explicitly: SQLite does not enforce ON DELETE CASCADE by default
+    delete_messages = text("""
+        DELETE FROM messages WHERE conversation_id IN (
+            SELECT id FROM conversations WHERE id IN :ids AND updated_at < :cutoff
+        )
+    """).bindparams(bindparam("ids", expanding=True))
+    delete_conversations = text(
+        "DELETE FROM conversations WHERE id IN :ids AND updated_at < :cutoff"
+    ).bindparams(bindparam("ids", expanding=True))
+    select_kept = text("SELECT id FROM conversations WHERE id IN :ids").bindparams(bindparam("ids", expanding=True))
+
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f"conversations-{datetime.now().strftime('%Y%m%d-%H%M%S')}.ndjson.gz")
+    archived = 0
+    out = None
+    try:
+        while True:
+            async with db_manager.get_async_session() as db:
+                conversations = (await db.execute(select_idle, {"cutoff": cutoff, "batch": batch})).fetchall()
+                if not conversations:
+                    break
+                records = await _archive_chunk(db, conversations)
+
+                ids = [record["id"] for record in records]
+                params = {"ids": ids, "cutoff": cutoff}
+                await db.execute(delete_messages, params)
+                await db.execute(delete_conversations, params)
+                kept = {row[0] for row in await db.execute(select_kept, {"ids": ids})}
+                records = [record for record in records if record["id"] not in kept]
+
+                if records and out is None:
+                    out = gzip.open(path, "wt", encoding="utf-8")
+                for record in records:
+                    out.write(json.dumps(record, default=str, ensure_ascii=False) + "\n")
+                if records:
+                    # on disk before the deletes commit: a crash loses nothing, at worst archives a chunk twice
+                    out.flush()  # TextIOWrapper -> GzipFile.flush(): Z_SYNC_FLUSH, then the file
+                    os.fsync(out.buffer.fileobj.fileno())
+                await db.commit()
+
+            if kept:
+                print(f" {len(kept)} conversations became active during archival; kept")
+            await asyncio.to_thread(_forget_threads, [record["session_id"] for record in records])
+            archived += len(records)
+            maintenance_stats["archived"] += len(records)
+            _count("conversations", len(records))
+            if len(conversations) < batch:
+                break
+            await _pause()
+    finally:
+        if out is not None:
+            out.close()
+            print(f" Archived {archived} conversations to {path}")
+    return archived
+
+
+# -----------------------------
+# Monthly partitions (MySQL)
+# -----------------------------
+def _month_start(day: datetime, months_ahead: int = 0) -> datetime:
+    month = day.month - 1 + months_ahead
+    return datetime(day.year + month // 12, month % 12 + 1, 1)
+
+
+def _partition_def(month: datetime) -> str:
+    bound = _month_start(month, 1).strftime("%Y-%m-%d 00:00:00")
+    return f"PARTITION p{month:%Y%m} VALUES LESS THAN (UNIX_TIMESTAMP('{bound}'))"
+
+
+async def _partitions(conn, table: str) -> Dict[str, Optional[int]]:
+    """partition name -> upper bound (unix time; None for MAXVALUE); empty if not partitioned"""
+    result = await conn.execute(
+        text("""
+            SELECT partition_name, partition_description FROM information_schema.partitions
+            WHERE table_schema = DATABASE() AND table_name = :table AND partition_name IS NOT NULL
+        """),
+        {"table": table}
+    )
+    return {name: None if bound == "MAXVALUE" else int(bound) for name, bound in result}
+
+
+async def _partition_table(conn, table: str, now: datetime) -> None:
+    """One-off conversion of `table` to monthly partitions on created_at (rebuilds the table)"""
+    oldest = (await conn.execute(text(f"SELECT MIN(created_at) FROM {table}"))).scalar() or now
+    if isinstance(oldest, str):
+        oldest = datetime.fromisoformat(oldest)
+    # partitioned InnoDB tables cannot have foreign keys, and every unique key must include created_at
+    fks = await conn.execute(
+        text("""
+            SELECT constraint_name FROM information_schema.referential_constraints
+            WHERE constraint_schema = DATABASE() AND table_name = :table
+        """),
+        {"table": table}
+    )
+    for (fk,) in fks.fetchall():
+        await conn.execute(text(f"ALTER TABLE {table} DROP FOREIGN KEY {fk}"))
+    await conn.execute(text(f"""
+        ALTER TABLE {table}
+        MODIFY created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        DROP PRIMARY KEY, ADD PRIMARY KEY (id, created_at)
+    """))
+
+    months, month = [], _month_start(oldest)
+    while month <= _month_start(now, MAINTENANCE_PARTITIONS_AHEAD):
+        months.append(_partition_def(month))
+        month = _month_start(month, 1)
+    months.append("PARTITION pmax VALUES LESS THAN MAXVALUE")
+    await conn.execute(text(f"ALTER TABLE {table} PARTITION BY RANGE (UNIX_TIMESTAMP(created_at)) ({', '.join(months)})"))
+    print(f" Partitioned {table} by month ({len(months) - 1} partitions)")
+
+
+async def maintain_partitions(table: str, cutoff: datetime, now: Optional[datetime] = None) -> int:
+    """
+    Keep MAINTENANCE_PARTITIONS_AHEAD future months and drop the months that
+    end before `cutoff`. Returns the number of partitions dropped; rows of the
+    partially expired month are left to delete_older_than.
+    """
+    now = now or datetime.now()
+    async with db_manager.async_engine.connect() as conn:
+        partitions = await _partitions(conn, table)
+        if not partitions:
+            await _partition_table(conn, table, now)
+            partitions = await _partitions(conn, table)
+
+        future = []
+        month = _month_start(now)
+        while month <= _month_start(now, MAINTENANCE_PARTITIONS_AHEAD):
+            if f"p{month:%Y%m}" not in partitions:
+                future.append(_partition_def(month))
+            month = _month_start(month, 1)
+        if future and "pmax" in partitions:
+            await conn.execute(text(
+                f"ALTER TABLE {table} REORGANIZE PARTITION pmax INTO "
+                f"({', '.join(future)}, PARTITION pmax VALUES LESS THAN MAXVALUE)"
+            ))
+
+        expired = [name for name, bound in partitions.items() if bound is not None and bound <= cutoff.timestamp()]
+        if expired:
+            await conn.execute(text(f"ALTER TABLE {table} DROP PARTITION {', '.join(expired)}"))
+            print(f" Dropped {len(expired)} expired partitions of {table}")
+        await conn.commit()
+    maintenance_stats["partitions_dropped"] += len(expired)
+    return len(expired)
+
+
+# -----------------------------
+# One run, locking, schedule
+# -----------------------------
+class _RunLock:
+    """Held by at most one maintenance run: flock per host, GET_LOCK per MySQL server"""
+
+    def __init__(self):
+        self._file = None
+        self._conn = None
+
+    async def acquire(self) -> bool:
+        if fcntl is not None:
+            os.makedirs(ARCHIVE_DIR, exist_ok=True)
+            self._file = open(os.path.join(ARCHIVE_DIR, ".maintenance.lock"), "w")
+            try:
+                fcntl.flock(self._file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                await self.release()
+                return False
+        if db_manager.async_engine.dialect.name == "mysql":
+            self._conn = await db_manager.async_engine.connect()
+            got = (await self._conn.execute(text("SELECT GET_LOCK('taxify_maintenance', 0)"))).scalar()
+            if got != 1:
+                await self.release()
+                return False
+        return True
+
+    async def release(self) -> None:
+        if self._conn is not None:
+            try:
+                await self._conn.execute(text("SELECT RELEASE_LOCK('taxify_maintenance')"))
+            finally:
+                await self._conn.close()
+                self._conn = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+async def run_maintenance(now: Optional[datetime] = None) -> Optional[Dict[str, int]]:
+    """One pass of every retention step; None if another run holds the lock"""
+    lock = _RunLock()
+    if not await lock.acquire():
+        print(" Maintenance: another run is in progress, skipping")
+        return None
+    started = time.perf_counter()
+    now = now or datetime.now()
+    done: Dict[str, int] = {}
+    try:
+        partitioned = MAINTENANCE_PARTITIONING and db_manager.async_engine.dialect.name == "mysql"
+        for table, days in LOG_RETENTION.items():
+            if days <= 0:
+                continue
+            cutoff = now - timedelta(days=days)
+            if partitioned:
+                done[f"{table}_partitions_dropped"] = await maintain_partitions(table, cutoff, now)
+            done[f"{table}_deleted"] = await delete_older_than(table, cutoff)
+        if ARCHIVE_CONVERSATIONS_DAYS > 0:
+            done["conversations_archived"] = await archive_conversations(now - timedelta(days=ARCHIVE_CONVERSATIONS_DAYS))
+        maintenance_stats["runs"] += 1
+    except Exception as e:
+        maintenance_stats["failures"] += 1
+        print(f" Maintenance failed: {e}")
+        raise
+    finally:
+        await lock.release()
+        maintenance_stats["last_run"] = time.time()
+        maintenance_stats["last_seconds"] = time.perf_counter() - started
+    print(f" Maintenance done in {maintenance_stats['last_seconds']:.1f}s: {done}")
+    return done
+
+
+async def maintenance_loop() -> None:
+    """Run maintenance MAINTENANCE_START_DELAY_S after startup, then every MAINTENANCE_INTERVAL_HOURS"""
+    await asyncio.sleep(MAINTENANCE_START_DELAY_S)
+    while True:
+        try:
+            await run_maintenance()
+        except Exception:
+            pass  # counted in maintenance_stats; try again next interval
+        await asyncio.sleep(MAINTENANCE_INTERVAL_HOURS * 3600)
+
+
+if __name__ == "__main__":
+    asyncio.run(run_maintenance())
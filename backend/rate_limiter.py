@@ -1,87 +1,168 @@
 from functools import wraps
-from datetime import datetime, timedelta
-from typing import Optional, Callable
+from collections import OrderedDict
+from typing import Optional, Callable, Tuple
+import math
+import os
+import sqlite3
+import tempfile
+import threading
 import time
 
 from fastapi import Request, HTTPException
-from sqlalchemy.orm import Session
-from sqlalchemy import text
 
-from database import get_db
 from errors import RateLimitError
 
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+def _slide(state: Optional[Tuple[int, int, int]], now: float, window: int) -> Tuple[int, int, int, float]:
+    """
+    Sliding-window counter: (window index, count in this window, count in the
+    previous one) rolled forward to `now`, plus the estimated requests in the
+    last `window` seconds (previous window weighted by how much of it overlaps).
+    """
+    index = int(now // window)
+    current = previous = 0
+    if state is not None:
+        last_index, last_current, last_previous = state
+        if last_index == index:
+            current, previous = last_current, last_previous
+        elif last_index == index - 1:
+            previous = last_current
+    overlap = 1 - (now - index * window) / window
+    return index, current, previous, current + previous * overlap
+
+def _retry_after(index: int, now: float, window: int) -> int:
+    return max(1, math.ceil((index + 1) * window - now))
+
+class MemoryRateLimitStore:
+    """Counters in process memory: one uvicorn worker, O(1) per key, LRU-bounded"""
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._counters: "OrderedDict[str, Tuple[int, int, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key: str, limit: int, window: int) -> Tuple[bool, int]:
+        """Count one request; returns (allowed, retry_after seconds)"""
+        now = time.time()
+        with self._lock:
+            index, current, previous, estimate = _slide(self._counters.get(key), now, window)
+            if estimate >= limit:
+                return False, _retry_after(index, now, window)
+            self._counters[key] = (index, current + 1, previous)
+            self._counters.move_to_end(key)
+            if len(self._counters) > self.max_keys:
+                self._counters.popitem(last=False)
+        return True, 0
+
+# hit() runs on the event loop: wait at most this long for another worker's write lock
+RATE_LIMIT_SQLITE_BUSY_MS = float(os.getenv("RATE_LIMIT_SQLITE_BUSY_MS", "20"))
+
+class SQLiteRateLimitStore:
+    """
+    Counters in a local SQLite file, shared by all uvicorn workers on the host.
+    One row per key; WAL and synchronous=OFF since losing a few counts on a
+    crash is harmless.
+
+    Transactions are a few microseconds, but hit() is called from the event
+    loop, so it never waits long for the file lock: when another worker holds
+    it past RATE_LIMIT_SQLITE_BUSY_MS, the request is counted in this worker's
+    memory store instead (limits stay enforced per worker for that moment).
+    """
+
+    def __init__(self, path: str, busy_timeout_ms: float = RATE_LIMIT_SQLITE_BUSY_MS):
+        self.path = path
+        self.busy = 0  # hits counted in memory because the file was locked
+        self._fallback = MemoryRateLimitStore()
+        self._conn = sqlite3.connect(path, timeout=busy_timeout_ms / 1000, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=OFF")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS rate_limits (
+                key TEXT PRIMARY KEY,
+                window_index INTEGER NOT NULL,
+                current INTEGER NOT NULL,
+                previous INTEGER NOT NULL,
+                expires REAL NOT NULL
+            )
+        """)
+        self._lock = threading.Lock()
+        self._hits = 0
+
+    def hit(self, key: str, limit: int, window: int) -> Tuple[bool, int]:
+        """Count one request; returns (allowed, retry_after seconds)"""
+        try:
+            return self._hit(key, limit, window)
+        except sqlite3.OperationalError as e:  # "database is locked" after the busy timeout
+            self.busy += 1
+            if self.busy == 1 or self.busy % 1000 == 0:
+                print(f" Rate limiter: SQLite store busy ({e}), counting in memory ({self.busy} so far)")
+            return self._fallback.hit(key, limit, window)
+
+    def _hit(self, key: str, limit: int, window: int) -> Tuple[bool, int]:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT window_index, current, previous FROM rate_limits WHERE key = ?", (key,)
+                ).fetchone()
+                index, current, previous, estimate = _slide(row, now, window)
+                if estimate >= limit:
+                    return False, _retry_after(index, now, window)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO rate_limits (key, window_index, current, previous, expires) VALUES (?, ?, ?, ?, ?)",
+                    (key, index, current + 1, previous, (index + 2) * window)
+                )
+                # Forget keys idle for two windows
+                self._hits += 1
+                if self._hits % 1000 == 0:
+                    self._conn.execute("DELETE FROM rate_limits WHERE expires < ?", (now,))
+                return True, 0
+            finally:
+                self._conn.execute("COMMIT")
+
 class RateLimiter:
     def __init__(self):
+        # RATE_LIMIT_ENABLED=false is meant for local load tests only
+        self.enabled = os.getenv("RATE_LIMIT_ENABLED", "true").lower() not in ("0", "false", "no")
         self.rate_limit_config = {
-            "default": {"limit": 100, "window": 60},  
-            "login": {"limit": 10, "window": 60},    
-            "register": {"limit": 5, "window": 60},   
-            "chat": {"limit": 50, "window": 3600},    
-            "password_reset": {"limit": 3, "window": 3600},  
+            "default": {"limit": 100, "window": 60},
+            "login": {"limit": 10, "window": 60},
+            "register": {"limit": 5, "window": 60},
+            "chat": {"limit": 50, "window": 3600},
+            "chat_batch": {"limit": 20, "window": 3600},  # each batch counts once
+            "password_reset": {"limit": 3, "window": 3600},
         }
-    
+        # memory: per worker process; sqlite: shared by the workers on one host
+        backend = os.getenv("RATE_LIMIT_BACKEND", "memory").lower()
+        if backend == "sqlite":
+            path = os.getenv("RATE_LIMIT_DB") or os.path.join(tempfile.gettempdir(), "taxify_rate_limits.sqlite")
+            self.store = SQLiteRateLimitStore(path)
+            print(f" Rate limiter: SQLite store at {path}")
+        else:
+            self.store = MemoryRateLimitStore()
+
+    def get_limit(self, endpoint: str) -> Tuple[int, int]:
+        """(limit, window seconds) for a configured name or a spec like "10/minute" """
+        if endpoint in self.rate_limit_config:
+            config = self.rate_limit_config[endpoint]
+            return config["limit"], config["window"]
+        count, _, period = endpoint.partition("/")
+        if count.isdigit() and period in PERIODS:
+            return int(count), PERIODS[period]
+        config = self.rate_limit_config["default"]
+        return config["limit"], config["window"]
+
     def check_rate_limit(
-        self, 
-        ip_address: str, 
-        endpoint: str, 
-        db: Session
-    ) -> bool:
-        """Check if request is within rate limit"""
-        config = self.rate_limit_config.get(endpoint, self.rate_limit_config["default"])
-        limit = config["limit"]
-        window = config["window"]
-        
-        window_start = datetime.utcnow() - timedelta(seconds=window)
-        
-        # Get current request count for this IP and endpoint
-        result = db.execute(
-            text("""
-                SELECT SUM(request_count) 
-                FROM rate_limit_logs 
-                WHERE ip_address = :ip 
-                AND endpoint = :endpoint
-                AND window_start >= :window_start
-            """),
-            {
-                "ip": ip_address,
-                "endpoint": endpoint,
-                "window_start": window_start
-            }
-        ).fetchone()
-        
-        current_count = result[0] or 0
-        
-        if current_count >= limit:
-            return False
-        
-        
-        db.execute(
-            text("""
-                INSERT INTO rate_limit_logs 
-                (ip_address, endpoint, request_count, window_start, window_end)
-                VALUES (:ip, :endpoint, 1, :window_start, :window_end)
-            """),
-            {
-                "ip": ip_address,
-                "endpoint": endpoint,
-                "window_start": window_start,
-                "window_end": datetime.utcnow()
-            }
-        )
-        db.commit()
-        
-        return True
-    
-    def cleanup_old_logs(self, db: Session):
-        """Clean up old rate limit logs"""
-        # Keep logs for 24 hours only
-        cutoff = datetime.utcnow() - timedelta(hours=24)
-        
-        db.execute(
-            text("DELETE FROM rate_limit_logs WHERE window_end < :cutoff"),
-            {"cutoff": cutoff}
-        )
-        db.commit()
+        self,
+        ip_address: str,
+        endpoint: str,
+        key: Optional[str] = None
+    ) -> Tuple[bool, int]:
+        """Check if request is within rate limit; returns (allowed, retry_after seconds)"""
+        limit, window = self.get_limit(endpoint)
+        return self.store.hit(f"{key or endpoint}:{ip_address}", limit, window)
 
 rate_limiter = RateLimiter()
 
@@ -92,8 +173,13 @@ def get_client_ip(request: Request) -> str:
     return "unknown"
 
 def rate_limit(endpoint: str = "default"):
-    """Rate limiting decorator"""
+    """
+    Rate limiting decorator. `endpoint` is a configured name (routes sharing a
+    name share the quota) or a spec like "10/minute" (counted per route).
+    """
     def decorator(func: Callable):
+        key = endpoint if endpoint in rate_limiter.rate_limit_config else f"{func.__name__}[{endpoint}]"
+
         @wraps(func)
         async def wrapper(*args, **kwargs):
             # Find request object
@@ -102,57 +188,31 @@ def rate_limit(endpoint: str = "default"):
                 if isinstance(arg, Request):
                     request = arg
                     break
-            
+
             if not request:
-                for key, value in kwargs.items():
+                for key_name, value in kwargs.items():
                     if isinstance(value, Request):
                         request = value
                         break
-            
+
             if not request:
                 raise HTTPException(500, "Request object not found")
-            
-            # Get database session
-            db = None
-            for arg in args:
-                if isinstance(arg, Session):
-                    db = arg
-                    break
-            
-            if not db:
-                for key, value in kwargs.items():
-                    if isinstance(value, Session):
-                        db = value
-                        break
-            
-            if not db:
-                # Try to get from dependencies
-                for key, value in kwargs.items():
-                    if key == "db":
-                        db = value
-                        break
-            
-            if not db:
-                raise HTTPException(500, "Database session not found")
-            
+
+            if not rate_limiter.enabled:
+                return await func(*args, **kwargs)
+
             # Get client IP
             ip_address = get_client_ip(request)
-            
+
             # Check rate limit
-            if not rate_limiter.check_rate_limit(ip_address, endpoint, db):
-                # Clean up old logs
-                rate_limiter.cleanup_old_logs(db)
-                
+            allowed, retry_after = rate_limiter.check_rate_limit(ip_address, endpoint, key)
+            if not allowed:
                 raise RateLimitError(
-                    retry_after=60,
+                    retry_after=retry_after,
                     detail=f"Rate limit exceeded for {endpoint}"
                 )
-            
-            # Clean up old logs periodically (every 100 requests)
-            if int(time.time()) % 100 == 0:
-                rate_limiter.cleanup_old_logs(db)
-            
+
             return await func(*args, **kwargs)
-        
+
         return wrapper
-    return decorator
\ No newline at end of file
+    return decorator
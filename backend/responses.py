@@ -0,0 +1,156 @@
+"""
+JSON responses for the large read endpoints (history, conversation list).
+
+  dumps()          orjson when installed (several times faster than the stdlib
+                   encoder and Pydantic's serializer), json otherwise
+  not_modified()   an empty 304 when If-None-Match has the current ETag;
+                   routes check it before reading or building the content
+  json_response()  encodes once and compresses bodies of at least
+                   RESPONSE_COMPRESS_MIN_BYTES with brotli (if the `brotli`
+                   package is installed) or gzip, as negotiated by
+                   Accept-Encoding
+
+ETags are weak (W/"..."): the same content is sent with different encodings,
+and the tag is derived from what the content depends on (e.g. a
+conversation's updated_at and message_count), not from the bytes, so a
+revalidation costs one small query and no serialization.
+"""
+import gzip
+import hashlib
+import json
+import os
+from datetime import date, datetime
+from typing import Any, Dict, Optional
+
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+RESPONSE_COMPRESS_MIN_BYTES = int(os.getenv("RESPONSE_COMPRESS_MIN_BYTES", "1024"))
+RESPONSE_GZIP_LEVEL = int(os.getenv("RESPONSE_GZIP_LEVEL", "6"))
+RESPONSE_BROTLI_QUALITY = int(os.getenv("RESPONSE_BROTLI_QUALITY", "5"))
+
+# Browsers keep the response but revalidate it on every use (If-None-Match -> 304)
+CACHE_CONTROL = "private, no-cache"
+
+response_stats: Dict[str, int] = {
+    "not_modified": 0, "full": 0,
+    "bytes_raw": 0, "bytes_sent": 0,
+    "identity": 0, "gzip": 0, "br": 0,
+}
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        return value.model_dump()
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    """Compact UTF-8 JSON; datetimes as ISO 8601, Pydantic models via model_dump()"""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with dumps()"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def make_etag(*parts: Any) -> str:
+    """Weak ETag from the values the response depends on"""
+    digest = hashlib.sha1("|".join(str(p) for p in parts).encode()).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """If-None-Match check with weak comparison (RFC 9110 13.1.2)"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    wanted = etag[2:] if etag.startswith("W/") else etag
+    return any(
+        (tag.strip()[2:] if tag.strip().startswith("W/") else tag.strip()) == wanted
+        for tag in header.split(",")
+    )
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """br or gzip if the client accepts it (q > 0), br first; None for identity"""
+    accepted: Dict[str, float] = {}
+    for item in accept_encoding.lower().split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            accepted[name.strip()] = q
+    for encoding in (("br", "gzip") if brotli is not None else ("gzip",)):
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+def _cache_headers(etag: Optional[str], headers: Optional[Dict[str, str]]) -> Dict[str, str]:
+    headers = dict(headers or {})
+    headers["Vary"] = "Accept-Encoding"
+    if etag is not None:
+        headers["ETag"] = etag
+        headers["Cache-Control"] = CACHE_CONTROL
+    return headers
+
+
+def not_modified(request: Request, etag: str, headers: Optional[Dict[str, str]] = None) -> Optional[Response]:
+    """An empty 304 if the client already has `etag`, else None (build and send the content)"""
+    if not etag_matches(request, etag):
+        return None
+    response_stats["not_modified"] += 1
+    return Response(status_code=304, headers=_cache_headers(etag, headers))
+
+
+def json_response(
+    request: Request,
+    content: Any,
+    etag: Optional[str] = None,
+    headers: Optional[Dict[str, str]] = None,
+    status_code: int = 200
+) -> Response:
+    """`content` as JSON, compressed if worth it, with `etag` for later revalidation"""
+    headers = _cache_headers(etag, headers)
+    if etag is not None:
+        response_stats["full"] += 1
+
+    body = dumps(content)
+    response_stats["bytes_raw"] += len(body)
+    encoding = None
+    if len(body) >= RESPONSE_COMPRESS_MIN_BYTES:
+        encoding = choose_encoding(request.headers.get("accept-encoding", ""))
+    if encoding == "br":
+        body = brotli.compress(body, quality=RESPONSE_BROTLI_QUALITY)
+    elif encoding == "gzip":
+        body = gzip.compress(body, compresslevel=RESPONSE_GZIP_LEVEL, mtime=0)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    response_stats[encoding or "identity"] += 1
+    response_stats["bytes_sent"] += len(body)
+    return Response(body, status_code=status_code, headers=headers, media_type="application/json")
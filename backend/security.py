@@ -1,12 +1,19 @@
+import asyncio
 import bcrypt
 import jwt
 import secrets
 import hashlib
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional, Tuple
 from dotenv import load_dotenv
 
+from auth_cache import token_cache
+from errors import ServiceError
+
 load_dotenv()
 
 # Configuration
@@ -15,6 +22,22 @@ ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_DAYS = int(os.getenv("JWT_EXPIRE_DAYS", "7"))
 PASSWORD_RESET_EXPIRE_MINUTES = int(os.getenv("PASSWORD_RESET_EXPIRE_MINUTES", "30"))
 
+# bcrypt cost (log2 rounds): each step doubles the CPU per hash. Existing hashes
+# with another cost are rehashed on the next successful login.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# bcrypt runs on its own threads so it never blocks the event loop; beyond
+# BCRYPT_MAX_PENDING queued/running hashes, requests get a 503 instead of waiting
+BCRYPT_WORKERS = int(os.getenv("BCRYPT_WORKERS", str(min(4, os.cpu_count() or 1))))
+BCRYPT_MAX_PENDING = int(os.getenv("BCRYPT_MAX_PENDING", "64"))
+
+_bcrypt_pool = ThreadPoolExecutor(max_workers=BCRYPT_WORKERS, thread_name_prefix="bcrypt")
+_bcrypt_lock = threading.Lock()
+bcrypt_stats = {
+    "pending": 0, "rejected": 0,
+    "hash": 0, "verify": 0,
+    "hash_seconds": 0.0, "verify_seconds": 0.0, "wait_seconds": 0.0,
+}
+
 def hash_password(password: str) -> str:
     """Hash a password using bcrypt"""
    
@@ -25,7 +48,7 @@ def hash_password(password: str) -> str:
         password_bytes = password_bytes[:72]
     
     # Generate salt and hash
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
     hashed = bcrypt.hashpw(password_bytes, salt)
     return hashed.decode('utf-8')
 
@@ -44,6 +67,46 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
         print(f"Password verification error: {e}")
         return False
 
+def password_needs_rehash(hashed_password: str) -> bool:
+    """True if the hash was made with a cost other than BCRYPT_ROUNDS ($2b$<cost>$...)"""
+    try:
+        return int(hashed_password.split("$")[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return False
+
+async def _run_bcrypt(op: str, fn, *args):
+    """Run a bcrypt call on the bcrypt pool, recording queue depth and timings"""
+    with _bcrypt_lock:
+        if bcrypt_stats["pending"] >= BCRYPT_MAX_PENDING:
+            bcrypt_stats["rejected"] += 1
+            raise ServiceError(service="Authentication", detail="Too many sign-ins in progress. Please retry in a few seconds.")
+        bcrypt_stats["pending"] += 1
+    queued = time.perf_counter()
+
+    def timed():
+        started = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            with _bcrypt_lock:
+                bcrypt_stats["wait_seconds"] += started - queued
+                bcrypt_stats[op] += 1
+                bcrypt_stats[f"{op}_seconds"] += time.perf_counter() - started
+
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_bcrypt_pool, timed)
+    finally:
+        with _bcrypt_lock:
+            bcrypt_stats["pending"] -= 1
+
+async def hash_password_async(password: str) -> str:
+    """hash_password on the bcrypt pool (use this from request handlers)"""
+    return await _run_bcrypt("hash", hash_password, password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """verify_password on the bcrypt pool (use this from request handlers)"""
+    return await _run_bcrypt("verify", verify_password, plain_password, hashed_password)
+
 def create_access_token(user_id: int) -> str:
     """Create JWT access token"""
     expire = datetime.utcnow() + timedelta(days=ACCESS_TOKEN_EXPIRE_DAYS)
@@ -56,9 +119,13 @@ def create_access_token(user_id: int) -> str:
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 def decode_access_token(token: str) -> Optional[dict]:
-    """Decode and verify JWT token"""
+    """Decode and verify JWT token (verified tokens are memoized until they expire)"""
+    payload = token_cache.get(token)
+    if payload is not None:
+        return payload
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        token_cache.put(token, payload, ttl=payload["exp"] - time.time() if "exp" in payload else None)
         return payload
     except jwt.ExpiredSignatureError:
         return None
@@ -0,0 +1,111 @@
+"""
+Load test for POST /api/chat (or /api/chat/stream) against a running backend.
+
+Air-gapped run with the fake providers:
+
+    EMBEDDING_PROVIDER=fake python ai_engine/scripts/build_index.py   # once
+    cd backend && LLM_PROVIDER=fake EMBEDDING_PROVIDER=fake RATE_LIMIT_ENABLED=false \\
+        uvicorn main:app --port 8000
+    python eval/bench_chat.py --requests 300 --concurrency 32
+
+Each request uses a new session unless --sessions is given, in which case the
+requests are spread over that many multi-turn sessions (turns stay ordered).
+"""
+import argparse
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+
+
+def load_messages(path: Path):
+    with path.open("r", encoding="utf-8") as f:
+        return [json.loads(line)["message"] for line in f if line.strip()]
+
+
+def pct(samples, p):
+    s = sorted(samples)
+    return s[min(len(s) - 1, int(len(s) * p))] if s else 0.0
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--api", default="http://127.0.0.1:8000/api/chat")
+    ap.add_argument("--stream", action="store_true", help="use /api/chat/stream and measure time to first token")
+    ap.add_argument("--requests", type=int, default=200)
+    ap.add_argument("--concurrency", type=int, default=16)
+    ap.add_argument("--sessions", type=int, default=0, help="0 = every request is a new session")
+    ap.add_argument("--infile", default=str(Path(__file__).parent / "testset.jsonl"))
+    ap.add_argument("--timeout", type=float, default=120)
+    args = ap.parse_args()
+
+    url = args.api + ("/stream" if args.stream and not args.api.endswith("/stream") else "")
+    messages = load_messages(Path(args.infile))
+    session_ids = [f"BENCH-{uuid.uuid4().hex[:12]}" for _ in range(args.sessions)]
+    session_locks = [threading.Lock() for _ in session_ids]
+
+    latencies, first_token, statuses, routes = [], [], {}, {}
+    lock = threading.Lock()
+    local = threading.local()
+
+    def one(i):
+        http = getattr(local, "http", None) or requests.Session()
+        local.http = http
+        payload = {"message": messages[i % len(messages)]}
+        slock = None
+        if session_ids:
+            payload["session_id"] = session_ids[i % len(session_ids)]
+            slock = session_locks[i % len(session_ids)]
+
+        if slock:
+            slock.acquire()
+        t0 = time.perf_counter()
+        ttft = None
+        route = None
+        try:
+            r = http.post(url, json=payload, timeout=args.timeout, stream=args.stream)
+            status = r.status_code
+            if args.stream and status == 200:
+                for line in r.iter_lines(decode_unicode=True):
+                    if line.startswith("event: token") and ttft is None:
+                        ttft = time.perf_counter() - t0
+                    elif line.startswith("data:") and '"route"' in line and route is None:
+                        route = json.loads(line[5:]).get("route")
+            elif status == 200:
+                route = r.json().get("route")
+        except Exception as e:
+            status = type(e).__name__
+        finally:
+            if slock:
+                slock.release()
+        elapsed = time.perf_counter() - t0
+
+        with lock:
+            statuses[status] = statuses.get(status, 0) + 1
+            if status == 200:
+                latencies.append(elapsed)
+                routes[route] = routes.get(route, 0) + 1
+                if ttft is not None:
+                    first_token.append(ttft)
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(one, range(args.requests)))
+    wall = time.perf_counter() - t0
+
+    ok = len(latencies)
+    print(f"\n{url}: {args.requests} requests, concurrency {args.concurrency}, sessions {args.sessions or 'new each'}")
+    print(f"  status: {statuses}")
+    print(f"  routes: {routes}")
+    print(f"  wall {wall:.2f}s  throughput {ok / wall:.1f} ok req/s")
+    print(f"  latency p50 {pct(latencies, 0.5) * 1000:.0f}ms  p95 {pct(latencies, 0.95) * 1000:.0f}ms  p99 {pct(latencies, 0.99) * 1000:.0f}ms")
+    if first_token:
+        print(f"  first token p50 {pct(first_token, 0.5) * 1000:.0f}ms  p95 {pct(first_token, 0.95) * 1000:.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
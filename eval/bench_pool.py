@@ -0,0 +1,140 @@
+"""
+Find where the DB connection pool saturates under concurrent /api/chat load.
+
+Runs /api/chat at increasing concurrency against a running backend and, per
+step, reads the pool metrics from /metrics: connections checked out (sampled
+while the step runs), overflow, checkout wait time and pool timeouts.
+
+    cd backend && LLM_PROVIDER=fake EMBEDDING_PROVIDER=fake RATE_LIMIT_ENABLED=false \\
+        DB_POOL_SIZE=5 DB_MAX_OVERFLOW=0 uvicorn main:app --port 8000
+    python eval/bench_pool.py --steps 4,8,16,32,64 --requests 200
+
+The pool is saturated from the first step whose checkouts queue (wait p95 well
+above a round trip, checked_out pinned at size + overflow) or time out.
+"""
+import argparse
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+
+from bench_chat import load_messages, pct
+
+SAMPLE = re.compile(r'^(\w+)\{([^}]*)\} (\S+)$')
+
+
+def scrape(base: str, engine: str):
+    """{metric name (+ le for buckets): value} for one engine label"""
+    out = {}
+    for line in requests.get(base + "/metrics", timeout=10).text.splitlines():
+        m = SAMPLE.match(line)
+        if not m or f'engine="{engine}"' not in m.group(2):
+            continue
+        name, labels, value = m.groups()
+        le = re.search(r'le="([^"]+)"', labels)
+        out[name + (f"@{le.group(1)}" if le else "")] = float(value)
+    return out
+
+
+def wait_quantile(before, after, q):
+    """Quantile of db_pool_wait_seconds observed between two scrapes (bucket upper bound)"""
+    buckets = sorted(
+        (float("inf") if k.split("@")[1] == "+Inf" else float(k.split("@")[1]), after[k] - before.get(k, 0))
+        for k in after if k.startswith("db_pool_wait_seconds_bucket@")
+    )
+    total = buckets[-1][1] if buckets else 0
+    for le, count in buckets:
+        if total and count >= q * total:
+            return le
+    return 0.0
+
+
+def run_step(url, messages, n, concurrency, sessions, timeout):
+    session_ids = [f"POOL-{uuid.uuid4().hex[:12]}" for _ in range(sessions)]
+    session_locks = [threading.Lock() for _ in session_ids]
+    latencies, statuses = [], {}
+    lock = threading.Lock()
+    local = threading.local()
+
+    def one(i):
+        http = getattr(local, "http", None) or requests.Session()
+        local.http = http
+        with session_locks[i % sessions]:
+            t0 = time.perf_counter()
+            try:
+                status = http.post(url, json={"message": messages[i % len(messages)], "session_id": session_ids[i % sessions]}, timeout=timeout).status_code
+            except Exception as e:
+                status = type(e).__name__
+            elapsed = time.perf_counter() - t0
+        with lock:
+            statuses[status] = statuses.get(status, 0) + 1
+            if status == 200:
+                latencies.append(elapsed)
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(n)))
+    return time.perf_counter() - t0, latencies, statuses
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--base", default="http://127.0.0.1:8000")
+    ap.add_argument("--steps", default="4,8,16,32,64", help="comma-separated concurrency levels")
+    ap.add_argument("--requests", type=int, default=200, help="requests per step")
+    ap.add_argument("--engine", default="async", help="pool label in /metrics (async = the API routes)")
+    ap.add_argument("--infile", default=str(Path(__file__).parent / "testset.jsonl"))
+    ap.add_argument("--timeout", type=float, default=120)
+    args = ap.parse_args()
+
+    messages = load_messages(Path(args.infile))
+    url = args.base + "/api/chat"
+    first = scrape(args.base, args.engine)
+    size = int(first.get("db_pool_size", 0))
+    print(f"{url}: pool size {size} (engine={args.engine}), {args.requests} requests per step\n")
+    print(f"{'conc':>5} {'req/s':>7} {'p50 ms':>7} {'p95 ms':>7} {'out max':>8} {'overflow':>9} {'wait avg':>9} {'wait p95':>9} {'timeouts':>9}  status")
+
+    saturated = None
+    for concurrency in [int(c) for c in args.steps.split(",")]:
+        peak = {"out": 0, "overflow": 0}
+        done = threading.Event()
+
+        def sample():
+            while not done.wait(0.05):
+                now = scrape(args.base, args.engine)
+                peak["out"] = max(peak["out"], now.get("db_pool_checked_out", 0))
+                peak["overflow"] = max(peak["overflow"], now.get("db_pool_overflow", 0))
+
+        before = scrape(args.base, args.engine)
+        sampler = threading.Thread(target=sample, daemon=True)
+        sampler.start()
+        wall, latencies, statuses = run_step(url, messages, args.requests, concurrency, max(concurrency, 1), args.timeout)
+        done.set()
+        sampler.join()
+        after = scrape(args.base, args.engine)
+
+        waits = after.get("db_pool_wait_seconds_count", 0) - before.get("db_pool_wait_seconds_count", 0)
+        wait_sum = after.get("db_pool_wait_seconds_sum", 0) - before.get("db_pool_wait_seconds_sum", 0)
+        timeouts = after.get("db_pool_timeouts_total", 0) - before.get("db_pool_timeouts_total", 0)
+        wait_p95 = wait_quantile(before, after, 0.95)
+        p95_text = f"{wait_p95 * 1000:>7.1f}ms" if wait_p95 != float("inf") else "  >1000ms"
+        print(
+            f"{concurrency:>5} {len(latencies) / wall:>7.1f} {pct(latencies, 0.5) * 1000:>7.0f} {pct(latencies, 0.95) * 1000:>7.0f} "
+            f"{peak['out']:>8.0f} {peak['overflow']:>9.0f} {wait_sum / max(waits, 1) * 1000:>7.1f}ms {p95_text} {timeouts:>9.0f}  {statuses}"
+        )
+        if saturated is None and (timeouts or (size and peak["out"] >= size + peak["overflow"] and wait_p95 >= 0.01)):
+            saturated = concurrency
+
+    print()
+    if saturated:
+        print(f"pool saturates at concurrency ~{saturated}: checkouts queue for a connection (raise DB_POOL_SIZE/DB_MAX_OVERFLOW or add workers)")
+    else:
+        print("pool never saturated in these steps")
+
+
+if __name__ == "__main__":
+    main()
@@ -24,6 +24,24 @@ def contains_all(haystack: str, needles):
     return True
 
 
+def fetch_batch(api: str, tests, timeout: float = 600):
+    """All questions in one POST /api/chat/batch; NDJSON lines come back in completion order"""
+    url = api.rstrip("/") + "/batch"
+    payload = {"questions": [{"id": str(t["id"]), "message": t["message"]} for t in tests]}
+    out = [{"error": "no result"} for _ in tests]
+    with requests.post(url, json=payload, timeout=timeout, stream=True) as r:
+        r.raise_for_status()
+        for line in r.iter_lines(decode_unicode=True):
+            if not line:
+                continue
+            row = json.loads(line)
+            if "index" in row:
+                out[row["index"]] = row
+            elif "error" in row:
+                raise RuntimeError(row.get("message") or row["error"])
+    return out
+
+
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--api", default="http://127.0.0.1:8000/api/chat")
@@ -31,6 +49,7 @@ def main():
     ap.add_argument("--infile", default=str(Path(__file__).parent / "testset.jsonl"))
     ap.add_argument("--outdir", default=str(Path(__file__).parent / "out"))
     ap.add_argument("--sleep", type=float, default=0.2)
+    ap.add_argument("--batch", action="store_true", help="send every question in one /api/chat/batch request")
     args = ap.parse_args()
 
     infile = Path(args.infile)
@@ -45,16 +64,26 @@ def main():
     refusal_ok = 0
     contains_ok = 0
 
-    for i, t in enumerate(tests, start=1):
-        session_id = f"{args.session_prefix}-{t['id']}"
-        payload = {"session_id": session_id, "message": t["message"]}
-
+    batched = None
+    if args.batch:
         try:
-            r = requests.post(args.api, json=payload, timeout=120)
-            r.raise_for_status()
-            data = r.json()
+            batched = fetch_batch(args.api, tests)
         except Exception as e:
-            data = {"error": str(e)}
+            batched = [{"error": str(e)} for _ in tests]
+
+    for i, t in enumerate(tests, start=1):
+        if batched is not None:
+            data = batched[i - 1]
+        else:
+            session_id = f"{args.session_prefix}-{t['id']}"
+            payload = {"session_id": session_id, "message": t["message"]}
+
+            try:
+                r = requests.post(args.api, json=payload, timeout=120)
+                r.raise_for_status()
+                data = r.json()
+            except Exception as e:
+                data = {"error": str(e)}
 
         # basic checks
         got_route = data.get("route")
@@ -101,7 +130,8 @@ def main():
             f"(exp {exp_route}) cites={len(got_citations) if isinstance(got_citations, list) else 'NA'} "
             f"(exp {exp_cites}) refusal={got_refusal} (exp {exp_refusal})"
         )
-        time.sleep(args.sleep)
+        if batched is None:
+            time.sleep(args.sleep)
 
     # write results
     out_json = outdir / "results.json"
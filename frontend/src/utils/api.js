@@ -166,9 +166,14 @@ export const chatAPI = {
     }, false); // Don't require auth for chat
   },
 
-  // Get chat history for a session
-  getHistory: async (sessionId) => {
-    return fetchAPI(`/history/${sessionId}`);
+  // Get chat history for a session: the latest messages, or the page before beforeId
+  // (response.has_more / response.next_before_id point to the next older page)
+  getHistory: async (sessionId, { limit, beforeId } = {}) => {
+    const params = new URLSearchParams();
+    if (limit) params.set('limit', limit);
+    if (beforeId) params.set('before_id', beforeId);
+    const query = params.toString();
+    return fetchAPI(`/history/${sessionId}${query ? `?${query}` : ''}`);
   },
 
   // Create new session - works anonymously or authenticated